@@ -5,22 +5,121 @@
 提供IR-Tree SVG生成接口
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import sys
+import threading
+import time
+from datetime import datetime
 from gen_IR_Tree_svg import IRTreeSVGGenerator
 from gen_IR_OBIR_relation_svg import IR_OBIR_RelationSVGGenerator
-from gen_IR_logic_path_svg import generate_svg as generate_logic_path_svg
+from gen_IR_logic_path_svg import generate_svg_from_file as generate_logic_path_svg_from_file
+from gen_IR_logic_path_svg import iter_svg_from_file as iter_logic_path_svg_from_file
 from gen_OBIR_Tree_realtime_svg import OBIRTreeRealtimeSVGGenerator
+from tree_lod import DEFAULT_LEVELS
+from spatial_keyword_engine import SpatialKeywordEngine
+from render_cache import render_cache
+from render_executor import render_executor
+from svg_writer import iter_chunks
+from realtime_push import get_watcher
+from point_tiles import get_point_index, parse_bbox
+from point_store import STORE_SUFFIX, load_points
+from density_heatmap import MAX_ZOOM as HEATMAP_MAX_ZOOM, PYRAMID_ZOOM, TILE_SIZE, get_heatmap, tile_bytes, tile_png
+from record_index import load_record_index
+from index_ipc import IndexClient, IndexIPCError
+from http_cache import data_etag, is_fresh, not_modified, with_etag
+from snapshot_store import HISTORY_SIZE, SnapshotStore
+from path_analytics import analyze as analyze_paths, decode_request as decode_path_request
+from tree_schema import decode_tree, to_builtins
+import http_cache
+import metrics
+from gen_country_count import update_country_count
 
 app = Flask(__name__)
-CORS(app)
+# 跨域时前端需要读取ETag才能发送 If-None-Match
+CORS(app, expose_headers=['ETag'])
+metrics.init_app(app)
+http_cache.init_app(app)
 
 # 数据目录
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 
+# 空间文本记录文件（id name lat lng 或 name lng lat），可通过环境变量覆盖
+RECORDS_FILE = os.environ.get(
+    'OBIR_RECORDS_FILE',
+    os.path.join(os.path.dirname(__file__), '../public/mock/10.txt')
+)
+
+def build_query_engine():
+    """启动时构建一次IR-Tree索引，失败时返回None"""
+    try:
+        return SpatialKeywordEngine.from_records(load_points(RECORDS_FILE).iter_records())
+    except Exception as e:
+        print(f'构建查询索引失败: {e}', file=sys.stderr)
+        return None
+
+# 以 `python app.py` 启动时，渲染进程（spawn方式）会以 __mp_main__ 重新导入本模块，不需要查询索引
+query_engine = build_query_engine() if __name__ != '__mp_main__' else None
+
+# 外部索引进程（C++ OBIR-Tree）的Unix套接字；设置后查询经IPC同步转发，不再写 search_query.json
+INDEX_SOCKET = os.environ.get('OBIR_INDEX_SOCKET')
+index_client = IndexClient(INDEX_SOCKET, timeout=float(os.environ.get('OBIR_INDEX_TIMEOUT', 2.0))) if INDEX_SOCKET else None
+
+# OBIR-Tree快照历史：记录 obir_tree_current.json 的各个版本，可取回任意版本或比较任意两个版本
+HISTORY_SOURCE_FILE = 'obir_tree_current.json'
+HISTORY_DIR = os.environ.get('OBIR_HISTORY_DIR', os.path.join(DATA_DIR, 'obir_history'))
+history_store = SnapshotStore(HISTORY_DIR, capacity=int(os.environ.get('OBIR_HISTORY_SIZE', HISTORY_SIZE)))
+
+def record_history(current_path):
+    """当前快照文件变化时写入快照历史（只记录默认的当前快照文件），失败不影响实时展示"""
+    if os.path.abspath(current_path) != os.path.abspath(os.path.join(DATA_DIR, HISTORY_SOURCE_FILE)):
+        return
+    try:
+        history_store.ingest_file(current_path)
+    except Exception as e:
+        print(f'写入快照历史失败: {e}', file=sys.stderr)
+
+# 各国家/地区记录数统计结果（由 gen_country_count.py 增量生成）
+COUNTRY_COUNT_FILE = os.path.join(os.path.dirname(__file__), '../public/mock/country_count.json')
+country_count_lock = threading.Lock()
+
+def render_cache_metrics():
+    """抓取 /api/metrics 时读取渲染缓存统计"""
+    stats = render_cache.stats()
+    return [
+        ('obir_render_cache_entries', 'gauge', '渲染缓存条目数', [({}, stats['entries'])]),
+        ('obir_render_cache_bytes', 'gauge', '渲染缓存估计占用字节数', [({}, stats['bytes'])]),
+        ('obir_render_cache_hits_total', 'counter', '渲染缓存命中次数', [({}, stats['hits'])]),
+        ('obir_render_cache_misses_total', 'counter', '渲染缓存未命中次数', [({}, stats['misses'])]),
+        ('obir_render_cache_evictions_total', 'counter', '渲染缓存淘汰次数', [({}, stats['evictions'])]),
+    ]
+
+def render_executor_metrics():
+    """抓取 /api/metrics 时读取渲染执行器统计"""
+    stats = render_executor.stats()
+    return [
+        ('obir_render_executor_pending', 'gauge', '交给渲染进程尚未完成的任务数', [({}, stats['pending'])]),
+        ('obir_render_executor_executed_total', 'counter', '实际执行的渲染次数', [({}, stats['executed'])]),
+        ('obir_render_executor_coalesced_total', 'counter', '合并到进行中渲染的请求数', [({}, stats['coalesced'])]),
+        ('obir_render_executor_rejected_total', 'counter', '渲染队列已满被拒绝的请求数', [({}, stats['rejected'])]),
+        ('obir_render_executor_failed_total', 'counter', '渲染失败次数', [({}, stats['failed'])]),
+    ]
+
+metrics.registry.add_collector(render_cache_metrics)
+metrics.registry.add_collector(render_executor_metrics)
+metrics.registry.add_collector(http_cache.compressed_cache_metrics)
+
+def api_error(message):
+    """业务错误响应（HTTP 200，success为false），同时计入错误指标"""
+    g.api_error = True
+    return jsonify({'success': False, 'error': message})
+
+def svg_stream_response(chunks):
+    """以分块传输的 image/svg+xml 响应直接返回SVG，而不是包在JSON里"""
+    return Response(stream_with_context(iter_chunks(chunks)), mimetype='image/svg+xml')
+
 @app.route('/api/ir-tree-svg', methods=['POST'])
 def ir_tree_svg():
     """生成IR-Tree SVG"""
@@ -30,15 +129,27 @@ def ir_tree_svg():
         file_path = os.path.join(DATA_DIR, data_file)
         
         if not os.path.exists(file_path):
-            return jsonify({'success': False, 'error': f'数据文件不存在: {data_file}'})
+            return api_error(f'数据文件不存在: {data_file}')
+        
+        # 数据文件和请求参数都未变化时返回304，不读取文件也不渲染
+        etag = data_etag(request.path, [file_path], data)
+        if is_fresh(etag):
+            return not_modified(etag)
         
-        # 生成SVG
+        # 生成SVG，stream为真时以流式SVG响应返回；给出levels时只绘制前levels层，更深的子树折叠
         generator = IRTreeSVGGenerator()
+        if data.get('levels') is not None:
+            svg_content = generator.generate_lod_from_file(file_path, int(data['levels']))
+            if data.get('stream'):
+                return with_etag(svg_stream_response(iter((svg_content,))), etag)
+            return with_etag(jsonify({'success': True, 'svg': svg_content}), etag)
+        if data.get('stream'):
+            return with_etag(svg_stream_response(generator.iter_from_file(file_path)), etag)
         svg_content = generator.generate_from_file(file_path)
         
-        return jsonify({'success': True, 'svg': svg_content})
+        return with_etag(jsonify({'success': True, 'svg': svg_content}), etag)
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return api_error(str(e))
 
 @app.route('/api/ir-obir-relation-svg', methods=['POST'])
 def ir_obir_relation_svg():
@@ -52,22 +163,28 @@ def ir_obir_relation_svg():
         annotation_path = os.path.join(DATA_DIR, annotation_file)
         
         if not os.path.exists(mapping_path):
-            return jsonify({'success': False, 'error': f'映射文件不存在: {mapping_file}'})
+            return api_error(f'映射文件不存在: {mapping_file}')
         
         if not os.path.exists(annotation_path):
-            return jsonify({'success': False, 'error': f'标注文件不存在: {annotation_file}'})
+            return api_error(f'标注文件不存在: {annotation_file}')
         
-        # 生成SVG和标注
+        etag = data_etag(request.path, [mapping_path, annotation_path], data)
+        if is_fresh(etag):
+            return not_modified(etag)
+        
+        # 生成SVG和标注，stream为真时只以流式SVG响应返回SVG
         generator = IR_OBIR_RelationSVGGenerator()
+        if data.get('stream'):
+            return with_etag(svg_stream_response(generator.iter_svg_from_files(mapping_path, annotation_path)), etag)
         result = generator.generate_from_files(mapping_path, annotation_path)
         
-        return jsonify({
+        return with_etag(jsonify({
             'success': True, 
             'svg': result['svg'],
             'annotations': result['annotations']
-        })
+        }), etag)
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return api_error(str(e))
 
 @app.route('/api/ir-logic-path-svg', methods=['POST'])
 def ir_logic_path_svg():
@@ -78,21 +195,20 @@ def ir_logic_path_svg():
         file_path = os.path.join(DATA_DIR, data_file)
         
         if not os.path.exists(file_path):
-            return jsonify({'success': False, 'error': f'数据文件不存在: {data_file}'})
-        
-        # 加载数据
-        with open(file_path, 'r', encoding='utf-8') as f:
-            tree_data = json.load(f)
+            return api_error(f'数据文件不存在: {data_file}')
         
-        # 获取逻辑路径
-        logic_path = tree_data.get('logic_path', [])
+        etag = data_etag(request.path, [file_path], data)
+        if is_fresh(etag):
+            return not_modified(etag)
         
-        # 生成SVG
-        svg_content = generate_logic_path_svg(tree_data, logic_path)
+        # 生成SVG，stream为真时以流式SVG响应返回
+        if data.get('stream'):
+            return with_etag(svg_stream_response(iter_logic_path_svg_from_file(file_path)), etag)
+        svg_content = generate_logic_path_svg_from_file(file_path)
         
-        return jsonify({'success': True, 'svg': svg_content})
+        return with_etag(jsonify({'success': True, 'svg': svg_content}), etag)
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return api_error(str(e))
 
 @app.route('/api/query-results', methods=['POST'])
 def query_results():
@@ -101,77 +217,179 @@ def query_results():
         data = request.get_json()
         query = data.get('query', 'OBIR-Tree查询')
         top_k = data.get('topK', 5)
+        # 近似匹配的最大编辑距离，仅进程内检索支持
+        fuzzy = int(data.get('fuzzy') or 0)
         
-        # 模拟从C++后端获取的查询结果
-        # 这里应该调用C++代码获取真实的查询结果
-        mock_results = [
-            {
-                "title": "北京大学本部（燕园校区）",
-                "description": "位于北京市海淀区颐和园路5号，是北京大学的主校区，环境优美，拥有未名湖、博雅塔等著名景观，包含文理学院、工学院等多个院系。",
-                "relevance": 95,
-                "location": "北京市海淀区颐和园路5号",
-                "distance": 0.2,
-                "type": "教育机构"
-            },
-            {
-                "title": "北京大学医学部",
-                "description": "位于北京市海淀区学院路38号，是北京大学的医学教育中心，拥有多个附属医院和医学研究机构，在医学教育领域享有盛誉。",
-                "relevance": 92,
-                "location": "北京市海淀区学院路38号",
-                "distance": 1.5,
-                "type": "教育机构"
-            },
-            {
-                "title": "北京大学昌平校区",
-                "description": "位于北京市昌平区沙河高教园区，是北京大学的新校区，主要承担部分本科教育和科研工作，设施现代化，环境优美。",
-                "relevance": 88,
-                "location": "北京市昌平区沙河高教园区",
-                "distance": 25.0,
-                "type": "教育机构"
-            },
-            {
-                "title": "北京大学深圳研究生院",
-                "description": "位于深圳市南山区深圳湾，是北京大学在深圳设立的研究生教育机构，专注于前沿科技研究和高端人才培养。",
-                "relevance": 85,
-                "location": "深圳市南山区深圳湾",
-                "distance": 2000.0,
-                "type": "教育机构"
-            },
-            {
-                "title": "北京大学图书馆",
-                "description": "位于燕园校区内，是北京大学的主要图书馆，藏书丰富，为师生提供良好的学习环境，是亚洲最大的大学图书馆之一。",
-                "relevance": 82,
-                "location": "北京市海淀区颐和园路5号",
-                "distance": 0.1,
-                "type": "图书馆"
-            }
-        ]
-        
-        # 限制返回结果数量
-        results = mock_results[:top_k]
-        
-        # 保存搜索参数到search_query.json，供C++后端读取
-        try:
-            search_query_path = os.path.join(DATA_DIR, 'search_query.json')
-            with open(search_query_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'query': query,
-                    'lng': data.get('lng'),
-                    'lat': data.get('lat'),
-                    'topK': top_k
-                }, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f'写入search_query.json失败: {e}', file=sys.stderr)
+        if query_engine is None and index_client is None:
+            return api_error(f'查询索引不可用: {RECORDS_FILE}')
+
+        # 未给出坐标时以数据集中心为查询点
+        center_lng, center_lat = query_engine.center if query_engine else (0.0, 0.0)
+        lng = data.get('lng')
+        lat = data.get('lat')
+        lng = float(lng) if lng not in (None, '') else center_lng
+        lat = float(lat) if lat not in (None, '') else center_lat
+
+        source = 'local'
+        if index_client is not None:
+            try:
+                results = index_client.query(query, lng, lat, int(top_k))
+                source = 'index'
+            except IndexIPCError as e:
+                # 索引进程不可用时退回进程内检索（没有ORAM路径）
+                print(f'索引进程查询失败: {e}', file=sys.stderr)
+                if query_engine is None:
+                    return api_error(f'索引进程查询失败: {e}')
+                results = query_engine.search(query, lng, lat, int(top_k), fuzzy)
+        else:
+            results = query_engine.search(query, lng, lat, int(top_k), fuzzy)
+
+            # 未配置IPC时保持原有的文件交接：保存搜索参数到search_query.json，供C++后端读取
+            try:
+                search_query_path = os.path.join(DATA_DIR, 'search_query.json')
+                with open(search_query_path, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'query': query,
+                        'lng': data.get('lng'),
+                        'lat': data.get('lat'),
+                        'topK': top_k
+                    }, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                print(f'写入search_query.json失败: {e}', file=sys.stderr)
 
         return jsonify({
             'success': True,
             'results': results,
             'query': query,
+            'source': source,
             'total': len(results),
-            'timestamp': '2024-01-15 14:30:25'
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+# 批量查询单次请求允许的最大查询数
+MAX_BATCH_QUERIES = 10000
+
+@app.route('/api/query-results/batch', methods=['POST'])
+def query_results_batch():
+    """
+    批量Top-K查询：queries 为 {query|keyword, lng|x, lat|y, topK|k} 列表，
+    按输入顺序返回每条查询的结果列表；fuzzy 为所有查询共用的近似匹配编辑距离。不写 search_query.json
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('queries')
+        if not isinstance(items, list):
+            return api_error('queries 必须是查询列表')
+        if len(items) > MAX_BATCH_QUERIES:
+            return api_error(f'单次最多 {MAX_BATCH_QUERIES} 条查询，实际 {len(items)} 条')
+        if query_engine is None:
+            return api_error(f'查询索引不可用: {RECORDS_FILE}')
+
+        center_lng, center_lat = query_engine.center
+        default_k = data.get('topK', 5)
+        try:
+            fuzzy = int(data.get('fuzzy') or 0)
+        except (TypeError, ValueError) as e:
+            return api_error(f'fuzzy 参数无效: {e}')
+        queries = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                return api_error(f'第 {index} 条查询不是对象')
+            try:
+                keyword = str(item.get('query', item.get('keyword', '')))
+                lng = item.get('lng', item.get('x'))
+                lat = item.get('lat', item.get('y'))
+                lng = float(lng) if lng not in (None, '') else center_lng
+                lat = float(lat) if lat not in (None, '') else center_lat
+                top_k = int(item.get('topK', item.get('k', default_k)))
+            except (TypeError, ValueError) as e:
+                return api_error(f'第 {index} 条查询参数无效: {e}')
+            queries.append((keyword, lng, lat, top_k))
+
+        results = query_engine.search_batch(queries, fuzzy)
+        return jsonify({
+            'success': True,
+            'results': results,
+            'total': len(results),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+# 按id批量取记录时单次请求允许的最大id数
+MAX_LOOKUP_IDS = 10000
+
+@app.route('/api/records/lookup', methods=['POST'])
+def records_lookup():
+    """
+    按 rect_id 批量读取完整记录：ids 为id列表，返回与输入顺序对应的记录，不存在的id为null；
+    通过记录文件旁的id索引（record_index.py）只读取对应的行
+    """
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids')
+        if not isinstance(ids, list):
+            return api_error('ids 必须是id列表')
+        if len(ids) > MAX_LOOKUP_IDS:
+            return api_error(f'单次最多 {MAX_LOOKUP_IDS} 个id，实际 {len(ids)} 个')
+        if RECORDS_FILE.endswith(STORE_SUFFIX):
+            return api_error(f'记录文件为列式二进制文件，不支持按id读取: {RECORDS_FILE}')
+        try:
+            ids = [int(rect_id) for rect_id in ids]
+        except (TypeError, ValueError) as e:
+            return api_error(f'id无效: {e}')
+
+        records = [
+            None if record is None else {
+                'rect_id': record[0],
+                'keyword': record[1],
+                'center_x': record[2],
+                'center_y': record[3]
+            }
+            for record in load_record_index(RECORDS_FILE).lookup(ids)
+        ]
+        return jsonify({
+            'success': True,
+            'records': records,
+            'found': sum(record is not None for record in records)
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/keywords/similar', methods=['GET'])
+def similar_keywords():
+    """词表中与 term 编辑距离不超过 distance（默认1）的关键词，按距离升序，最多 limit 个"""
+    try:
+        if query_engine is None:
+            return api_error(f'查询索引不可用: {RECORDS_FILE}')
+        term = request.args.get('term', '').strip()
+        if not term:
+            return api_error('缺少 term 参数')
+        distance = request.args.get('distance', 1, type=int)
+        limit = request.args.get('limit', 100, type=int)
+        matches = query_engine.similar_terms(term, distance)
+        return jsonify({
+            'success': True,
+            'term': term,
+            'total': len(matches),
+            'terms': [{'term': t, 'distance': d} for t, d in matches[:limit]]
         })
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return api_error(str(e))
+
+@app.route('/api/path-analytics', methods=['POST'])
+def path_analytics():
+    """
+    两轮查询的ORAM路径对比：firstRound/secondRound 为按下标对应的 orampath 列表，
+    返回相同/不同路径数、每条查询的差异位置和各层的访问分布
+    """
+    try:
+        req = decode_path_request(request.get_data())
+        return jsonify({'success': True, **analyze_paths(req)})
+    except Exception as e:
+        return api_error(str(e))
 
 @app.route('/api/obir-tree-realtime', methods=['POST'])
 def obir_tree_realtime():
@@ -185,33 +403,306 @@ def obir_tree_realtime():
         previous_path = os.path.join(DATA_DIR, previous_file) if previous_file else None
         
         if not os.path.exists(current_path):
-            return jsonify({'success': False, 'error': f'当前数据文件不存在: {current_file}'})
+            return api_error(f'当前数据文件不存在: {current_file}')
+        
+        record_history(current_path)
+        etag = data_etag(request.path, [current_path, previous_path], data)
+        if is_fresh(etag):
+            return not_modified(etag)
         
+        # 给出levels时只绘制前levels层，更深的子树折叠为占位节点
+        levels = data.get('levels')
         generator = OBIRTreeRealtimeSVGGenerator()
-        result = generator.generate_from_files(current_path, previous_path)
+        result = generator.generate_from_files(current_path, previous_path,
+                                               int(levels) if levels is not None else None)
         
         if result['success']:
-            return jsonify({
+            return with_etag(jsonify({
                 'success': True,
                 'svg': result['svg'],
                 'differences': result['differences'],
                 'current_nodes': result['current_nodes'],
                 'previous_nodes': result['previous_nodes']
-            })
+            }), etag)
         else:
-            return jsonify({'success': False, 'error': result['error']})
+            return api_error(result['error'])
             
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return api_error(str(e))
+
+@app.route('/api/tree-subtree', methods=['POST'])
+def tree_subtree():
+    """
+    分层细节模式下展开折叠的子树：返回以nodeId为根、前levels层的SVG
+    tree 为 ir（IR-Tree数据文件）或 obir（OBIR-Tree快照，按前一时刻快照标注差异）
+    """
+    try:
+        data = request.get_json() or {}
+        node_id = data.get('nodeId')
+        if node_id is None:
+            return api_error('缺少nodeId')
+        levels = int(data.get('levels', DEFAULT_LEVELS))
+        tree = data.get('tree', 'ir')
+
+        if tree == 'ir':
+            data_file = data.get('dataFile', 'ir_tree_data.json')
+            file_path = os.path.join(DATA_DIR, data_file)
+            if not os.path.exists(file_path):
+                return api_error(f'数据文件不存在: {data_file}')
+            etag = data_etag(request.path, [file_path], data)
+            if is_fresh(etag):
+                return not_modified(etag)
+            svg_content = IRTreeSVGGenerator().generate_lod_from_file(file_path, levels, node_id)
+            return with_etag(jsonify({'success': True, 'svg': svg_content, 'nodeId': node_id}), etag)
+
+        if tree == 'obir':
+            current_file = data.get('currentFile', 'obir_tree_current.json')
+            previous_file = data.get('previousFile', 'obir_tree_previous.json')
+            current_path = os.path.join(DATA_DIR, current_file)
+            previous_path = os.path.join(DATA_DIR, previous_file) if previous_file else None
+            if not os.path.exists(current_path):
+                return api_error(f'当前数据文件不存在: {current_file}')
+            etag = data_etag(request.path, [current_path, previous_path], data)
+            if is_fresh(etag):
+                return not_modified(etag)
+            result = OBIRTreeRealtimeSVGGenerator().generate_from_files(current_path, previous_path, levels, node_id)
+            if not result['success']:
+                return api_error(result['error'])
+            return with_etag(jsonify({'success': True, 'svg': result['svg'], 'nodeId': node_id}), etag)
+
+        return api_error(f'未知的树类型: {tree}')
+    except KeyError as e:
+        return api_error(e.args[0])
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/obir-tree-realtime/stream', methods=['GET'])
+def obir_tree_realtime_stream():
+    """OBIR-Tree实时路径推送（Server-Sent Events），快照文件变化时才推送新结果"""
+    current_file = request.args.get('currentFile', 'obir_tree_current.json')
+    previous_file = request.args.get('previousFile', 'obir_tree_previous.json')
+    
+    current_path = os.path.join(DATA_DIR, current_file)
+    previous_path = os.path.join(DATA_DIR, previous_file) if previous_file else None
+    
+    if not os.path.exists(current_path):
+        return api_error(f'当前数据文件不存在: {current_file}')
+    
+    watcher = get_watcher(current_path, previous_path, on_change=record_history)
+    return Response(
+        stream_with_context(watcher.events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/obir-history', methods=['GET'])
+def obir_history():
+    """快照历史中保留的各版本（先把当前快照文件的最新状态入库）"""
+    try:
+        record_history(os.path.join(DATA_DIR, HISTORY_SOURCE_FILE))
+        versions = history_store.versions()
+        return jsonify({
+            'success': True,
+            'versions': versions,
+            'latest': versions[-1]['version'] if versions else None
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/obir-history/snapshots', methods=['POST'])
+def obir_history_ingest():
+    """直接提交一个快照（请求体格式同 obir_tree_current.json），返回其版本号；与最新版本相同时不新增"""
+    try:
+        version = history_store.ingest(decode_tree(request.get_data(), '请求体'))
+        return jsonify({'success': True, 'version': version})
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/obir-history/<int:version>', methods=['GET'])
+def obir_history_version(version):
+    """取回某个版本的完整快照；版本内容不会变化，ETag即快照摘要"""
+    try:
+        header = history_store.header(version)
+        if is_fresh(header.digest):
+            return not_modified(header.digest)
+        snapshot = history_store.get(version)
+        return with_etag(jsonify({
+            'success': True,
+            'version': version,
+            'timestamp': header.timestamp,
+            'snapshot': to_builtins(snapshot)
+        }), header.digest)
+    except KeyError as e:
+        return api_error(e.args[0])
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/obir-history/diff', methods=['POST'])
+def obir_history_diff():
+    """
+    比较快照历史中的任意两个版本：from 为旧版本（省略时只绘制to），to 为新版本（默认最新），
+    返回与 /api/obir-tree-realtime 相同格式的SVG和差异；levels、nodeId 同分层细节模式
+    """
+    try:
+        data = request.get_json() or {}
+        record_history(os.path.join(DATA_DIR, HISTORY_SOURCE_FILE))
+        to_version = data.get('to', history_store.latest())
+        if to_version is None:
+            return api_error('快照历史为空')
+        from_version = data.get('from')
+        to_header = history_store.header(int(to_version))
+        from_header = history_store.header(int(from_version)) if from_version is not None else None
+        
+        # 版本内容不会变化，以两个版本的摘要作为ETag和渲染缓存的依据
+        version_key = (to_header.digest, from_header.digest if from_header else None)
+        etag = data_etag(request.path, [], {**data, 'versions': version_key})
+        if is_fresh(etag):
+            return not_modified(etag)
+        
+        levels = data.get('levels')
+        result = OBIRTreeRealtimeSVGGenerator().generate_from_snapshots(
+            history_store.get(to_header.version),
+            history_store.get(from_header.version) if from_header else None,
+            version_key, int(levels) if levels is not None else None, data.get('nodeId'))
+        if not result['success']:
+            return api_error(result['error'])
+        return with_etag(jsonify({
+            'success': True,
+            'from': from_header.version if from_header else None,
+            'to': to_header.version,
+            'svg': result['svg'],
+            'differences': result['differences'],
+            'current_nodes': result['current_nodes'],
+            'previous_nodes': result['previous_nodes']
+        }), etag)
+    except KeyError as e:
+        return api_error(e.args[0])
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/points', methods=['GET'])
+def points_in_view():
+    """按视野和缩放级别返回地图点：点数多时返回网格聚类，放大到一定程度后返回原始点"""
+    try:
+        index = get_point_index(RECORDS_FILE)
+        bbox = parse_bbox(request.args.get('bbox'))
+        if bbox is None:
+            # 未给出视野时返回整个数据集范围，供前端首次定位
+            return jsonify({'success': True, 'extent': index.extent, 'total': len(index)})
+        zoom = request.args.get('zoom', 0, type=int)
+        result = index.query(bbox, zoom)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/heatmap', methods=['GET'])
+def heatmap_info():
+    """密度热力图的元数据：点数、瓦片大小、缩放级别范围和预先计算的各级单个格子的最大点数"""
+    try:
+        pyramid = get_heatmap(RECORDS_FILE)
+        return jsonify({
+            'success': True,
+            'total': pyramid.rows,
+            'version': pyramid.version,
+            'tile_size': TILE_SIZE,
+            'max_zoom': HEATMAP_MAX_ZOOM,
+            'pyramid_zoom': PYRAMID_ZOOM,
+            'max_counts': pyramid.max_counts()
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/heatmap/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def heatmap_tile(z, x, y):
+    """
+    密度瓦片：format=bin（默认）为 TILE_SIZE² 个小端uint32，format=png 为着色后的图片，
+    max 为PNG着色的满量程点数（缺省按瓦片内最大值）
+    """
+    fmt = request.args.get('format', 'bin')
+    if fmt not in ('bin', 'png'):
+        return api_error(f'不支持的瓦片格式: {fmt}')
+    try:
+        pyramid = get_heatmap(RECORDS_FILE)
+        max_count = request.args.get('max', type=int)
+        etag = data_etag('heatmap', [], {'version': pyramid.version, 'tile': [z, x, y],
+                                         'format': fmt, 'max': max_count})
+        if is_fresh(etag):
+            return not_modified(etag)
+        grid = pyramid.tile(z, x, y)
+        if fmt == 'png':
+            response = Response(tile_png(grid, max_count), mimetype='image/png')
+        else:
+            response = Response(tile_bytes(grid), mimetype='application/octet-stream')
+        return with_etag(response, etag)
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/country-count', methods=['GET'])
+def country_count():
+    """返回最近一次的国家/地区记录数统计"""
+    try:
+        if not os.path.exists(COUNTRY_COUNT_FILE):
+            return jsonify({'success': True, 'counts': {}})
+        with open(COUNTRY_COUNT_FILE, 'r', encoding='utf-8') as f:
+            return jsonify({'success': True, 'counts': json.load(f)})
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/country-count/refresh', methods=['POST'])
+def refresh_country_count():
+    """增量统计新追加的记录并返回最新结果，同一时间只运行一次统计"""
+    try:
+        with country_count_lock:
+            result = update_country_count(out_path=os.path.abspath(COUNTRY_COUNT_FILE))
+        return jsonify({
+            'success': True,
+            'counts': result['counts'],
+            'processed_bytes': result['processed_bytes']
+        })
+    except Exception as e:
+        return api_error(str(e))
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus文本格式的运行指标"""
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
     return jsonify({
         'status': 'ok',
-        'message': 'IR-Tree SVG API服务正常运行'
+        'message': 'IR-Tree SVG API服务正常运行',
+        'uptime_seconds': round(time.time() - metrics.START_TIME, 3),
+        'query_engine': query_engine is not None,
+        'index_process': index_client.ping() if index_client else None,
+        'render_cache': render_cache.stats(),
+        'render_executor': render_executor.stats()
     })
 
+def warm_up():
+    """
+    预热：加载地图点索引，并把 data/ 下的默认数据文件各渲染一次，
+    填充渲染缓存和快照索引缓存（生产模式下每个worker开始接受请求前调用）
+    """
+    tasks = [
+        ('points', lambda: get_point_index(RECORDS_FILE)),
+        ('heatmap', lambda: get_heatmap(RECORDS_FILE)),
+        ('ir_tree', lambda: IRTreeSVGGenerator().generate_from_file(
+            os.path.join(DATA_DIR, 'ir_tree_data.json'))),
+        ('ir_obir_relation', lambda: IR_OBIR_RelationSVGGenerator().generate_from_files(
+            os.path.join(DATA_DIR, 'ir_obir_mapping.json'), os.path.join(DATA_DIR, 'ir_obir_annotations.json'))),
+        ('ir_logic_path', lambda: generate_logic_path_svg_from_file(
+            os.path.join(DATA_DIR, 'ir_logic_path_data.json'))),
+        ('obir_tree_realtime', lambda: OBIRTreeRealtimeSVGGenerator().generate_from_files(
+            os.path.join(DATA_DIR, 'obir_tree_current.json'), os.path.join(DATA_DIR, 'obir_tree_previous.json'))),
+    ]
+    for name, task in tasks:
+        try:
+            task()
+        except Exception as e:
+            print(f'预热 {name} 失败: {e}', file=sys.stderr)
+
 if __name__ == '__main__':
     print("启动Flask服务器...")
     print(f"数据目录: {DATA_DIR}")
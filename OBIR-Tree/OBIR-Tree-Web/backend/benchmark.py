@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SVG生成器与API基准测试
+用 synthetic_trees.py 按不同规模生成数据，分别计时各生成器的加载、布局、差异、渲染阶段并记录峰值内存，
+再通过Flask测试客户端请求各接口（冷缓存/热缓存），结果以JSON输出，便于跨版本对比
+
+用法:
+    python benchmark.py --sizes 100,1000,10000 --output bench.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import synthetic_trees
+import tree_diff
+import tree_layout
+import tree_schema
+from gen_IR_OBIR_relation_svg import IR_OBIR_RelationSVGGenerator
+from gen_IR_Tree_svg import IRTreeSVGGenerator
+from gen_IR_logic_path_svg import generate_svg as generate_logic_path_svg
+from gen_OBIR_Tree_realtime_svg import OBIRTreeRealtimeSVGGenerator
+from render_cache import render_cache
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+# 超过该节点数时不再重复计时，只跑一次
+REPEAT_LIMIT_NODES = 100000
+SCHEMA_VERSION = 1
+
+
+class Recorder:
+    def __init__(self, repeat: int, memory: bool):
+        self.repeat = repeat
+        self.memory = memory
+        self.results = []
+
+    def phase(self, suite: str, phase: str, params: Dict, func: Callable[[], object]) -> object:
+        """
+        计时单个阶段：重复repeat次取最小值和中位数；
+        memory为真时另外在tracemalloc下运行一次记录该阶段的峰值内存（不计入耗时）
+        """
+        repeat = self.repeat if params['nodes'] < REPEAT_LIMIT_NODES else 1
+        timings = []
+        value = None
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            value = func()
+            timings.append(time.perf_counter() - start)
+
+        peak = None
+        if self.memory:
+            gc.collect()
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.results.append({
+            'suite': suite,
+            'phase': phase,
+            **params,
+            'runs': len(timings),
+            'min_s': min(timings),
+            'median_s': statistics.median(timings),
+            'peak_bytes': peak
+        })
+        print(f"{suite:<18} {phase:<14} nodes={params['nodes']:<8} "
+              f"min={min(timings) * 1000:10.2f}ms" + (f" peak={peak / 1048576:8.1f}MB" if peak else ''),
+              file=sys.stderr)
+        return value
+
+
+def uncached_layout(func: Callable[[], object]) -> Callable[[], object]:
+    """每次调用前清空布局缓存，重复计时测的是布局计算本身"""
+    def run():
+        tree_layout._layout_cache.clear()
+        return func()
+    return run
+
+
+def bench_generators(recorder: Recorder, paths: Dict[str, str], params: Dict):
+    """直接调用各生成器，分阶段计时（不经过渲染缓存和布局缓存）"""
+    ir_tree = IRTreeSVGGenerator()
+    tree_data = recorder.phase('ir_tree', 'load', params, lambda: ir_tree.read_tree_data(paths['ir_tree']))
+    layout, edges = recorder.phase('ir_tree', 'layout', params,
+                                   uncached_layout(lambda: ir_tree.calculate_layout(tree_data)))
+    recorder.phase('ir_tree', 'render', params, lambda: ir_tree.generate_svg(layout, edges))
+
+    relation = IR_OBIR_RelationSVGGenerator()
+    mapping_data = recorder.phase('ir_obir_relation', 'load', params,
+                                  lambda: relation.read_mapping_data(paths['mapping']))
+    ir_layout, obir_layout, mappings = recorder.phase('ir_obir_relation', 'layout', params,
+                                                      lambda: relation.calculate_layout(mapping_data))
+    recorder.phase('ir_obir_relation', 'render', params,
+                   lambda: relation.generate_svg(ir_layout, obir_layout, mappings))
+
+    logic_data = recorder.phase('ir_logic_path', 'load', params, lambda: tree_schema.load_tree(paths['logic_path']))
+    # 逻辑路径生成器在渲染过程中计算布局，布局计入render阶段
+    recorder.phase('ir_logic_path', 'render', params,
+                   uncached_layout(lambda: generate_logic_path_svg(logic_data, logic_data.logic_path)))
+
+    realtime = OBIRTreeRealtimeSVGGenerator()
+    current = recorder.phase('obir_realtime', 'load', params, lambda: tree_schema.load_tree(paths['obir_current']))
+    previous = tree_schema.load_tree(paths['obir_previous'])
+    current_index = recorder.phase('obir_realtime', 'index', params, lambda: tree_diff.TreeIndex(current))
+    previous_index = tree_diff.TreeIndex(previous)
+    differences = recorder.phase('obir_realtime', 'diff', params,
+                                 lambda: tree_diff.diff_trees(current_index, previous_index))
+    tree = recorder.phase('obir_realtime', 'layout', params,
+                          uncached_layout(lambda: realtime._place(current, previous)))
+    recorder.phase('obir_realtime', 'render', params, lambda: realtime._generate_svg(current, differences, tree))
+
+
+def bench_endpoints(recorder: Recorder, data_dir: str, params: Dict):
+    """通过Flask测试客户端请求各SVG接口，分别记录冷缓存（清空渲染、索引和布局缓存）与热缓存的耗时"""
+    import app as app_module
+    app_module.DATA_DIR = data_dir
+    client = app_module.app.test_client()
+
+    bodies = {
+        'ir-tree-svg': {},
+        'ir-obir-relation-svg': {},
+        'ir-logic-path-svg': {},
+        'obir-tree-realtime': {},
+    }
+
+    def post(route, body):
+        response = client.post(f'/api/{route}', json=body)
+        result = response.get_json()
+        if not result or not result.get('success'):
+            raise RuntimeError(f'/api/{route} 失败: {result}')
+        return len(response.data)
+
+    def cold(route, body):
+        render_cache.clear()
+        tree_diff._index_cache.clear()
+        tree_layout._layout_cache.clear()
+        return post(route, body)
+
+    for route, body in bodies.items():
+        recorder.phase(f'api:{route}', 'cold', params, lambda: cold(route, body))
+        post(route, body)
+        recorder.phase(f'api:{route}', 'warm', params, lambda: post(route, body))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run(sizes: List[int], fanout: int, depth: int, change_rate: float, repeat: int,
+        memory: bool, endpoints: bool, seed: int) -> Dict:
+    recorder = Recorder(repeat, memory)
+    with tempfile.TemporaryDirectory(prefix='obir-bench-') as work_dir:
+        for nodes in sizes:
+            shape_fanout, shape_depth = synthetic_trees.tree_shape(nodes, fanout, depth)
+            params = {'nodes': nodes, 'fanout': shape_fanout, 'depth': shape_depth, 'change_rate': change_rate}
+            data_dir = os.path.join(work_dir, str(nodes))
+            paths = synthetic_trees.write_dataset(data_dir, nodes, shape_fanout, None, change_rate, seed)
+            bench_generators(recorder, paths, params)
+            if endpoints:
+                bench_endpoints(recorder, data_dir, params)
+
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+            'repeat': repeat,
+            'memory': memory
+        },
+        'results': recorder.results
+    }
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    parser = argparse.ArgumentParser(description='SVG生成器与API基准测试')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='逗号分隔的节点数列表，如 100,1000,1000000')
+    parser.add_argument('--fanout', type=int, default=None, help='树的扇出（默认4）')
+    parser.add_argument('--depth', type=int, default=None, help='树的深度（未给出扇出时由深度推出扇出）')
+    parser.add_argument('--change-rate', type=float, default=0.01, help='前后快照之间的节点变化率')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数')
+    parser.add_argument('--no-memory', action='store_true', help='不测量峰值内存')
+    parser.add_argument('--no-api', action='store_true', help='不测试Flask接口')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', default=None, help='结果JSON文件，默认输出到标准输出')
+    args = parser.parse_args()
+
+    sizes = [int(v) for v in args.sizes.split(',') if v]
+    report = run(sizes, args.fanout, args.depth, args.change_rate, args.repeat,
+                 not args.no_memory, not args.no_api, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+国家/地区边界的点包含查询（离线）
+读取前端地图使用的 `public/world.json`（GeoJSON，坐标为 [lng, lat]），把每个多边形（外环及其洞）
+作为一个条目，按外包矩形用STR打包成R-tree；查询一批点时：
+1. 自顶向下逐层用整列比较筛出点落在其外包矩形内的 (点, 多边形) 候选对；
+2. 每个多边形的边预先按y方向切成若干水平带，候选点只与所在带内的少数几条边做射线法（奇偶规则）判断，
+   洞、多块组成的国家都按奇偶规则自然处理。
+另把经纬度平面划成网格：没有任何边经过（含相邻一格）的格子里所有点的结果都与格子中心相同，
+建索引时预先算好，查询时直接查表；边界附近的格子预先用R-tree查出与之相交的多边形，格内的点只与这些多边形做第2步判断。
+全部为NumPy整列运算，结果与逐边射线法完全一致，不依赖网络和反向地理编码数据
+"""
+
+import json
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+WORLD_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public/world.json'))
+# R-tree节点的最大子节点数
+NODE_CAPACITY = 8
+# 每个水平带平均分到的边数，越小带越多、每个点需要判断的边越少
+EDGES_PER_BAND = 2
+# 查表网格的格子边长（度）
+GRID_CELL_DEGREES = 0.5
+# 单次整列运算处理的点数，限制候选对数组的内存
+BATCH_POINTS = 1 << 18
+
+
+def _str_order(min_x: np.ndarray, min_y: np.ndarray, max_x: np.ndarray, max_y: np.ndarray,
+               capacity: int) -> np.ndarray:
+    """
+    Sort-Tile-Recursive分组的排列：按中心x排序切成竖条，条内按中心y排序，
+    排列后每 capacity 个连续条目为一个节点（竖条大小是capacity的整数倍，只有最后一个节点可能不满）
+    """
+    count = len(min_x)
+    leaf_count = math.ceil(count / capacity)
+    slab_size = math.ceil(math.sqrt(leaf_count)) * capacity
+    by_x = np.argsort(min_x + max_x, kind='stable')
+    center_y = (min_y + max_y)[by_x]
+    order = []
+    for i in range(0, count, slab_size):
+        order.append(by_x[i:i + slab_size][np.argsort(center_y[i:i + slab_size], kind='stable')])
+    return np.concatenate(order)
+
+
+class _Level:
+    """R-tree的一层：各节点的外包矩形和子条目区间 [start, end)（指向下一层或多边形）"""
+
+    def __init__(self, min_x, min_y, max_x, max_y, start, end):
+        self.min_x, self.min_y, self.max_x, self.max_y = min_x, min_y, max_x, max_y
+        self.start, self.end = start, end
+
+
+class CountryIndex:
+    def __init__(self, features: List[dict]):
+        """
+        Args:
+            features: GeoJSON Feature列表，geometry 为 Polygon 或 MultiPolygon；
+                      下标即 locate 返回的国家编号
+        """
+        self.names = [str(f.get('properties', {}).get('name', i)) for i, f in enumerate(features)]
+        self.codes = [str(f.get('properties', {}).get('alpha2Code', '')) for f in features]
+
+        # 多边形条目：所属国家、外环的外包矩形、所有环的边
+        owners, boxes, edges = [], [], []
+        for feature_id, feature in enumerate(features):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                continue
+            for rings in polygons:
+                segments = []
+                for ring in rings:
+                    ring = np.asarray(ring, dtype=np.float64)[:, :2]
+                    if len(ring) < 3:
+                        continue
+                    if (ring[0] != ring[-1]).any():
+                        ring = np.vstack((ring, ring[:1]))
+                    segments.append(np.hstack((ring[:-1], ring[1:])))
+                if not segments:
+                    continue
+                exterior = segments[0]
+                owners.append(feature_id)
+                boxes.append((exterior[:, 0].min(), exterior[:, 1].min(), exterior[:, 0].max(), exterior[:, 1].max()))
+                edges.append(np.vstack(segments))
+
+        self.polygon_owner = np.asarray(owners, dtype=np.int32)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self._build_tree(boxes)
+        self._build_bands(boxes, edges)
+        self._build_grid(np.vstack(edges) if edges else np.zeros((0, 4)))
+
+    @classmethod
+    def from_geojson(cls, path: str = WORLD_PATH) -> 'CountryIndex':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get('features', []))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _build_tree(self, boxes: np.ndarray):
+        """自底向上STR打包；多边形条目按叶层顺序重排，使每个节点的子条目连续"""
+        order = _str_order(*boxes.T, NODE_CAPACITY) if len(boxes) else np.zeros(0, dtype=np.int64)
+        self._polygon_order = order
+        min_x, min_y, max_x, max_y = (column[order] for column in boxes.T)
+        start = np.arange(len(order), dtype=np.int64)
+        end = start + 1
+        self.levels: List[_Level] = []
+        while True:
+            # 当前层按 capacity 个连续条目分组成上一层的节点
+            starts = np.arange(0, len(min_x), NODE_CAPACITY)
+            reduce = lambda values, ufunc: ufunc.reduceat(values, starts) if len(values) else values
+            child_start, child_end = starts, np.minimum(starts + NODE_CAPACITY, len(min_x))
+            self.levels.append(_Level(min_x, min_y, max_x, max_y, start, end))
+            if len(min_x) <= NODE_CAPACITY:
+                break
+            min_x, min_y = reduce(min_x, np.minimum), reduce(min_y, np.minimum)
+            max_x, max_y = reduce(max_x, np.maximum), reduce(max_y, np.maximum)
+            order = _str_order(min_x, min_y, max_x, max_y, NODE_CAPACITY)
+            min_x, min_y, max_x, max_y = min_x[order], min_y[order], max_x[order], max_y[order]
+            start, end = child_start[order], child_end[order]
+        # 自顶向下
+        self.levels.reverse()
+
+    def _build_bands(self, boxes: np.ndarray, edges: List[np.ndarray]):
+        """每个多边形按y切成等高的水平带，带内列出y范围与之相交的边（CSR，按叶层顺序存放）"""
+        band_counts, band_y0, band_scale = [], [], []
+        band_edges, band_sizes = [], []
+        edge_offset = 0
+        all_edges = []
+        for polygon in self._polygon_order:
+            segments = edges[polygon]
+            # 水平边与水平射线不相交（半开规则），不参与判断
+            segments = segments[segments[:, 1] != segments[:, 3]]
+            y0, y1 = boxes[polygon, 1], boxes[polygon, 3]
+            if len(segments):
+                y0 = min(y0, segments[:, [1, 3]].min())
+                y1 = max(y1, segments[:, [1, 3]].max())
+            bands = max(1, math.ceil(len(segments) / EDGES_PER_BAND))
+            scale = bands / (y1 - y0) if y1 > y0 else 0.0
+            low = np.minimum(segments[:, 1], segments[:, 3])
+            high = np.maximum(segments[:, 1], segments[:, 3])
+            first = np.clip(((low - y0) * scale).astype(np.int64), 0, bands - 1)
+            last = np.clip(((high - y0) * scale).astype(np.int64), 0, bands - 1)
+            spans = last - first + 1
+            # 边 i 属于带 first[i] .. last[i]
+            edge_ids = np.repeat(np.arange(len(segments), dtype=np.int64), spans)
+            band_ids = np.repeat(first - np.cumsum(spans) + spans, spans) + np.arange(len(edge_ids))
+            by_band = np.argsort(band_ids, kind='stable')
+            band_edges.append(edge_ids[by_band] + edge_offset)
+            band_sizes.append(np.bincount(band_ids, minlength=bands))
+            band_counts.append(bands)
+            band_y0.append(y0)
+            band_scale.append(scale)
+            all_edges.append(segments)
+            edge_offset += len(segments)
+
+        self._band_count = np.asarray(band_counts, dtype=np.int64)
+        self._band_base = np.concatenate(([0], np.cumsum(self._band_count)[:-1])).astype(np.int64)
+        self._band_y0 = np.asarray(band_y0, dtype=np.float64)
+        self._band_scale = np.asarray(band_scale, dtype=np.float64)
+        sizes = np.concatenate(band_sizes) if band_sizes else np.zeros(0, dtype=np.int64)
+        self._band_start = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        self._band_edges = np.concatenate(band_edges) if band_edges else np.zeros(0, dtype=np.int64)
+        segments = np.vstack(all_edges) if all_edges else np.zeros((0, 4))
+        self._ex1, self._ey1, self._ex2, self._ey2 = (np.ascontiguousarray(c) for c in segments.T)
+        # 交点x = ex1 + (y - ey1) * slope，预先算好 dx/dy
+        self._eslope = (self._ex2 - self._ex1) / (self._ey2 - self._ey1)
+        self._polygon_owner_leaf = self.polygon_owner[self._polygon_order] if len(self._polygon_order) \
+            else np.zeros(0, dtype=np.int32)
+
+    def _cells(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """点所在的网格下标，网格范围之外（含NaN）为-1"""
+        col = (x - self._grid_x0) * self._grid_scale
+        row = (y - self._grid_y0) * self._grid_scale
+        valid = (col >= 0) & (col < self._grid_cols) & (row >= 0) & (row < self._grid_rows)
+        cells = np.full(len(x), -1, dtype=np.int64)
+        cells[valid] = row[valid].astype(np.int64) * self._grid_cols + col[valid].astype(np.int64)
+        return cells
+
+    def _build_grid(self, segments: np.ndarray):
+        """
+        每条边（含水平边）的外包矩形各向外扩一格，覆盖到的格子为边界格，其余格子内没有边界经过、
+        且离所有边至少一格，格子内各点的射线判断都不受浮点误差影响，格子中心的精确结果即整个格子的结果。
+
+        网格取值：>= -1 为整个格子的结果；<= -2 为边界格，-2 - 值 为其候选多边形列表的下标，
+        候选多边形为外包矩形与格子相交的多边形（用R-tree做窗口查询得到）
+        """
+        root = self.levels[0]
+        self._grid_scale = 1.0 / GRID_CELL_DEGREES
+        self._cell_start = np.zeros(1, dtype=np.int64)
+        self._cell_polygons = np.zeros(0, dtype=np.int64)
+        if not len(root.min_x):
+            self._grid_x0 = self._grid_y0 = 0.0
+            self._grid_cols = self._grid_rows = 0
+            self._grid = np.zeros(0, dtype=np.int32)
+            return
+        self._grid_x0, self._grid_y0 = float(root.min_x.min()), float(root.min_y.min())
+        self._grid_cols = int((root.max_x.max() - self._grid_x0) * self._grid_scale) + 1
+        self._grid_rows = int((root.max_y.max() - self._grid_y0) * self._grid_scale) + 1
+
+        def span(low, high, origin, size):
+            first = ((low - origin) * self._grid_scale).astype(np.int64) - 1
+            last = ((high - origin) * self._grid_scale).astype(np.int64) + 1
+            return np.clip(first, 0, size - 1), np.clip(last, 0, size - 1)
+
+        x1, y1, x2, y2 = segments.T
+        col0, col1 = span(np.minimum(x1, x2), np.maximum(x1, x2), self._grid_x0, self._grid_cols)
+        row0, row1 = span(np.minimum(y1, y2), np.maximum(y1, y2), self._grid_y0, self._grid_rows)
+        widths, heights = col1 - col0 + 1, row1 - row0 + 1
+        counts = widths * heights
+        edge = np.repeat(np.arange(len(counts)), counts)
+        # 每条边覆盖的第k个格子：行偏移 k // 宽，列偏移 k % 宽
+        k = np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows, cols = np.divmod(k, widths[edge])
+        boundary = np.zeros(self._grid_rows * self._grid_cols, dtype=bool)
+        boundary[(row0[edge] + rows) * self._grid_cols + col0[edge] + cols] = True
+
+        grid = np.empty(len(boundary), dtype=np.int32)
+        interior = np.flatnonzero(~boundary)
+        center_x = self._grid_x0 + (interior % self._grid_cols + 0.5) * GRID_CELL_DEGREES
+        center_y = self._grid_y0 + (interior // self._grid_cols + 0.5) * GRID_CELL_DEGREES
+        grid[interior] = self._locate_exact(center_x, center_y)
+
+        # 边界格的候选多边形；格子范围稍向外扩，包含因舍入落入该格的点
+        cells = np.flatnonzero(boundary)
+        grid[cells] = -2 - np.arange(len(cells), dtype=np.int32)
+        margin = GRID_CELL_DEGREES * 1e-6
+        cell_x = self._grid_x0 + (cells % self._grid_cols) * GRID_CELL_DEGREES
+        cell_y = self._grid_y0 + (cells // self._grid_cols) * GRID_CELL_DEGREES
+        slots, polygons = self._candidates(cell_x - margin, cell_y - margin,
+                                           cell_x + GRID_CELL_DEGREES + margin, cell_y + GRID_CELL_DEGREES + margin)
+        order = np.argsort(slots, kind='stable')
+        self._cell_start = np.concatenate(([0], np.cumsum(np.bincount(slots, minlength=len(cells))))).astype(np.int64)
+        self._cell_polygons = polygons[order]
+        self._grid = grid
+
+    def _candidates(self, min_x: np.ndarray, min_y: np.ndarray,
+                    max_x: np.ndarray, max_y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """逐层筛选与查询矩形相交的 (查询下标, 叶层多边形下标) 候选对；查询点时矩形退化为点"""
+        queries = np.arange(len(min_x), dtype=np.int64)
+        # 根层可能有多个节点：先展开成 (查询, 根层节点) 对
+        width = len(self.levels[0].min_x)
+        queries, nodes = np.repeat(queries, width), np.tile(np.arange(width, dtype=np.int64), len(min_x))
+        for depth, level in enumerate(self.levels):
+            overlap = ((level.min_x[nodes] <= max_x[queries]) & (min_x[queries] <= level.max_x[nodes]) &
+                       (level.min_y[nodes] <= max_y[queries]) & (min_y[queries] <= level.max_y[nodes]))
+            queries, nodes = queries[overlap], nodes[overlap]
+            if depth + 1 == len(self.levels):
+                break
+            # 展开到子节点
+            start, end = level.start[nodes], level.end[nodes]
+            counts = end - start
+            queries = np.repeat(queries, counts)
+            nodes = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(len(queries))
+        # 叶层的条目即按叶层顺序排列的多边形
+        return queries, self.levels[-1].start[nodes]
+
+    def _inside(self, x: np.ndarray, y: np.ndarray, points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+        """候选对中点是否在多边形内：只取点所在水平带内的边，统计射线向右穿过的边数的奇偶"""
+        py = y[points]
+        local = ((py - self._band_y0[polygons]) * self._band_scale[polygons]).astype(np.int64)
+        band = self._band_base[polygons] + np.clip(local, 0, self._band_count[polygons] - 1)
+        start, end = self._band_start[band], self._band_start[band + 1]
+        counts = end - start
+        pair = np.repeat(np.arange(len(points), dtype=np.int64), counts)
+        edge = self._band_edges[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(len(pair))]
+        ey1, ey2 = self._ey1[edge], self._ey2[edge]
+        ey = py[pair]
+        crosses = (ey1 > ey) != (ey2 > ey)
+        crosses &= x[points][pair] < self._ex1[edge] + (ey - ey1) * self._eslope[edge]
+        total = np.concatenate(([0], np.cumsum(crosses, dtype=np.int64)))
+        ends = np.cumsum(counts)
+        return ((total[ends] - total[ends - counts]) & 1).astype(bool)
+
+    def _owners(self, count: int, x: np.ndarray, y: np.ndarray,
+                points: np.ndarray, polygons: np.ndarray) -> np.ndarray:
+        """对候选对做射线判断，返回每个点所在国家的编号；同一点落在多个国家内时取编号最小的"""
+        hit = self._inside(x, y, points, polygons)
+        points, owners = points[hit], self._polygon_owner_leaf[polygons[hit]]
+        order = np.lexsort((owners, points))
+        points, owners = points[order], owners[order]
+        first = np.ones(len(points), dtype=bool)
+        first[1:] = points[1:] != points[:-1]
+        result = np.full(count, -1, dtype=np.int32)
+        result[points[first]] = owners[first]
+        return result
+
+    def _locate_exact(self, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+        """不经过网格，逐批用R-tree筛选候选多边形后做射线判断"""
+        result = np.full(len(lng), -1, dtype=np.int32)
+        if not len(self._polygon_order):
+            return result
+        for offset in range(0, len(lng), BATCH_POINTS):
+            x, y = lng[offset:offset + BATCH_POINTS], lat[offset:offset + BATCH_POINTS]
+            points, polygons = self._candidates(x, y, x, y)
+            result[offset:offset + len(x)] = self._owners(len(x), x, y, points, polygons)
+        return result
+
+    def _locate_boundary(self, x: np.ndarray, y: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """边界格内的点：取格子的候选多边形，外包矩形包含该点的再做射线判断"""
+        start, end = self._cell_start[slots], self._cell_start[slots + 1]
+        counts = end - start
+        points = np.repeat(np.arange(len(x), dtype=np.int64), counts)
+        polygons = self._cell_polygons[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(len(points))]
+        leaf = self.levels[-1]
+        px, py = x[points], y[points]
+        keep = ((leaf.min_x[polygons] <= px) & (px <= leaf.max_x[polygons]) &
+                (leaf.min_y[polygons] <= py) & (py <= leaf.max_y[polygons]))
+        return self._owners(len(x), x, y, points[keep], polygons[keep])
+
+    def locate(self, lng, lat) -> np.ndarray:
+        """
+        每个点 (lng, lat) 所在国家的编号（features下标），不在任何国家内（如海上）为-1
+
+        边界数据中相互重叠的区域取编号较小的国家；坐标为NaN的点为-1
+        """
+        lng = np.ascontiguousarray(lng, dtype=np.float64).ravel()
+        lat = np.ascontiguousarray(lat, dtype=np.float64).ravel()
+        if lng.shape != lat.shape:
+            raise ValueError(f'经纬度数组长度不一致: {len(lng)} != {len(lat)}')
+        cells = self._cells(lng, lat)
+        result = np.full(len(lng), -1, dtype=np.int32)
+        in_grid = cells >= 0
+        result[in_grid] = self._grid[cells[in_grid]]
+        # 网格之外的点（含NaN）只可能落在外包矩形恰好在网格边缘的多边形上，走R-tree
+        outside = np.flatnonzero(~in_grid)
+        if len(outside):
+            result[outside] = self._locate_exact(lng[outside], lat[outside])
+        boundary = np.flatnonzero(result <= -2)
+        for offset in range(0, len(boundary), BATCH_POINTS):
+            batch = boundary[offset:offset + BATCH_POINTS]
+            result[batch] = self._locate_boundary(lng[batch], lat[batch], -2 - result[batch].astype(np.int64))
+        return result
+
+    def count(self, lng, lat) -> Counter:
+        """按国家名称统计点数，不在任何国家内的点不计入；同名的多个要素合并计数"""
+        located = self.locate(lng, lat)
+        result = Counter()
+        for feature_id, value in enumerate(np.bincount(located[located >= 0], minlength=len(self.names)).tolist()):
+            if value:
+                result[self.names[feature_id]] += value
+        return result
+
+    def name_of(self, lng: float, lat: float) -> Optional[str]:
+        """单个点所在国家的名称"""
+        feature_id = int(self.locate([lng], [lat])[0])
+        return self.names[feature_id] if feature_id >= 0 else None
+
+
+_indexes: Dict[str, CountryIndex] = {}
+
+
+def load_country_index(path: str = WORLD_PATH) -> CountryIndex:
+    """读取边界文件并建立索引，同一文件在进程内只建立一次"""
+    path = os.path.abspath(path)
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = CountryIndex.from_geojson(path)
+    return index
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多分辨率点密度热力图
+按Web墨卡托的瓦片划分（缩放级别z有 2^z × 2^z 个瓦片，每个瓦片 TILE_SIZE × TILE_SIZE 个格子），
+对列式点数据（见 point_store.py）统计每个格子内的点数：
+- 0..PYRAMID_ZOOM 级预先计算成金字塔并常驻内存：最细一级按格子编号做一次 bincount（即 histogram2d），
+  上一级由下一级 2×2 求和得到；记录文件追加新记录后只统计新增的行并累加到各级；
+- 更细的级别按需从 /api/points 的Morton排序索引（见 point_tiles.py）计算：瓦片内的格子是排序数组中的连续区间，
+  一次二分查找即得到所有格子的点数，结果进入LRU缓存。
+瓦片大小与数据量无关，以小端uint32的原始二进制或着色后的PNG返回
+"""
+
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from metrics import phase_timer, timed
+from point_store import PointStore, load_points
+from point_tiles import MORTON_BITS, get_point_index, morton_encode, project
+
+# 每个瓦片每边的格子数
+TILE_BITS = 8
+TILE_SIZE = 1 << TILE_BITS
+# 预先计算的最大缩放级别（最细一级 2048 × 2048 个格子）
+PYRAMID_ZOOM = 3
+# 按需计算的最大缩放级别：格子不能比Morton编码的最细网格更细
+MAX_ZOOM = MORTON_BITS - TILE_BITS
+# 按需计算的瓦片的缓存条目数
+TILE_CACHE_ENTRIES = 256
+# 判断记录文件是否只是追加时比较的前缀行数
+HEAD_ROWS = 4096
+# 追加统计时每批处理的行数
+_BATCH_ROWS = 1 << 22
+# 一批点数少于最细一级格子数的 1/SPARSE_RATIO 时逐点累加，否则整张网格 bincount
+SPARSE_RATIO = 64
+
+# PNG着色的色带：计数取对数后按 [0, 1] 插值，0个点的格子透明
+_RAMP_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+_RAMP_COLORS = np.array([
+    [49, 54, 149, 96],
+    [69, 117, 180, 160],
+    [254, 224, 144, 208],
+    [244, 109, 67, 232],
+    [165, 0, 38, 255],
+], dtype=np.float64)
+
+
+def _head_digest(store: PointStore, rows: int) -> str:
+    """前 HEAD_ROWS 行和第 rows 行之前最后一行的坐标摘要，用于识别记录文件被替换而不是追加"""
+    h = hashlib.blake2b(digest_size=16)
+    head = min(rows, HEAD_ROWS)
+    h.update(store.lng[:head].tobytes())
+    h.update(store.lat[:head].tobytes())
+    if rows:
+        h.update(store.lng[rows - 1:rows].tobytes())
+        h.update(store.lat[rows - 1:rows].tobytes())
+    return h.hexdigest()
+
+
+def parse_tile(z: int, x: int, y: int) -> Tuple[int, int, int]:
+    """校验瓦片坐标，超出范围时抛出 ValueError"""
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f'缩放级别应在 0..{MAX_ZOOM} 之间: {z}')
+    if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError(f'瓦片坐标超出范围: {z}/{x}/{y}')
+    return z, x, y
+
+
+class DensityPyramid:
+    def __init__(self, source_file: str):
+        """
+        Args:
+            source_file: 记录文件（或 .obpts 文件），更细级别的瓦片从它的Morton排序索引计算
+        """
+        self.source_file = source_file
+        # levels[z] 为第z级整个世界的格子计数，形状 (TILE_SIZE << z, TILE_SIZE << z)，行0为北端
+        self.levels = [np.zeros((TILE_SIZE << z, TILE_SIZE << z), dtype=np.uint32)
+                       for z in range(PYRAMID_ZOOM + 1)]
+        self.rows = 0
+        # 与 _head_digest(任意点数据, 0) 相同
+        self.digest = hashlib.blake2b(digest_size=16).hexdigest()
+        self.store: Optional[PointStore] = None
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        """金字塔内容的版本，用作ETag"""
+        return f'{self.rows}-{self.digest}'
+
+    def _add(self, lng: np.ndarray, lat: np.ndarray):
+        """把一批点计入各级：最细一级 bincount，逐级 2×2 求和后累加"""
+        finite = np.isfinite(lng) & np.isfinite(lat)
+        mx, my = project(lng[finite], lat[finite])
+        size = TILE_SIZE << PYRAMID_ZOOM
+        ix, iy = (mx * size).astype(np.int64), (my * size).astype(np.int64)
+        if len(ix) < size * size // SPARSE_RATIO:
+            # 新增的点较少时直接累加到各级对应的格子，不生成整张网格
+            for z in range(PYRAMID_ZOOM + 1):
+                shift = PYRAMID_ZOOM - z
+                np.add.at(self.levels[z].reshape(-1), (iy >> shift) * (TILE_SIZE << z) + (ix >> shift), 1)
+            return
+        counts = np.bincount(iy * size + ix, minlength=size * size).reshape(size, size)
+        for z in range(PYRAMID_ZOOM, -1, -1):
+            self.levels[z] += counts.astype(np.uint32)
+            if z:
+                half = counts.shape[0] // 2
+                counts = counts.reshape(half, 2, half, 2).sum(axis=(1, 3))
+
+    @timed('heatmap', 'update')
+    def update(self, store: PointStore) -> bool:
+        """
+        与点数据同步，返回内容是否变化
+
+        新数据的前缀与已统计部分一致时（记录文件只是追加）只统计新增的行，否则清零后全量统计
+        """
+        with self._lock:
+            if store is self.store:
+                return False
+            rows = len(store)
+            append = rows >= self.rows and _head_digest(store, self.rows) == self.digest
+            if not append:
+                for level in self.levels:
+                    level.fill(0)
+                self.rows = 0
+            with phase_timer('heatmap', 'histogram'):
+                for start in range(self.rows, rows, _BATCH_ROWS):
+                    end = min(start + _BATCH_ROWS, rows)
+                    self._add(store.lng[start:end], store.lat[start:end])
+            changed = rows != self.rows or not append
+            self.rows = rows
+            self.digest = _head_digest(store, rows)
+            self.store = store
+            if changed:
+                self._tiles.clear()
+            return changed
+
+    def max_counts(self) -> list:
+        """预先计算的各级中单个格子的最大点数（前端按级别统一着色时使用）"""
+        with self._lock:
+            return [int(level.max()) for level in self.levels]
+
+    def _deep_tile(self, z: int, x: int, y: int) -> np.ndarray:
+        """
+        从Morton排序索引计算更细级别的瓦片：瓦片内第 (bx, by) 个格子的编码为
+        瓦片编码 << 2*TILE_BITS | morton(bx, by)，各格子的点是排序数组中的连续区间
+        """
+        index = get_point_index(self.source_file)
+        tile_code = int(morton_encode(np.array([x]), np.array([y]))[0])
+        shift = np.uint64(2 * (MORTON_BITS - z - TILE_BITS))
+        codes = (np.uint64(tile_code << (2 * TILE_BITS)) + np.arange(TILE_SIZE * TILE_SIZE + 1, dtype=np.uint64)) << shift
+        bounds = np.searchsorted(index.codes, codes, side='left')
+        counts = np.diff(bounds)
+        bx, by = np.meshgrid(np.arange(TILE_SIZE), np.arange(TILE_SIZE))
+        return counts[morton_encode(bx.ravel(), by.ravel()).astype(np.int64)].reshape(TILE_SIZE, TILE_SIZE)
+
+    @timed('heatmap', 'tile')
+    def tile(self, z: int, x: int, y: int) -> np.ndarray:
+        """第z级 (x, y) 瓦片的格子计数，形状 (TILE_SIZE, TILE_SIZE) 的uint32，行0为北端"""
+        z, x, y = parse_tile(z, x, y)
+        with self._lock:
+            if z <= PYRAMID_ZOOM:
+                return self.levels[z][y * TILE_SIZE:(y + 1) * TILE_SIZE, x * TILE_SIZE:(x + 1) * TILE_SIZE].copy()
+            key = (z, x, y)
+            grid = self._tiles.get(key)
+            if grid is not None:
+                self._tiles.move_to_end(key)
+                return grid
+        grid = self._deep_tile(z, x, y).astype(np.uint32)
+        with self._lock:
+            self._tiles[key] = grid
+            while len(self._tiles) > TILE_CACHE_ENTRIES:
+                self._tiles.popitem(last=False)
+        return grid
+
+
+def tile_bytes(grid: np.ndarray) -> bytes:
+    """二进制瓦片：TILE_SIZE × TILE_SIZE 个小端uint32，按行（自北向南）排列"""
+    return grid.astype('<u4').tobytes()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """(高, 宽, 4) 的uint8数组 -> RGBA PNG（每行无过滤）"""
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + _png_chunk(b'IEND', b''))
+
+
+def tile_png(grid: np.ndarray, max_count: Optional[int] = None) -> bytes:
+    """
+    着色后的PNG瓦片：log(1 + 计数) / log(1 + max_count) 映射到色带，0个点的格子透明
+
+    max_count 缺省为瓦片内的最大值；跨瓦片比较时应传入同一个值（如 max_counts() 中该级的值）
+    """
+    peak = int(grid.max()) if max_count is None else int(max_count)
+    scale = np.log1p(grid.astype(np.float64)) / np.log1p(max(peak, 1))
+    scale = np.clip(scale, 0.0, 1.0)
+    rgba = np.empty(grid.shape + (4,), dtype=np.uint8)
+    for channel in range(4):
+        rgba[..., channel] = np.interp(scale, _RAMP_STOPS, _RAMP_COLORS[:, channel]).round()
+    rgba[grid == 0] = 0
+    return encode_png(rgba)
+
+
+_pyramid: Optional[DensityPyramid] = None
+_pyramid_lock = threading.Lock()
+
+
+def get_heatmap(data_file: str) -> DensityPyramid:
+    """
+    取记录文件对应的密度金字塔
+
+    点数据按 load_points 的规则随记录文件更新；同一记录文件的后续版本在原金字塔上增量更新
+    """
+    global _pyramid
+    store = load_points(data_file)
+    with _pyramid_lock:
+        if _pyramid is None or _pyramid.source_file != data_file:
+            _pyramid = DensityPyramid(data_file)
+        pyramid = _pyramid
+    pyramid.update(store)
+    return pyramid
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+关键词的近似匹配索引
+对记录名称切分出的全部关键词建立二元组（bigram，首尾补边界符）倒排表，词按长度排序存放，
+查找与某个词编辑距离不超过d的全部关键词时：
+1. 长度过滤：候选词长度在 [m-d, m+d] 内，按长度排序后是一段连续区间；
+2. 计数过滤：编辑距离不超过d的两个词至少共有 max(m, n) + 1 - 2d 个二元组，只在区间内统计倒排表的命中次数；
+3. 验证：对通过过滤的候选，按长度分组用位并行（Myers）算法一次算出整组的编辑距离。
+整个过程为NumPy整列运算，百万级词表的单次查找为毫秒级
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# 位并行算法一次处理的查询词最大长度（uint64的位数），更长的词逐个计算
+MAX_PATTERN_LENGTH = 64
+
+
+def levenshtein(a: str, b: str) -> int:
+    """计算两个字符串的编辑距离"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _codepoints(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def bit_parallel_distance(peq: np.ndarray, m: int, texts: np.ndarray) -> np.ndarray:
+    """
+    查询词与一组等长词的编辑距离（Myers / Hyyrö 位并行算法，逐列处理，整组同时计算）
+
+    Args:
+        peq: 字母表编号 -> 该字符在查询词中出现位置的位掩码
+        m: 查询词长度（1..64）
+        texts: (词数, 长度) 的字母表编号矩阵
+    """
+    one = np.uint64(1)
+    high = np.uint64(1 << (m - 1))
+    pv = np.full(len(texts), np.uint64((1 << m) - 1), dtype=np.uint64)
+    mv = np.zeros(len(texts), dtype=np.uint64)
+    score = np.full(len(texts), m, dtype=np.int64)
+    for column in texts.T:
+        eq = peq[column]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        score += (ph & high) != 0
+        score -= (mh & high) != 0
+        # 第0行 D[0][j] = j，每列加1
+        ph = (ph << one) | one
+        mh = mh << one
+        pv = mh | ~(xv | ph)
+        mv = ph & xv
+    return score
+
+
+class FuzzyTermIndex:
+    def __init__(self, terms: Sequence[str]):
+        """
+        Args:
+            terms: 关键词列表，下标即关键词id（如 SpatialKeywordEngine 的词表顺序）
+        """
+        self.terms = terms
+        lengths = np.fromiter(map(len, terms), dtype=np.int64, count=len(terms))
+        # 位置 -> 关键词id，按长度排序
+        self.order = np.argsort(lengths, kind='stable')
+        self.lengths = lengths[self.order]
+        self.max_length = int(self.lengths[-1]) if len(terms) else 0
+        # length_starts[L] 为第一个长度不小于L的位置
+        self.length_starts = np.searchsorted(self.lengths, np.arange(self.max_length + 2))
+
+        # 所有词的字符按字母表编号，同一长度的词组成一个矩阵
+        codepoints = _codepoints(''.join(terms[i] for i in self.order))
+        self.alphabet, codes = np.unique(codepoints, return_inverse=True)
+        codes = codes.astype(np.int32)
+        char_starts = np.concatenate(([0], np.cumsum(self.lengths)))
+        self._codes = {}
+        for length in range(1, self.max_length + 1):
+            start, end = self.length_starts[length], self.length_starts[length + 1]
+            if start < end:
+                self._codes[length] = codes[char_starts[start]:char_starts[end]].reshape(end - start, length)
+
+        # 二元组倒排表：每个二元组对应的位置列表（升序）
+        self._gram_base = len(self.alphabet) + 2
+        keys, positions = [], []
+        for length, matrix in self._codes.items():
+            start = self.length_starts[length]
+            keys.append(self._gram_keys(matrix).ravel())
+            positions.append(np.repeat(np.arange(start, start + len(matrix), dtype=np.int32), length + 1))
+        if keys:
+            keys = np.concatenate(keys)
+            positions = np.concatenate(positions)
+        else:
+            keys = np.zeros(0, dtype=np.int64)
+            positions = np.zeros(0, dtype=np.int32)
+        by_gram = np.argsort(keys, kind='stable')
+        self._grams, gram_starts = np.unique(keys[by_gram], return_index=True)
+        self._gram_starts = np.append(gram_starts, len(keys))
+        self._postings = positions[by_gram]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def _gram_keys(self, matrix: np.ndarray) -> np.ndarray:
+        """(词数, L) 的字符编号 -> (词数, L+1) 的二元组编号，首尾分别补起始符和结束符"""
+        begin, end = self._gram_base - 2, self._gram_base - 1
+        padded = np.empty((matrix.shape[0], matrix.shape[1] + 2), dtype=np.int64)
+        padded[:, 0] = begin
+        padded[:, -1] = end
+        padded[:, 1:-1] = matrix
+        return padded[:, :-1] * self._gram_base + padded[:, 1:]
+
+    def _encode(self, term: str) -> np.ndarray:
+        """查询词的字符编号，不在字母表中的字符记为-1（与任何词都不匹配）"""
+        codepoints = _codepoints(term)
+        index = np.searchsorted(self.alphabet, codepoints)
+        index = np.minimum(index, len(self.alphabet) - 1)
+        return np.where(self.alphabet[index] == codepoints, index, -1)
+
+    def _query_grams(self, codes: np.ndarray) -> np.ndarray:
+        """查询词的二元组编号（去重）；含字母表之外的字符时只取两侧字符都已知的二元组"""
+        begin, end = self._gram_base - 2, self._gram_base - 1
+        padded = np.concatenate(([begin], codes, [end]))
+        left, right = padded[:-1], padded[1:]
+        known = (left >= 0) & (right >= 0)
+        return np.unique(left[known] * self._gram_base + right[known])
+
+    def lookup(self, term: str, max_distance: int) -> List[Tuple[int, int]]:
+        """返回与term编辑距离不超过max_distance的全部关键词，(关键词id, 编辑距离)，按距离升序"""
+        m = len(term)
+        if not m or not len(self.terms):
+            return []
+        d = max(int(max_distance), 0)
+        min_length, max_length = max(m - d, 1), min(m + d, self.max_length)
+        if min_length > max_length:
+            return []
+        lo, hi = int(self.length_starts[min_length]), int(self.length_starts[max_length + 1])
+        codes = self._encode(term)
+
+        # 计数过滤：统计区间内每个词与查询词共有的二元组数
+        query_grams = self._query_grams(codes)
+        hits = []
+        slots = np.searchsorted(self._grams, query_grams)
+        for gram, slot in zip(query_grams, slots):
+            if slot >= len(self._grams) or self._grams[slot] != gram:
+                continue
+            postings = self._postings[self._gram_starts[slot]:self._gram_starts[slot + 1]]
+            a, b = np.searchsorted(postings, (lo, hi))
+            hits.append(postings[a:b])
+        counts = np.bincount(np.concatenate(hits) - lo, minlength=hi - lo) if hits else np.zeros(hi - lo, np.int64)
+        required = np.maximum(self.lengths[lo:hi], m) + 1 - 2 * d
+        candidates = np.flatnonzero(counts >= required) + lo
+
+        # 验证：按长度分组计算编辑距离
+        matches = []
+        if m <= MAX_PATTERN_LENGTH:
+            peq = np.zeros(len(self.alphabet), dtype=np.uint64)
+            for i, code in enumerate(codes):
+                if code >= 0:
+                    peq[code] |= np.uint64(1 << i)
+        bounds = np.searchsorted(candidates, self.length_starts[min_length:max_length + 2])
+        for length, a, b in zip(range(min_length, max_length + 1), bounds[:-1], bounds[1:]):
+            if a == b:
+                continue
+            positions = candidates[a:b]
+            if m <= MAX_PATTERN_LENGTH:
+                rows = positions - self.length_starts[length]
+                distances = bit_parallel_distance(peq, m, self._codes[length][rows])
+            else:
+                distances = np.array([levenshtein(term, self.terms[self.order[p]]) for p in positions])
+            keep = distances <= d
+            matches.extend(zip(self.order[positions[keep]].tolist(), distances[keep].tolist()))
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
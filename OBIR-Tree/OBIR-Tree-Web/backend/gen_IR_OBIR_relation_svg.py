@@ -8,7 +8,11 @@ IR-OBIR映射关系SVG生成器
 import json
 import sys
 import os
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
+import svg_writer
+from render_cache import render_cache
+from metrics import timed, timed_iter
+from tree_schema import Mapping, MappingDocument, load_annotations, load_mapping, to_builtins
 
 class IR_OBIR_RelationSVGGenerator:
     def __init__(self):
@@ -17,43 +21,38 @@ class IR_OBIR_RelationSVGGenerator:
         self.node_spacing = 50
         self.column_width = 200
         
-    def read_mapping_data(self, mapping_file: str) -> Dict[str, Any]:
-        """从C++生成的映射文件中读取IR-OBIR映射关系"""
+    @timed('ir_obir_relation', 'load')
+    def read_mapping_data(self, mapping_file: str) -> MappingDocument:
+        """从C++生成的映射文件中读取IR-OBIR映射关系（格式或字段类型错误时抛出 SchemaError）"""
         try:
-            with open(mapping_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
+            return load_mapping(mapping_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"映射文件 {mapping_file} 不存在")
-        except json.JSONDecodeError:
-            raise ValueError(f"映射文件 {mapping_file} 格式错误")
     
+    @timed('ir_obir_relation', 'load')
     def read_annotation_data(self, annotation_file: str) -> List[Dict[str, Any]]:
-        """从C++生成的标注文件中读取标注信息"""
+        """从C++生成的标注文件中读取标注信息（校验后以dict列表返回，直接用于JSON响应）"""
         try:
-            with open(annotation_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data.get('annotations', [])
+            return to_builtins(load_annotations(annotation_file).annotations)
         except FileNotFoundError:
             raise FileNotFoundError(f"标注文件 {annotation_file} 不存在")
-        except json.JSONDecodeError:
-            raise ValueError(f"标注文件 {annotation_file} 格式错误")
     
-    def calculate_layout(self, mapping_data: Dict[str, Any]) -> Dict[str, Any]:
+    @timed('ir_obir_relation', 'layout')
+    def calculate_layout(self, mapping_data: MappingDocument) -> Dict[str, Any]:
         """计算映射关系的布局坐标"""
-        ir_nodes = mapping_data.get('ir_nodes', [])
-        obir_nodes = mapping_data.get('obir_nodes', [])
-        mappings = mapping_data.get('mappings', [])
+        ir_nodes = mapping_data.ir_nodes
+        obir_nodes = mapping_data.obir_nodes
+        mappings = mapping_data.mappings
         
         # 计算IR节点布局（左列）
         ir_layout = {}
         for i, node in enumerate(ir_nodes):
             x = 50
             y = 50 + i * self.level_height
-            ir_layout[node['id']] = {
+            ir_layout[node.id] = {
                 'x': x,
                 'y': y,
-                'label': node.get('label', str(node['id'])),
+                'label': node.label if node.label is not None else str(node.id),
                 'type': 'ir'
             }
         
@@ -62,17 +61,22 @@ class IR_OBIR_RelationSVGGenerator:
         for i, node in enumerate(obir_nodes):
             x = 50 + self.column_width
             y = 50 + i * self.level_height
-            obir_layout[node['id']] = {
+            obir_layout[node.id] = {
                 'x': x,
                 'y': y,
-                'label': node.get('label', str(node['id'])),
+                'label': node.label if node.label is not None else str(node.id),
                 'type': 'obir'
             }
         
         return ir_layout, obir_layout, mappings
     
-    def generate_svg(self, ir_layout: Dict[str, Any], obir_layout: Dict[str, Any], mappings: List[Dict[str, Any]]) -> str:
+    @timed('ir_obir_relation', 'render')
+    def generate_svg(self, ir_layout: Dict[str, Any], obir_layout: Dict[str, Any], mappings: List[Mapping]) -> str:
         """生成映射关系SVG字符串"""
+        return svg_writer.render(self.iter_svg(ir_layout, obir_layout, mappings))
+    
+    def iter_svg(self, ir_layout: Dict[str, Any], obir_layout: Dict[str, Any], mappings: List[Mapping]) -> Iterator[str]:
+        """逐段生成映射关系SVG"""
         # 计算SVG尺寸
         all_nodes = {**ir_layout, **obir_layout}
         max_x = max(node['x'] for node in all_nodes.values()) + 100
@@ -83,7 +87,7 @@ class IR_OBIR_RelationSVGGenerator:
         width = max_x - min_x
         height = max_y - min_y
         
-        svg = f'''<svg width="{width}" height="{height}" viewBox="{min_x} {min_y} {width} {height}" xmlns="http://www.w3.org/2000/svg">
+        yield f'''<svg width="{width}" height="{height}" viewBox="{min_x} {min_y} {width} {height}" xmlns="http://www.w3.org/2000/svg">
   <defs>
     <marker id="arrowhead" markerWidth="10" markerHeight="7" refX="9" refY="3.5" orient="auto">
       <polygon points="0 0, 10 3.5, 0 7" fill="#666"/>
@@ -93,51 +97,69 @@ class IR_OBIR_RelationSVGGenerator:
         
         # 绘制映射连线
         for mapping in mappings:
-            ir_node = ir_layout.get(mapping['ir_id'])
-            obir_node = obir_layout.get(mapping['obir_id'])
+            ir_node = ir_layout.get(mapping.ir_id)
+            obir_node = obir_layout.get(mapping.obir_id)
             if ir_node and obir_node:
                 # 计算连线路径（贝塞尔曲线）
                 x1, y1 = ir_node['x'], ir_node['y']
                 x2, y2 = obir_node['x'], obir_node['y']
                 mid_x = (x1 + x2) / 2
                 
-                svg += f'''
+                yield f'''
     <path d="M{x1},{y1} Q{mid_x},{y1} {x2},{y2}" 
           stroke="#42b983" stroke-width="2" fill="none" marker-end="url(#arrowhead)"/>
     <text x="{mid_x}" y="{y1-10}" text-anchor="middle" 
-          font-family="Arial" font-size="10" fill="#666">{mapping.get('label', '')}</text>'''
+          font-family="Arial" font-size="10" fill="#666">{svg_writer.text(mapping.label if mapping.label is not None else '')}</text>'''
         
         # 绘制IR节点（左列）
         for node_id, node in ir_layout.items():
-            svg += f'''
+            yield f'''
     <circle cx="{node['x']}" cy="{node['y']}" r="{self.node_radius}" 
             fill="#1976d2" stroke="#333" stroke-width="2"/>
     <text x="{node['x']}" y="{node['y'] + 5}" text-anchor="middle" 
-          font-family="Arial" font-size="11" fill="#333">{node['label']}</text>'''
+          font-family="Arial" font-size="11" fill="#333">{svg_writer.text(node['label'])}</text>'''
         
         # 绘制OBIR节点（右列）
         for node_id, node in obir_layout.items():
-            svg += f'''
+            yield f'''
     <circle cx="{node['x']}" cy="{node['y']}" r="{self.node_radius}" 
             fill="#7b1fa2" stroke="#333" stroke-width="2"/>
     <text x="{node['x']}" y="{node['y'] + 5}" text-anchor="middle" 
-          font-family="Arial" font-size="11" fill="#333">{node['label']}</text>'''
+          font-family="Arial" font-size="11" fill="#333">{svg_writer.text(node['label'])}</text>'''
         
         # 添加列标题
-        svg += f'''
+        yield f'''
     <text x="50" y="30" text-anchor="middle" 
           font-family="Arial" font-size="14" font-weight="bold" fill="#1976d2">IR-Tree</text>
     <text x="{50 + self.column_width}" y="30" text-anchor="middle" 
           font-family="Arial" font-size="14" font-weight="bold" fill="#7b1fa2">OBIR-Tree</text>'''
         
-        svg += '''
+        yield '''
   </g>
 </svg>'''
-        
-        return svg
     
     def generate_from_files(self, mapping_file: str, annotation_file: str) -> Dict[str, Any]:
-        """从数据文件生成SVG和标注"""
+        """从数据文件生成SVG和标注（按文件版本和布局参数缓存）"""
+        return render_cache.get_or_render(
+            'ir_obir_relation', [mapping_file, annotation_file],
+            lambda: self._render_files(mapping_file, annotation_file),
+            params=vars(self)
+        )
+    
+    def iter_svg_from_files(self, mapping_file: str, annotation_file: str) -> Iterator[str]:
+        """
+        从数据文件流式生成SVG（不含标注）
+        
+        缓存命中时整体输出缓存结果；未命中时直接流式输出，不在内存中拼接整份文档
+        """
+        cached = render_cache.lookup('ir_obir_relation', [mapping_file, annotation_file], params=vars(self))
+        if cached is not None:
+            return iter((cached['svg'],))
+        mapping_data = self.read_mapping_data(mapping_file)
+        ir_layout, obir_layout, mappings = self.calculate_layout(mapping_data)
+        return timed_iter(self.iter_svg(ir_layout, obir_layout, mappings), 'ir_obir_relation', 'render')
+    
+    def _render_files(self, mapping_file: str, annotation_file: str) -> Dict[str, Any]:
         # 读取映射数据
         mapping_data = self.read_mapping_data(mapping_file)
         ir_layout, obir_layout, mappings = self.calculate_layout(mapping_data)
@@ -5,10 +5,16 @@ IR-Tree SVG生成器
 从C++生成的数据文件中读取IR-Tree结构，生成SVG向量图
 """
 
-import json
 import sys
 import os
-from typing import Dict, List, Any
+from functools import partial
+from typing import Dict, Iterator, List, Any
+import svg_writer
+from render_cache import render_cache
+from metrics import timed, timed_iter
+from tree_layout import tidy_layout
+from tree_lod import DEFAULT_LEVELS, get_indexed_tree
+from tree_schema import Edge, TreeDocument, load_tree
 
 class IRTreeSVGGenerator:
     def __init__(self):
@@ -16,50 +22,46 @@ class IRTreeSVGGenerator:
         self.level_height = 80
         self.node_spacing = 60
         
-    def read_tree_data(self, data_file: str) -> Dict[str, Any]:
-        """从C++生成的数据文件中读取IR-Tree结构"""
+    @timed('ir_tree', 'load')
+    def read_tree_data(self, data_file: str) -> TreeDocument:
+        """从C++生成的数据文件中读取IR-Tree结构（格式或字段类型错误时抛出 SchemaError）"""
         try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data
+            return load_tree(data_file)
         except FileNotFoundError:
             raise FileNotFoundError(f"数据文件 {data_file} 不存在")
-        except json.JSONDecodeError:
-            raise ValueError(f"数据文件 {data_file} 格式错误")
     
-    def calculate_layout(self, tree_data: Dict[str, Any]) -> Dict[str, Any]:
+    @timed('ir_tree', 'layout')
+    def calculate_layout(self, tree_data: TreeDocument) -> Dict[str, Any]:
         """计算树形布局的坐标"""
-        nodes = tree_data.get('nodes', [])
-        edges = tree_data.get('edges', [])
+        nodes = tree_data.nodes
+        edges = tree_data.edges
         
-        # 按层级组织节点
-        levels = {}
-        for node in nodes:
-            level = node.get('level', 0)
-            if level not in levels:
-                levels[level] = []
-            levels[level].append(node)
+        # 整齐树布局：父节点位于子节点上方居中，子树之间按轮廓紧凑排列、互不重叠
+        tree = tidy_layout(nodes, edges)
         
-        # 计算每个节点的坐标
+        # 计算每个节点的坐标（整体以x=400居中）
         layout = {}
-        for level, level_nodes in levels.items():
-            y = level * self.level_height + 50
-            total_width = (len(level_nodes) - 1) * self.node_spacing
-            start_x = 400 - total_width / 2  # 居中
-            
-            for i, node in enumerate(level_nodes):
-                x = start_x + i * self.node_spacing
-                layout[node['id']] = {
-                    'x': x,
-                    'y': y,
-                    'label': node.get('label', str(node['id'])),
-                    'type': node.get('type', 'node')
-                }
+        for node in nodes:
+            node_id = node.id
+            layout[node_id] = {
+                'x': 400 + (tree.x[node_id] - tree.width / 2) * self.node_spacing,
+                'y': tree.depth[node_id] * self.level_height + 50,
+                'label': node.label if node.label is not None else str(node_id),
+                'type': node.type if node.type is not None else 'node'
+            }
+            if node.type == 'collapsed':
+                layout[node_id]['collapsed_of'] = node.collapsed_of
+                layout[node_id]['hidden_depth'] = node.hidden_depth
         
         return layout, edges
     
-    def generate_svg(self, layout: Dict[str, Any], edges: List[Dict[str, Any]]) -> str:
+    @timed('ir_tree', 'render')
+    def generate_svg(self, layout: Dict[str, Any], edges: List[Edge]) -> str:
         """生成SVG字符串"""
+        return svg_writer.render(self.iter_svg(layout, edges))
+    
+    def iter_svg(self, layout: Dict[str, Any], edges: List[Edge]) -> Iterator[str]:
+        """逐段生成SVG"""
         # 计算SVG尺寸
         max_x = max(node['x'] for node in layout.values()) + 50
         max_y = max(node['y'] for node in layout.values()) + 50
@@ -70,7 +72,7 @@ class IRTreeSVGGenerator:
         height = max_y - min_y
         
         # 确保viewBox从0开始，避免负坐标
-        svg = f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
+        yield f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
   <defs>
     <marker id="arrowhead" markerWidth="10" markerHeight="7" refX="9" refY="3.5" orient="auto">
       <polygon points="0 0, 10 3.5, 0 7" fill="#666"/>
@@ -80,15 +82,27 @@ class IRTreeSVGGenerator:
         
         # 绘制边
         for edge in edges:
-            from_node = layout.get(edge['from'])
-            to_node = layout.get(edge['to'])
+            from_node = layout.get(edge.source)
+            to_node = layout.get(edge.target)
             if from_node and to_node:
-                svg += f'''
+                yield f'''
     <line x1="{from_node['x']}" y1="{from_node['y']}" x2="{to_node['x']}" y2="{to_node['y']}" 
           stroke="#666" stroke-width="2" marker-end="url(#arrowhead)"/>'''
         
         # 绘制节点
         for node_id, node in layout.items():
+            if node['type'] == 'collapsed':
+                # 折叠的子树：点击后由前端请求该节点的子树
+                yield f'''
+    <g class="collapsed-subtree" data-node-id="{svg_writer.attr(node['collapsed_of'])}" style="cursor: pointer">
+      <title>{svg_writer.text(f"{node['label'][1:]} 个节点，深 {node['hidden_depth']} 层，点击展开")}</title>
+      <rect x="{node['x'] - self.node_radius}" y="{node['y'] - self.node_radius * 0.6}" width="{self.node_radius * 2}" height="{self.node_radius * 1.2}" rx="6" 
+            fill="#f5f5f5" stroke="#999" stroke-width="1.5" stroke-dasharray="4 2"/>
+      <text x="{node['x']}" y="{node['y'] + 4}" text-anchor="middle" 
+            font-family="Arial" font-size="11" fill="#666">{svg_writer.text(node['label'])}</text>
+    </g>'''
+                continue
+            
             # 根据节点类型选择颜色
             if node['type'] == 'root':
                 fill_color = '#42b983'
@@ -97,20 +111,56 @@ class IRTreeSVGGenerator:
             else:
                 fill_color = '#4ecdc4'
             
-            svg += f'''
+            yield f'''
     <circle cx="{node['x']}" cy="{node['y']}" r="{self.node_radius}" 
             fill="{fill_color}" stroke="#333" stroke-width="2"/>
     <text x="{node['x']}" y="{node['y'] + 5}" text-anchor="middle" 
-          font-family="Arial" font-size="12" fill="#333">{node['label']}</text>'''
+          font-family="Arial" font-size="12" fill="#333">{svg_writer.text(node['label'])}</text>'''
         
-        svg += '''
+        yield '''
   </g>
 </svg>'''
-        
-        return svg
     
     def generate_from_file(self, data_file: str) -> str:
-        """从数据文件生成SVG"""
+        """从数据文件生成SVG（按文件版本和布局参数缓存）"""
+        return render_cache.get_or_render(
+            'ir_tree', [data_file],
+            partial(self._render_file, data_file),
+            params=vars(self), offload=True
+        )
+    
+    def iter_from_file(self, data_file: str) -> Iterator[str]:
+        """
+        从数据文件流式生成SVG
+        
+        缓存命中时整体输出缓存结果；未命中时直接流式输出，不在内存中拼接整份文档。
+        数据读取和布局在调用时立即完成，错误不会延迟到流式输出过程中
+        """
+        cached = render_cache.lookup('ir_tree', [data_file], params=vars(self))
+        if cached is not None:
+            return iter((cached,))
+        tree_data = self.read_tree_data(data_file)
+        layout, edges = self.calculate_layout(tree_data)
+        return timed_iter(self.iter_svg(layout, edges), 'ir_tree', 'render')
+    
+    def generate_lod_from_file(self, data_file: str, levels: int = DEFAULT_LEVELS, root_id=None) -> str:
+        """
+        分层细节渲染：只画从root_id（默认整棵树）开始的前levels层，更深的子树折叠为占位节点
+
+        树索引按文件常驻内存，渲染开销只与可见部分有关
+        """
+        return render_cache.get_or_render(
+            'ir_tree_lod', [data_file],
+            partial(self._render_lod, data_file, levels, root_id),
+            params={**vars(self), 'levels': levels, 'root': root_id}, offload=True
+        )
+    
+    def _render_lod(self, data_file: str, levels: int, root_id) -> str:
+        tree = get_indexed_tree(data_file)
+        layout, edges = self.calculate_layout(tree.truncate(root_id, levels))
+        return self.generate_svg(layout, edges)
+    
+    def _render_file(self, data_file: str) -> str:
         tree_data = self.read_tree_data(data_file)
         layout, edges = self.calculate_layout(tree_data)
         return self.generate_svg(layout, edges)
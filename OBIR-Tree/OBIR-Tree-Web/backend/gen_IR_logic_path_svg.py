@@ -5,54 +5,56 @@ IR-Tree逻辑路径SVG生成器
 用于生成显示IR-Tree逻辑路径的SVG图像，突出显示查询路径
 """
 
-import json
 import os
 import sys
-from typing import Dict, List, Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
+import svg_writer
+from render_cache import render_cache
+from metrics import phase_timer, timed, timed_iter
+from tree_layout import tidy_layout
+from tree_schema import NodeId, SchemaError, TreeDocument, load_tree
 
-def load_logic_path_data(data_file: str) -> Dict:
+@timed('ir_logic_path', 'load')
+def load_logic_path_data(data_file: str) -> Optional[TreeDocument]:
     """加载逻辑路径数据"""
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return load_tree(data_file)
     except FileNotFoundError:
         print(f"错误: 找不到数据文件 {data_file}")
-        return {}
-    except json.JSONDecodeError as e:
-        print(f"错误: JSON解析失败 {e}")
-        return {}
+        return None
+    except SchemaError as e:
+        print(f"错误: {e}")
+        return None
 
-def calculate_node_position(level: int, index: int, total_nodes: int, width: int, height: int) -> Tuple[int, int]:
-    """计算节点位置"""
-    x = 50 + (width - 100) * index / max(1, total_nodes - 1)
-    y = 50 + (height - 100) * level / 3  # 假设最多4层
+def calculate_node_position(x: float, depth: int, max_x: float, max_depth: int, width: int, height: int) -> Tuple[int, int]:
+    """把整齐树布局的单位坐标缩放到画布内"""
+    x = 50 + (width - 100) * x / max(1, max_x)
+    y = 50 + (height - 100) * depth / max(1, max_depth)
     return int(x), int(y)
 
-def generate_svg(tree_data: Dict, logic_path: List[str], width: int = 800, height: int = 600) -> str:
+@timed('ir_logic_path', 'render')
+def generate_svg(tree_data: TreeDocument, logic_path: List[NodeId], width: int = 800, height: int = 600) -> str:
     """生成SVG图像"""
+    return svg_writer.render(iter_svg(tree_data, logic_path, width, height))
+
+def iter_svg(tree_data: TreeDocument, logic_path: List[NodeId], width: int = 800, height: int = 600) -> Iterator[str]:
+    """逐段生成SVG图像"""
     # 提取树结构
-    nodes = tree_data.get('nodes', [])
-    edges = tree_data.get('edges', [])
+    nodes = tree_data.nodes
+    edges = tree_data.edges
     
-    # 创建节点位置映射
-    node_positions = {}
-    level_nodes = {}
+    # 路径节点集合，避免逐个节点在列表中查找
+    path_set = set(logic_path)
     
-    # 按层级组织节点
+    # 整齐树布局后缩放到画布
+    tree = tidy_layout(nodes, edges)
+    node_positions = {}
     for node in nodes:
-        level = node.get('level', 0)
-        if level not in level_nodes:
-            level_nodes[level] = []
-        level_nodes[level].append(node)
-    
-    # 计算每个节点的位置
-    for level, level_node_list in level_nodes.items():
-        for i, node in enumerate(level_node_list):
-            x, y = calculate_node_position(level, i, len(level_node_list), width, height)
-            node_positions[node['id']] = (x, y)
+        node_positions[node.id] = calculate_node_position(
+            tree.x[node.id], tree.depth[node.id], tree.max_x, tree.max_depth, width, height)
     
     # 生成SVG内容
-    svg_content = f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
+    yield f'''<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
   <defs>
     <marker id="arrowhead" markerWidth="10" markerHeight="7" refX="9" refY="3.5" orient="auto">
       <polygon points="0 0, 10 3.5, 0 7" fill="#666" />
@@ -79,23 +81,23 @@ def generate_svg(tree_data: Dict, logic_path: List[str], width: int = 800, heigh
     
     # 绘制边
     for edge in edges:
-        start_id = edge.get('from')
-        end_id = edge.get('to')
+        start_id = edge.source
+        end_id = edge.target
         
         if start_id in node_positions and end_id in node_positions:
             x1, y1 = node_positions[start_id]
             x2, y2 = node_positions[end_id]
             
             # 检查是否在逻辑路径中
-            is_in_path = (start_id in logic_path and end_id in logic_path)
+            is_in_path = (start_id in path_set and end_id in path_set)
             
             stroke_color = "#ff6b6b" if is_in_path else "#666"
             stroke_width = "3" if is_in_path else "1"
             
-            svg_content += f'''
+            yield f'''
     <line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="{stroke_color}" stroke-width="{stroke_width}" marker-end="url(#arrowhead)"/>'''
     
-    svg_content += '''
+    yield '''
   </g>
   
   <!-- 绘制节点 -->
@@ -103,14 +105,14 @@ def generate_svg(tree_data: Dict, logic_path: List[str], width: int = 800, heigh
     
     # 绘制节点
     for node in nodes:
-        node_id = node['id']
+        node_id = node.id
         if node_id in node_positions:
             x, y = node_positions[node_id]
-            name = node.get('name', node_id)
-            level = node.get('level', 0)
+            name = node.name if node.name is not None else node_id
+            level = node.level or 0
             
             # 检查是否在逻辑路径中
-            is_in_path = node_id in logic_path
+            is_in_path = node_id in path_set
             
             # 节点样式
             if is_in_path:
@@ -124,18 +126,18 @@ def generate_svg(tree_data: Dict, logic_path: List[str], width: int = 800, heigh
                 stroke_width = "2"
                 filter_attr = ""
             
-            # 节点大小根据层级调整
-            radius = 25 - level * 3
+            # 节点大小根据层级调整（深层节点保持最小尺寸）
+            radius = max(25 - level * 3, 6)
             
-            svg_content += f'''
+            yield f'''
     <circle cx="{x}" cy="{y}" r="{radius}" fill="{fill_color}" stroke="{stroke_color}" stroke-width="{stroke_width}" {filter_attr}/>'''
             
             # 节点标签
-            font_size = 12 - level * 1
-            svg_content += f'''
-    <text x="{x}" y="{y + 5}" text-anchor="middle" font-family="Arial, sans-serif" font-size="{font_size}" fill="white" font-weight="bold">{name}</text>'''
+            font_size = max(12 - level * 1, 6)
+            yield f'''
+    <text x="{x}" y="{y + 5}" text-anchor="middle" font-family="Arial, sans-serif" font-size="{font_size}" fill="white" font-weight="bold">{svg_writer.text(name)}</text>'''
     
-    svg_content += '''
+    yield f'''
   </g>
   
   <!-- 图例 -->
@@ -148,8 +150,28 @@ def generate_svg(tree_data: Dict, logic_path: List[str], width: int = 800, heigh
     <text x="45" y="55" font-family="Arial, sans-serif" font-size="11" fill="#333">逻辑路径节点</text>
   </g>
 </svg>'''
+
+def generate_svg_from_file(data_file: str, width: int = 800, height: int = 600) -> str:
+    """从数据文件生成逻辑路径SVG（按文件版本和画布尺寸缓存）"""
+    def render() -> str:
+        with phase_timer('ir_logic_path', 'load'):
+            tree_data = load_tree(data_file)
+        return generate_svg(tree_data, tree_data.logic_path, width, height)
+    
+    return render_cache.get_or_render('ir_logic_path', [data_file], render, params=(width, height))
+
+def iter_svg_from_file(data_file: str, width: int = 800, height: int = 600) -> Iterator[str]:
+    """
+    从数据文件流式生成逻辑路径SVG
     
-    return svg_content
+    缓存命中时整体输出缓存结果；未命中时直接流式输出，不在内存中拼接整份文档
+    """
+    cached = render_cache.lookup('ir_logic_path', [data_file], params=(width, height))
+    if cached is not None:
+        return iter((cached,))
+    with phase_timer('ir_logic_path', 'load'):
+        tree_data = load_tree(data_file)
+    return timed_iter(iter_svg(tree_data, tree_data.logic_path, width, height), 'ir_logic_path', 'render')
 
 def main():
     """主函数"""
@@ -161,11 +183,11 @@ def main():
     
     # 加载数据
     tree_data = load_logic_path_data(data_file)
-    if not tree_data:
+    if tree_data is None:
         sys.exit(1)
     
     # 获取逻辑路径
-    logic_path = tree_data.get('logic_path', [])
+    logic_path = tree_data.logic_path
     
     # 生成SVG
     svg_content = generate_svg(tree_data, logic_path)
@@ -5,120 +5,230 @@ OBIR-Tree实时路径展示SVG生成器
 支持横向绘制OBIR-Tree结构，并标注前后差异
 """
 
-import json
 import os
-from typing import Dict, List, Tuple, Optional
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+import svg_writer
+from render_cache import render_cache
+from metrics import timed
+from tree_diff import TreeIndex, diff_trees, load_tree_index, snapshot_digest
+from tree_layout import TreeLayout, pack_layout, tidy_layout, unpack_layout
+from tree_lod import IndexedTree, changed_ancestors, get_indexed_tree
+from tree_schema import Node, TreeDocument
+
+# 记住最近多少个快照实际绘制的布局（下一帧以此为锚点）及其总字节数上限
+PLACEMENT_CACHE_SIZE = 8
+PLACEMENT_CACHE_BYTES = 32 * 1024 * 1024
 
 class OBIRTreeRealtimeSVGGenerator:
+    # 快照内容摘要, levels, root_id -> (布局签名, pack_layout 序列化的布局)：该快照作为当前快照时实际绘制的布局；
+    # 在调用进程中保存（渲染可能在渲染进程中执行），不放入渲染缓存；
+    # 同一快照只记录第一次的布局，使后续各帧的锚点保持不变
+    _placements = OrderedDict()
+    _placements_bytes = 0
+    _placements_lock = threading.Lock()
+
     def __init__(self):
         self.node_width = 120
         self.node_height = 60
         self.level_height = 100
         self.node_margin = 20
         
-    def generate_from_files(self, current_data_file: str, previous_data_file: str = None) -> Dict:
+    def generate_from_files(self, current_data_file: str, previous_data_file: str = None,
+                            levels: Optional[int] = None, root_id=None) -> Dict:
         """
         从文件生成OBIR-Tree实时SVG
         
         Args:
             current_data_file: 当前树结构数据文件路径
             previous_data_file: 前一时刻树结构数据文件路径（可选）
+            levels: 分层细节模式下绘制的层数，更深的子树折叠为占位节点；None为绘制全部节点
+            root_id: 分层细节模式下从该节点的子树开始绘制（默认整棵树）
             
         Returns:
-            包含SVG内容和差异信息的字典
+            包含SVG内容和差异信息的字典（成功结果按文件版本缓存）；
+            布局以前一时刻快照上次实际绘制的布局为锚点，未变化的子树在相邻两帧中位置相同
         """
         try:
-            # 读取当前数据
-            with open(current_data_file, 'r', encoding='utf-8') as f:
-                current_data = json.load(f)
-            
-            # 读取前一时刻数据（如果存在）
-            previous_data = None
-            if previous_data_file and os.path.exists(previous_data_file):
-                with open(previous_data_file, 'r', encoding='utf-8') as f:
-                    previous_data = json.load(f)
-            
-            # 计算差异
-            differences = self._calculate_differences(current_data, previous_data)
-            
-            # 生成SVG
-            svg_content = self._generate_svg(current_data, differences)
-            
+            current_key = (snapshot_digest(current_data_file), levels, root_id)
+            signature, anchor = self._anchor(previous_data_file, levels, root_id)
+            params = vars(self) if levels is None else {**vars(self), 'levels': levels, 'root': root_id}
+            params = {**params, 'anchor': signature}
+            return render_cache.get_or_render(
+                'obir_tree_realtime', [current_data_file, previous_data_file],
+                partial(self._render_files, current_data_file, previous_data_file, levels, root_id, anchor),
+                params=params, offload=True, finish=partial(self._remember, current_key)
+            )
+        except Exception as e:
             return {
-                'success': True,
-                'svg': svg_content,
-                'differences': differences,
-                'current_nodes': len(current_data.get('nodes', [])),
-                'previous_nodes': len(previous_data.get('nodes', [])) if previous_data else 0
+                'success': False,
+                'error': str(e)
             }
+    
+    def generate_from_snapshots(self, current: TreeDocument, previous: Optional[TreeDocument], version_key,
+                                levels: Optional[int] = None, root_id=None) -> Dict:
+        """
+        从内存中的快照生成OBIR-Tree实时SVG（用于快照历史中任意两个版本的比较）
+        
+        Args:
+            current/previous: 新、旧两个版本的快照，previous为None时只绘制current
+            version_key: 标识这两个版本内容的可哈希值（如两个版本的摘要），用作渲染缓存键
+            levels/root_id: 同 generate_from_files
             
+        Returns:
+            与 generate_from_files 相同格式的字典
+        """
+        try:
+            return render_cache.get_or_render(
+                'obir_tree_history', [],
+                lambda: self._render_indexes(TreeIndex(current), TreeIndex(previous) if previous is not None else None,
+                                             levels, root_id)[0],
+                params={**vars(self), 'versions': version_key, 'levels': levels, 'root': root_id}
+            )
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def _calculate_differences(self, current_data: Dict, previous_data: Optional[Dict]) -> Dict:
-        """计算树结构差异"""
-        if not previous_data:
-            return {
-                'added': [],
-                'removed': [],
-                'modified': []
-            }
-        
-        current_nodes = {node['id']: node for node in current_data.get('nodes', [])}
-        previous_nodes = {node['id']: node for node in previous_data.get('nodes', [])}
-        
-        added = []
-        removed = []
-        modified = []
-        
-        # 找出新增的节点
-        for node_id, node in current_nodes.items():
-            if node_id not in previous_nodes:
-                added.append(node_id)
+    def _anchor(self, previous_data_file: Optional[str], levels: Optional[int], root_id):
+        """前一时刻快照作为当前快照时实际绘制的布局 (签名, 序列化的布局)，未记录过时返回 (None, None)"""
+        if not previous_data_file or not os.path.exists(previous_data_file):
+            return None, None
+        key = (snapshot_digest(previous_data_file), levels, root_id)
+        with self._placements_lock:
+            return self._placements.get(key, (None, None))
+
+    @classmethod
+    def _remember(cls, key, result: Dict) -> Dict:
+        """取出渲染结果中的布局记入 _placements，返回不含布局的结果（写入渲染缓存）"""
+        placement = result.get('placement')
+        if placement is None:
+            return result
+        with cls._placements_lock:
+            if key not in cls._placements:
+                cls._placements[key] = placement
+                cls._placements_bytes += len(placement[1])
+            cls._placements.move_to_end(key)
+            while len(cls._placements) > 1 and (len(cls._placements) > PLACEMENT_CACHE_SIZE or
+                                                cls._placements_bytes > PLACEMENT_CACHE_BYTES):
+                cls._placements_bytes -= len(cls._placements.popitem(last=False)[1][1])
+        return {name: value for name, value in result.items() if name != 'placement'}
+
+    def _render_files(self, current_data_file: str, previous_data_file: Optional[str],
+                      levels: Optional[int] = None, root_id=None, anchor: Optional[bytes] = None) -> Dict:
+        """
+        读取快照文件、计算差异并生成SVG，异常由调用方处理
+
+        anchor 为 pack_layout 序列化的前一时刻快照的布局；结果中的 placement 为本帧实际绘制的布局（签名, 序列化的布局）
+        """
+        # 读取快照并建立结构索引（按文件内容缓存，轮换后的previous可复用上一轮的索引）
+        current_tree = get_indexed_tree(current_data_file) if levels is not None else None
+        current_index = current_tree.index if current_tree else load_tree_index(current_data_file)
+        previous_index = None
+        previous_tree = None
+        if previous_data_file and os.path.exists(previous_data_file):
+            previous_tree = get_indexed_tree(previous_data_file) if levels is not None else None
+            previous_index = previous_tree.index if previous_tree else load_tree_index(previous_data_file)
+        tree = unpack_layout(anchor) if anchor is not None else None
+        result, placed = self._render_indexes(current_index, previous_index, levels, root_id, current_tree,
+                                              previous_tree, tree)
+        return {**result, 'placement': (placed.signature, pack_layout(placed))}
+    
+    def _render_indexes(self, current_index: TreeIndex, previous_index: Optional[TreeIndex],
+                        levels: Optional[int] = None, root_id=None,
+                        current_tree: Optional[IndexedTree] = None,
+                        previous_tree: Optional[IndexedTree] = None,
+                        anchor: Optional[TreeLayout] = None) -> Tuple[Dict, TreeLayout]:
+        """
+        计算两个快照索引的差异并生成SVG；分层细节模式下未给出的 IndexedTree 就地建立
+
+        返回 (结果, 实际绘制的布局)，布局作为下一帧的锚点，不放入结果（结果会写入渲染缓存）
+        """
+        # 计算差异
+        differences = diff_trees(current_index, previous_index)
         
-        # 找出删除的节点
-        for node_id, node in previous_nodes.items():
-            if node_id not in current_nodes:
-                removed.append(node_id)
+        current_data = current_index.data
+        previous_data = previous_index.data if previous_index else None
+        if levels is not None:
+            # 分层细节：只绘制前levels层，含有变化的折叠子树单独标出
+            current_tree = current_tree or IndexedTree(current_index)
+            current_data = current_tree.truncate(root_id, levels)
+            if previous_data is not None:
+                previous_tree = previous_tree or IndexedTree(previous_index)
+                root = root_id if root_id is not None and root_id in previous_tree.index.nodes else None
+                previous_data = previous_tree.truncate(root, levels)
+            marked = self._collapsed_changes(current_index, differences)
+            for node in current_data.nodes:
+                if node.type == 'collapsed':
+                    node.changed = node.collapsed_of in marked
         
-        # 找出修改的节点
-        for node_id in current_nodes:
-            if node_id in previous_nodes:
-                current_node = current_nodes[node_id]
-                previous_node = previous_nodes[node_id]
-                if (current_node.get('value') != previous_node.get('value') or
-                    current_node.get('status') != previous_node.get('status')):
-                    modified.append(node_id)
+        # 生成SVG（布局放在前一时刻快照的坐标系中，未变化的子树保持原位）
+        tree = self._place(current_data, previous_data, anchor)
+        svg_content = self._generate_svg(current_data, differences, tree)
         
         return {
-            'added': added,
-            'removed': removed,
-            'modified': modified
-        }
+            'success': True,
+            'svg': svg_content,
+            'differences': differences,
+            'current_nodes': len(current_index.nodes),
+            'previous_nodes': len(previous_index.nodes) if previous_index else 0
+        }, tree
+    
+    @staticmethod
+    def _collapsed_changes(index: TreeIndex, differences: Dict) -> set:
+        """子树中含有新增、修改、移入节点或删除了子节点的节点"""
+        changed = list(differences['added']) + list(differences['modified'])
+        changed.extend(item['id'] for item in differences['moved'])
+        parents = [edge['from'] for edge in differences['edges_removed'] if edge['from'] in index.nodes]
+        return changed_ancestors(index, changed + parents) | set(parents)
     
-    def _generate_svg(self, data: Dict, differences: Dict) -> str:
-        """生成OBIR-Tree的SVG"""
-        nodes = data.get('nodes', [])
-        edges = data.get('edges', [])
+    @timed('obir_realtime', 'layout')
+    def _place(self, data: TreeDocument, previous_data: Optional[TreeDocument] = None,
+               anchor: Optional[TreeLayout] = None) -> TreeLayout:
+        """
+        计算整齐树布局：布局按树结构和锚点缓存，只有节点内容变化的帧直接复用
+
+        anchor 为前一时刻快照实际绘制的布局；未给出时以前一时刻快照自身的整齐树布局为锚点
+        """
+        if anchor is None and previous_data:
+            anchor = tidy_layout(previous_data.nodes, previous_data.edges)
+        return tidy_layout(data.nodes, data.edges, anchor)
+
+    @timed('obir_realtime', 'render')
+    def _generate_svg(self, data: TreeDocument, differences: Dict, tree: TreeLayout) -> str:
+        """按 _place 的布局生成OBIR-Tree的SVG"""
+        return svg_writer.render(self._iter_svg(data, differences, tree))
+    
+    def _iter_svg(self, data: TreeDocument, differences: Dict, tree: TreeLayout) -> Iterator[str]:
+        """逐段生成OBIR-Tree的SVG"""
+        nodes = data.nodes
+        edges = data.edges
         
         if not nodes:
-            return '<svg width="400" height="200" xmlns="http://www.w3.org/2000/svg"><text x="200" y="100" text-anchor="middle" fill="#666">暂无数据</text></svg>'
+            yield '<svg width="400" height="200" xmlns="http://www.w3.org/2000/svg"><text x="200" y="100" text-anchor="middle" fill="#666">暂无数据</text></svg>'
+            return
+        
+        # 差异节点集合，逐节点判断样式时O(1)查找
+        added = set(differences['added'])
+        removed = set(differences['removed'])
+        modified = set(differences['modified'])
         
         # 计算布局
-        layout = self._calculate_layout(nodes, edges)
+        layout = self._calculate_layout(nodes, tree)
         
-        # 计算SVG尺寸
+        # 计算SVG尺寸：锚定的布局可能在上一帧的上方新增节点（y为负），视口原点随之上移
         max_x = max(layout[node_id]['x'] for node_id in layout) + self.node_width
         max_y = max(layout[node_id]['y'] for node_id in layout) + self.node_height
+        top = min(0, min(layout[node_id]['y'] for node_id in layout) - 50)
         width = max_x + 50
-        height = max_y + 50
+        height = max_y + 50 - top
         
         # 生成SVG内容
-        svg_parts = [
-            f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">',
+        yield '\n'.join([
+            f'<svg width="{width}" height="{height}" viewBox="0 {top} {width} {height}" xmlns="http://www.w3.org/2000/svg">',
             '  <defs>',
             '    <filter id="glow" x="-50%" y="-50%" width="200%" height="200%">',
             '      <feGaussianBlur stdDeviation="3" result="coloredBlur"/>',
@@ -133,16 +243,19 @@ class OBIRTreeRealtimeSVGGenerator:
             '    .node-added { fill: #4CAF50; stroke: #2E7D32; stroke-width: 3; filter: url(#glow); }',
             '    .node-removed { fill: #F44336; stroke: #D32F2F; stroke-width: 2; opacity: 0.6; }',
             '    .node-modified { fill: #FF9800; stroke: #F57C00; stroke-width: 3; }',
+            '    .node-collapsed { fill: #f5f5f5; stroke: #999; stroke-width: 2; stroke-dasharray: 6 3; cursor: pointer; }',
+            '    .node-collapsed-changed { fill: #FFF3E0; stroke: #F57C00; stroke-width: 2; stroke-dasharray: 6 3; cursor: pointer; }',
+            '    .text-collapsed { fill: #666; font-family: Arial, sans-serif; font-size: 12px; text-anchor: middle; }',
             '    .edge { stroke: #666; stroke-width: 2; fill: none; }',
             '    .text { fill: white; font-family: Arial, sans-serif; font-size: 12px; text-anchor: middle; }',
             '    .legend { fill: #333; font-family: Arial, sans-serif; font-size: 14px; }',
             '  </style>'
-        ]
+        ])
         
         # 绘制边
         for edge in edges:
-            start_node = layout.get(edge['from'])
-            end_node = layout.get(edge['to'])
+            start_node = layout.get(edge.source)
+            end_node = layout.get(edge.target)
             if start_node and end_node:
                 x1 = start_node['x'] + self.node_width
                 y1 = start_node['y'] + self.node_height // 2
@@ -152,34 +265,45 @@ class OBIRTreeRealtimeSVGGenerator:
                 # 创建曲线路径
                 control_x = (x1 + x2) // 2
                 path = f'M {x1} {y1} Q {control_x} {y1} {x2} {y2}'
-                svg_parts.append(f'    <path d="{path}" class="edge"/>')
+                yield f'\n    <path d="{path}" class="edge"/>'
         
         # 绘制节点
         for node in nodes:
-            node_id = node['id']
+            node_id = node.id
             pos = layout[node_id]
             x = pos['x']
             y = pos['y']
             
+            if node.type == 'collapsed':
+                # 折叠的子树：点击后由前端请求该节点的子树
+                node_class = 'node-collapsed-changed' if node.changed else 'node-collapsed'
+                title = f"{node.hidden_count} 个节点，深 {node.hidden_depth} 层，点击展开"
+                yield (f'\n    <g class="collapsed-subtree" data-node-id="{svg_writer.attr(node.collapsed_of)}">'
+                       f'<title>{svg_writer.text(title)}</title>'
+                       f'<rect x="{x}" y="{y}" width="{self.node_width}" height="{self.node_height}" rx="8" class="{node_class}"/>'
+                       f'<text x="{x + self.node_width // 2}" y="{y + self.node_height // 2 + 4}" class="text-collapsed">'
+                       f'{svg_writer.text(node.label)}</text></g>')
+                continue
+            
             # 确定节点样式
             node_class = 'node'
-            if node_id in differences['added']:
+            if node_id in added:
                 node_class = 'node-added'
-            elif node_id in differences['removed']:
+            elif node_id in removed:
                 node_class = 'node-removed'
-            elif node_id in differences['modified']:
+            elif node_id in modified:
                 node_class = 'node-modified'
             
             # 绘制节点矩形
-            svg_parts.append(f'    <rect x="{x}" y="{y}" width="{self.node_width}" height="{self.node_height}" rx="8" class="{node_class}"/>')
+            yield f'\n    <rect x="{x}" y="{y}" width="{self.node_width}" height="{self.node_height}" rx="8" class="{node_class}"/>'
             
             # 绘制节点文本
             text_x = x + self.node_width // 2
             text_y = y + self.node_height // 2 + 4
-            svg_parts.append(f'    <text x="{text_x}" y="{text_y}" class="text">{node.get("value", node_id)}</text>')
+            yield f'\n    <text x="{text_x}" y="{text_y}" class="text">{svg_writer.text(node.value if node.value is not None else node_id)}</text>'
         
         # 绘制图例
-        legend_y = height - 30
+        legend_y = top + height - 30
         legend_items = [
             ('正常节点', '#4CAF50', 10),
             ('新增节点', '#4CAF50', 110),
@@ -188,37 +312,25 @@ class OBIRTreeRealtimeSVGGenerator:
         ]
         
         for text, color, x in legend_items:
-            svg_parts.append(f'    <rect x="{x}" y="{legend_y}" width="15" height="15" fill="{color}" rx="3"/>')
-            svg_parts.append(f'    <text x="{x + 20}" y="{legend_y + 12}" class="legend">{text}</text>')
-        
-        svg_parts.append('</svg>')
+            yield f'\n    <rect x="{x}" y="{legend_y}" width="15" height="15" fill="{color}" rx="3"/>'
+            yield f'\n    <text x="{x + 20}" y="{legend_y + 12}" class="legend">{text}</text>'
         
-        return '\n'.join(svg_parts)
+        yield '\n</svg>'
     
-    def _calculate_layout(self, nodes: List[Dict], edges: List[Dict]) -> Dict:
-        """计算节点布局（横向）"""
+    def _calculate_layout(self, nodes: List[Node], tree: TreeLayout) -> Dict:
+        """
+        节点像素位置（横向）：深度决定列，整齐树布局决定行
+
+        直接使用布局坐标（不按最小值归一化），相邻两帧中位置相同的节点绘制在同一位置
+        """
         layout = {}
-        
-        # 按层级分组节点
-        levels = {}
+        column_width = self.node_width + self.level_height
+        row_height = self.node_height + self.node_margin
         for node in nodes:
-            level = node.get('level', 0)
-            if level not in levels:
-                levels[level] = []
-            levels[level].append(node)
-        
-        # 计算每个节点的位置
-        for level in sorted(levels.keys()):
-            level_nodes = levels[level]
-            y = level * self.level_height + 50
-            
-            # 计算该层级节点的水平分布
-            total_width = len(level_nodes) * (self.node_width + self.node_margin) - self.node_margin
-            start_x = 50
-            
-            for i, node in enumerate(level_nodes):
-                x = start_x + i * (self.node_width + self.node_margin)
-                layout[node['id']] = {'x': x, 'y': y}
+            node_id = node.id
+            x = 50 + tree.depth[node_id] * column_width
+            y = 50 + tree.x[node_id] * row_height
+            layout[node_id] = {'x': x, 'y': y}
         
         return layout
 
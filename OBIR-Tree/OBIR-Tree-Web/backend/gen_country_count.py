@@ -1,44 +1,201 @@
-import reverse_geocoder as rg
+import argparse
+import hashlib
 import json
-import pycountry
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
-def iso_to_country_name(iso):
+import numpy as np
+
+from country_polygons import WORLD_PATH, load_country_index
+
+# 每个任务处理的字节数（按行边界切分）
+CHUNK_BYTES = 8 * 1024 * 1024
+# 用于识别源文件是否被整体替换的文件头长度
+HEAD_BYTES = 4096
+# 版本2起按 world.json 边界做点包含判断，计数以国家名称为键
+CHECKPOINT_VERSION = 2
+
+DATA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public/mock/data.txt'))
+OUT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public/mock/country_count.json'))
+
+def _init_worker(world_path=WORLD_PATH):
+    """每个工作进程只建立一次边界索引"""
+    load_country_index(world_path)
+
+def _floats(tokens):
+    return np.fromiter(map(float, tokens), dtype=np.float64, count=len(tokens))
+
+def parse_coords(block):
+    """
+    解析 `id name lat lng` 行的纬度、经度两列，跳过列数不是4或坐标不是数字的行
+
+    整块按空白切分后，用字节数组算出每个词所在的行，只取恰好4个词的行，不再逐行切分
+    """
+    tokens = block.split()
+    data = np.frombuffer(block, dtype=np.uint8)
+    # 与 bytes.split() 相同的空白字符：空格和 \t \n \v \f \r
+    space = (data == 32) | (data - np.uint8(9) <= 4)
+    starts = np.flatnonzero(~space[1:] & space[:-1]) + 1
+    if len(data) and not space[0]:
+        starts = np.concatenate(([0], starts))
+    token_line = np.searchsorted(np.flatnonzero(data == 10), starts)
+    valid = np.bincount(token_line)[token_line] == 4 if len(tokens) else np.zeros(0, dtype=bool)
+    if valid.all():
+        lat, lng = tokens[2::4], tokens[3::4]
+    else:
+        rows = np.flatnonzero(valid).reshape(-1, 4)
+        lat = [tokens[i] for i in rows[:, 2].tolist()]
+        lng = [tokens[i] for i in rows[:, 3].tolist()]
     try:
-        country = pycountry.countries.get(alpha_2=iso)
-        return country.name if country else iso
-    except Exception:
-        return iso
+        return _floats(lat), _floats(lng)
+    except ValueError:
+        pass
+    coords = []
+    for lat_token, lng_token in zip(lat, lng):
+        try:
+            coords.append((float(lat_token), float(lng_token)))
+        except ValueError:
+            continue
+    coords = np.array(coords, dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+def count_chunk(data_path, start, end, world_path=WORLD_PATH):
+    """统计 [start, end) 字节范围内各记录所在的国家，不在任何国家边界内（如海上）的记录不计入"""
+    with open(data_path, 'rb') as f:
+        f.seek(start)
+        block = f.read(end - start)
+    lat, lng = parse_coords(block)
+    if not len(lat):
+        return Counter()
+    return load_country_index(world_path).count(lng, lat)
+
+def split_chunks(data_path, start, end, chunk_bytes=CHUNK_BYTES):
+    """把 [start, end) 按行边界切成约chunk_bytes大小的区间"""
+    chunks = []
+    with open(data_path, 'rb') as f:
+        while start < end:
+            stop = min(start + chunk_bytes, end)
+            if stop < end:
+                f.seek(stop)
+                tail = f.readline()
+                stop = min(stop + len(tail), end)
+            chunks.append((start, stop))
+            start = stop
+    return chunks
+
+def complete_length(data_path, size):
+    """文件中以换行结尾的完整部分长度；正在追加的最后一行留到下次处理"""
+    with open(data_path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            step = min(64 * 1024, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return pos - step + newline + 1
+            pos -= step
+    return 0
+
+def head_digest(data_path, length):
+    with open(data_path, 'rb') as f:
+        return hashlib.blake2b(f.read(length), digest_size=16).hexdigest()
+
+def checkpoint_path(out_path):
+    return os.path.splitext(out_path)[0] + '.checkpoint.json'
+
+def world_signature(world_path):
+    st = os.stat(world_path)
+    return [world_path, st.st_mtime_ns, st.st_size]
+
+def load_checkpoint(path, data_path, world_path=WORLD_PATH):
+    """读取断点；源文件被截断或替换（文件头变化）、或边界文件变化时返回空断点，从头统计"""
+    empty = {'offset': 0, 'counts': {}}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('source') != data_path:
+        return empty
+    if checkpoint.get('world') != world_signature(world_path):
+        return empty
+    offset = checkpoint.get('offset', 0)
+    head_length = checkpoint.get('head_length', 0)
+    if os.path.getsize(data_path) < offset or head_digest(data_path, head_length) != checkpoint.get('head_digest'):
+        return empty
+    return checkpoint
+
+def write_json_atomic(path, value, indent=None):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+def save_checkpoint(path, data_path, offset, counts, world_path=WORLD_PATH):
+    head_length = min(offset, HEAD_BYTES)
+    write_json_atomic(path, {
+        'version': CHECKPOINT_VERSION,
+        'source': data_path,
+        'world': world_signature(world_path),
+        'offset': offset,
+        'head_length': head_length,
+        'head_digest': head_digest(data_path, head_length),
+        'counts': dict(counts)
+    })
+
+def update_country_count(data_path=DATA_PATH, out_path=OUT_PATH, workers=None, full=False, world_path=WORLD_PATH):
+    """
+    增量统计各国家的记录数
+
+    从断点记录的字节偏移开始只处理新追加的完整行：切块后交给进程池，按 world.json 的国家边界
+    并行做点包含判断，部分计数合并后写回断点；按块顺序推进偏移，中途中断时已完成的连续前缀不会重复统计
+
+    Returns:
+        {'processed_bytes', 'offset', 'counts'}，counts 为国家名 -> 记录数
+    """
+    ckpt_path = checkpoint_path(out_path)
+    checkpoint = {'offset': 0, 'counts': {}} if full else load_checkpoint(ckpt_path, data_path, world_path)
+    start = checkpoint['offset']
+    counts = Counter(checkpoint['counts'])
+    end = complete_length(data_path, os.path.getsize(data_path))
+    chunks = split_chunks(data_path, start, end)
+
+    if len(chunks) == 1 or workers == 1:
+        # 只有少量新数据时不启动进程池，避免每个进程重复建立边界索引
+        for chunk_start, chunk_end in chunks:
+            counts.update(count_chunk(data_path, chunk_start, chunk_end, world_path))
+            save_checkpoint(ckpt_path, data_path, chunk_end, counts, world_path)
+    elif chunks:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(world_path,)) as pool:
+            futures = [pool.submit(count_chunk, data_path, s, e, world_path) for s, e in chunks]
+            for (_, chunk_end), future in zip(chunks, futures):
+                counts.update(future.result())
+                save_checkpoint(ckpt_path, data_path, chunk_end, counts, world_path)
+    elif not os.path.exists(ckpt_path):
+        save_checkpoint(ckpt_path, data_path, end, counts, world_path)
+
+    country_count_named = dict(counts)
+    if chunks or full or not os.path.exists(out_path):
+        write_json_atomic(out_path, country_count_named, indent=2)
+    return {'processed_bytes': end - start, 'offset': end, 'counts': country_count_named}
 
 def main():
-    data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public/mock/data.txt'))
-    out_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public/mock/country_count.json'))
-    country_count = {}
-    coords = []
-    with open(data_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) != 4:
-                continue
-            _, _, lat, lon = parts
-            try:
-                lat_f = float(lat)
-                lon_f = float(lon)
-                coords.append((lat_f, lon_f))
-            except ValueError:
-                continue
-    # 批量查找
-    results = rg.search(coords)
-    for res in results:
-        cc = res['cc']
-        country_count[cc] = country_count.get(cc, 0) + 1
-    country_count_named = {iso_to_country_name(k): v for k, v in country_count.items()}
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(country_count_named, f, ensure_ascii=False, indent=2)
-    print('统计完成，已保存为 country_count.json')
+    parser = argparse.ArgumentParser(description='按国家统计记录数（增量、并行）')
+    parser.add_argument('--data', default=DATA_PATH, help='记录文件（id name lat lng）')
+    parser.add_argument('--output', default=OUT_PATH, help='输出的country_count.json')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    parser.add_argument('--full', action='store_true', help='忽略断点，全量重新统计')
+    parser.add_argument('--world', default=WORLD_PATH, help='国家边界（GeoJSON，默认前端地图的world.json）')
+    args = parser.parse_args()
+
+    result = update_country_count(os.path.abspath(args.data), os.path.abspath(args.output),
+                                  workers=args.workers, full=args.full, world_path=os.path.abspath(args.world))
+    print(f"统计完成，本次处理 {result['processed_bytes']} 字节，已保存为 country_count.json")
 
 if __name__ == '__main__':
     try:
         main()
     except Exception as e:
-        print('运行出错:', e) 
\ No newline at end of file
+        print('运行出错:', e)
@@ -1,21 +1,14 @@
 import os
 import json
+from point_store import load_points
 
 # 假设脚本在 backend 目录下，data.txt 在 ../public/mock/data.txt
 DATA_TXT_PATH = os.path.join(os.path.dirname(__file__), '../public/mock/10.txt')
 POINTS_JSON_PATH = os.path.join(os.path.dirname(__file__), '../public/mock/points.json')
 
-points = []
-with open(DATA_TXT_PATH, 'r', encoding='utf-8') as f:
-    for line in f:
-        parts = line.strip().split()
-        if len(parts) >= 3:
-            try:
-                lng = float(parts[1])
-                lat = float(parts[2])
-                points.append({'lng': lng, 'lat': lat})
-            except ValueError:
-                continue
+# 经纬度直接取自列式点数据的内存映射数组，不再逐行解析文本
+store = load_points(DATA_TXT_PATH)
+points = [{'lng': lng, 'lat': lat} for lng, lat in zip(store.lng.tolist(), store.lat.tolist())]
 
 with open(POINTS_JSON_PATH, 'w', encoding='utf-8') as f:
     json.dump(points, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+条件请求与响应压缩
+SVG接口按输入数据版本（数据文件的stat指纹 + 请求参数 + 后端代码版本）生成弱ETag，
+请求带 If-None-Match 且数据未变化时直接返回304，不读取文件也不渲染；
+较大的文本响应按 Accept-Encoding 以 brotli（已安装时）或 gzip 压缩，
+带ETag的响应的压缩结果按 (编码, ETag) 缓存，轮询同一版本的客户端直接取用预压缩的结果
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+from flask import Response, request
+from render_cache import RenderCache, file_fingerprint
+try:
+    import brotli
+except ImportError:
+    # 未安装 brotli 时只提供gzip
+    brotli = None
+
+# 小于该字节数的响应不压缩（压缩节省的传输抵不过开销）
+MIN_COMPRESS_BYTES = 1024
+# 压缩级别：在压缩率和CPU开销之间折中，预压缩结果会被缓存复用
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# 预压缩结果缓存上限
+COMPRESSED_CACHE_ENTRIES = 128
+COMPRESSED_CACHE_BYTES = 32 * 1024 * 1024
+# 可压缩的响应类型（SSE推送逐条发送，不压缩）；二进制密度瓦片多为0，压缩效果好
+COMPRESSIBLE_TYPES = ('application/json', 'image/svg+xml', 'text/', 'application/octet-stream')
+UNCOMPRESSED_TYPES = ('text/event-stream',)
+
+
+def _code_version() -> str:
+    """后端源码文件的版本摘要：部署新代码后，客户端持有的旧ETag全部失效"""
+    h = hashlib.blake2b(digest_size=8)
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        h.update(repr(file_fingerprint(path)).encode('utf-8'))
+    return h.hexdigest()
+
+
+CODE_VERSION = _code_version()
+
+# 各编码的预压缩结果（键为编码名 + ETag + 原始长度）
+compressed_cache = RenderCache(max_entries=COMPRESSED_CACHE_ENTRIES, max_bytes=COMPRESSED_CACHE_BYTES)
+
+
+def data_etag(route: str, paths: Iterable[Optional[str]], params: Any = None) -> str:
+    """
+    由输入文件版本和请求参数生成ETag（不含引号）
+
+    只读取文件的stat，与渲染缓存使用同样的文件指纹：指纹相同则渲染结果相同
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(CODE_VERSION.encode('utf-8'))
+    h.update(route.encode('utf-8'))
+    h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    for path in paths:
+        h.update(repr(file_fingerprint(path)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def is_fresh(etag: str) -> bool:
+    """
+    请求的 If-None-Match 是否包含当前ETag（弱比较）
+
+    SVG接口虽为POST，但只读、结果只取决于请求参数和数据文件，因此同样按条件请求处理
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def _mark(response: Response, etag: str) -> Response:
+    response.set_etag(etag, weak=True)
+    # 客户端可以保存结果，但每次使用前都要带 If-None-Match 重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    """304响应，不带响应体"""
+    return _mark(Response(status=304), etag)
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """为成功的响应加上ETag（业务错误响应不应调用）"""
+    return _mark(response, etag)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """按编码压缩完整的响应体"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _encoded(chunk) -> bytes:
+    return chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def compress_stream(chunks: Iterable, encoding: str) -> Iterator[bytes]:
+    """逐块压缩流式响应，每块之后刷新压缩器，客户端仍能边收边解析"""
+    try:
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            for chunk in chunks:
+                data = compressor.process(_encoded(chunk)) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for chunk in chunks:
+                data = compressor.compress(_encoded(chunk)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _compressible(response: Response) -> bool:
+    mimetype = response.mimetype or ''
+    return mimetype.startswith(COMPRESSIBLE_TYPES) and not mimetype.startswith(UNCOMPRESSED_TYPES)
+
+
+def _choose_encoding() -> Optional[str]:
+    """按 Accept-Encoding 的优先级选择编码，权重相同时优先brotli"""
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    压缩响应（after_request钩子）
+
+    只处理200的文本响应；带ETag的完整响应的压缩结果进入 compressed_cache，同一版本只压缩一次
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not _compressible(response)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_BYTES:
+            return response
+        etag, _ = response.get_etag()
+        if etag:
+            data = compressed_cache.get_or_render(encoding, [], lambda: compress(body, encoding),
+                                                  params=(etag, len(body)))
+        else:
+            data = compress(body, encoding)
+        response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compressed_cache_metrics():
+    """抓取 /api/metrics 时读取预压缩缓存统计"""
+    stats = compressed_cache.stats()
+    return [
+        ('obir_compressed_cache_entries', 'gauge', '预压缩响应缓存条目数', [({}, stats['entries'])]),
+        ('obir_compressed_cache_bytes', 'gauge', '预压缩响应缓存占用字节数', [({}, stats['bytes'])]),
+        ('obir_compressed_cache_hits_total', 'counter', '预压缩响应缓存命中次数', [({}, stats['hits'])]),
+        ('obir_compressed_cache_misses_total', 'counter', '预压缩响应缓存未命中次数', [({}, stats['misses'])]),
+    ]
+
+
+def init_app(app):
+    """注册响应压缩钩子"""
+    app.after_request(compress_response)
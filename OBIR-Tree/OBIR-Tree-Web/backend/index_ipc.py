@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flask后端与外部索引进程（C++ OBIR-Tree）之间的本地IPC通道
+取代每次查询改写 data/search_query.json 的文件交接：通过Unix域套接字发送带长度前缀的二进制帧，
+每个请求带请求id，结果同步返回；客户端维护连接池并对每次请求设置超时。
+本模块同时提供一个用进程内IR-Tree应答的替身服务器，便于在没有C++进程时本地联调
+
+帧格式（小端）:
+    头部 16 字节: magic b'OBIR' | version u8 | type u8 | flags u16 | request_id u32 | payload_length u32
+    QUERY  负载: lng f64 | lat f64 | top_k u32 | keyword_length u16 | keyword (UTF-8)
+    RESULT 负载: UTF-8 JSON，{"results": [...]}，每项字段同 /api/query-results
+    ERROR  负载: UTF-8 错误信息
+    PING / PONG 无负载
+
+用法:
+    python index_ipc.py serve --socket /tmp/obir-index.sock
+    python index_ipc.py query --socket /tmp/obir-index.sock Pharmacy 123.35 41.43 5
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from typing import Callable, Dict, List, Tuple
+
+MAGIC = b'OBIR'
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+QUERY_HEAD = struct.Struct('<ddIH')
+
+MSG_QUERY = 1
+MSG_RESULT = 2
+MSG_ERROR = 3
+MSG_PING = 4
+MSG_PONG = 5
+
+# 单帧负载上限，防止错误的长度字段导致一次性分配巨大内存
+MAX_PAYLOAD = 64 * 1024 * 1024
+# 默认套接字路径、连接池大小和单次请求超时（秒）
+DEFAULT_SOCKET = '/tmp/obir-index.sock'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 2.0
+
+
+class IndexIPCError(Exception):
+    """IPC通道错误：连接失败、协议错误或对端返回ERROR帧"""
+
+
+class IndexTimeout(IndexIPCError):
+    """请求在超时时间内没有得到应答"""
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise IndexIPCError('连接被对端关闭')
+        received += n
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, msg_type: int, request_id: int, payload: bytes = b''):
+    sock.sendall(HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, 0, request_id, len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, int, bytes]:
+    """读取一帧，返回 (type, request_id, payload)"""
+    magic, version, msg_type, _, request_id, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if magic != MAGIC or version != PROTOCOL_VERSION:
+        raise IndexIPCError(f'无法识别的帧头: magic={magic!r} version={version}')
+    if length > MAX_PAYLOAD:
+        raise IndexIPCError(f'帧负载过大: {length} 字节')
+    return msg_type, request_id, _recv_exact(sock, length) if length else b''
+
+
+def encode_query(keyword: str, lng: float, lat: float, top_k: int) -> bytes:
+    data = keyword.encode('utf-8')
+    if len(data) > 0xFFFF:
+        raise ValueError('查询关键词过长')
+    return QUERY_HEAD.pack(lng, lat, top_k, len(data)) + data
+
+
+def decode_query(payload: bytes) -> Tuple[str, float, float, int]:
+    if len(payload) < QUERY_HEAD.size:
+        raise IndexIPCError('QUERY负载长度不足')
+    lng, lat, top_k, length = QUERY_HEAD.unpack_from(payload)
+    if len(payload) != QUERY_HEAD.size + length:
+        raise IndexIPCError('QUERY负载长度与关键词长度不符')
+    return payload[QUERY_HEAD.size:].decode('utf-8'), lng, lat, top_k
+
+
+class IndexClient:
+    """
+    线程安全的IPC客户端
+
+    每次请求独占池中一条连接（不在同一连接上交错多个请求），应答的请求id必须与请求一致；
+    超时或协议错误的连接直接关闭而不放回池中，避免迟到的应答被下一个请求读到
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle: 'queue.LifoQueue[socket.socket]' = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._ids = itertools.count(1)
+        self._id_lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        with self._id_lock:
+            return next(self._ids) & 0xFFFFFFFF
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise IndexIPCError(f'无法连接索引进程 {self.socket_path}: {e}') from e
+        return sock
+
+    def _exchange(self, sock: socket.socket, msg_type: int, payload: bytes) -> Tuple[int, bytes]:
+        request_id = self._next_id()
+        try:
+            send_frame(sock, msg_type, request_id, payload)
+            reply_type, reply_id, reply = recv_frame(sock)
+        except socket.timeout as e:
+            raise IndexTimeout(f'索引进程 {self.timeout}s 内未应答') from e
+        except OSError as e:
+            raise IndexIPCError(f'索引进程通信失败: {e}') from e
+        if reply_id != request_id:
+            raise IndexIPCError(f'应答请求id不匹配: 期望 {request_id}，收到 {reply_id}')
+        return reply_type, reply
+
+    def _request(self, msg_type: int, payload: bytes = b'') -> Tuple[int, bytes]:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise IndexTimeout('等待空闲连接超时')
+        try:
+            try:
+                sock = self._idle.get_nowait()
+                pooled = True
+            except queue.Empty:
+                sock = self._connect()
+                pooled = False
+            try:
+                reply = self._exchange(sock, msg_type, payload)
+            except IndexTimeout:
+                sock.close()
+                raise
+            except IndexIPCError:
+                sock.close()
+                if not pooled:
+                    raise
+                # 空闲连接可能已被重启的索引进程关闭，换一条新连接重试一次
+                sock = self._connect()
+                try:
+                    reply = self._exchange(sock, msg_type, payload)
+                except IndexIPCError:
+                    sock.close()
+                    raise
+            self._idle.put(sock)
+            return reply
+        finally:
+            self._slots.release()
+
+    def query(self, keyword: str, lng: float, lat: float, top_k: int) -> List[Dict]:
+        """发送一条Top-K查询，返回结果列表（字段同 /api/query-results）"""
+        reply_type, reply = self._request(MSG_QUERY, encode_query(keyword, lng, lat, top_k))
+        if reply_type == MSG_ERROR:
+            raise IndexIPCError(reply.decode('utf-8', 'replace'))
+        if reply_type != MSG_RESULT:
+            raise IndexIPCError(f'意外的应答类型: {reply_type}')
+        return json.loads(reply.decode('utf-8'))['results']
+
+    def ping(self) -> bool:
+        try:
+            return self._request(MSG_PING)[0] == MSG_PONG
+        except IndexIPCError:
+            return False
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _IndexRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        search = self.server.search
+        while True:
+            try:
+                msg_type, request_id, payload = recv_frame(self.request)
+            except (IndexIPCError, OSError):
+                return
+            if msg_type == MSG_PING:
+                send_frame(self.request, MSG_PONG, request_id)
+                continue
+            if msg_type != MSG_QUERY:
+                send_frame(self.request, MSG_ERROR, request_id, f'不支持的消息类型: {msg_type}'.encode('utf-8'))
+                continue
+            try:
+                results = search(*decode_query(payload))
+                reply = json.dumps({'results': results}, ensure_ascii=False).encode('utf-8')
+                send_frame(self.request, MSG_RESULT, request_id, reply)
+            except Exception as e:
+                send_frame(self.request, MSG_ERROR, request_id, str(e).encode('utf-8'))
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """替身索引进程：每个连接一个线程，按帧应答查询"""
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, search: Callable[[str, float, float, int], List[Dict]]):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.search = search
+        super().__init__(socket_path, _IndexRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    parser = argparse.ArgumentParser(description='索引进程IPC：替身服务器与测试客户端')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve_parser = sub.add_parser('serve', help='用进程内IR-Tree应答查询')
+    serve_parser.add_argument('--socket', default=os.environ.get('OBIR_INDEX_SOCKET', DEFAULT_SOCKET))
+    serve_parser.add_argument('--records', default=os.environ.get(
+        'OBIR_RECORDS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '../public/mock/10.txt')))
+    query_parser = sub.add_parser('query', help='发送一条查询')
+    query_parser.add_argument('--socket', default=os.environ.get('OBIR_INDEX_SOCKET', DEFAULT_SOCKET))
+    query_parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    query_parser.add_argument('keyword')
+    query_parser.add_argument('lng', type=float)
+    query_parser.add_argument('lat', type=float)
+    query_parser.add_argument('top_k', type=int, nargs='?', default=5)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from point_store import load_points
+        from spatial_keyword_engine import SpatialKeywordEngine
+        engine = SpatialKeywordEngine.from_records(load_points(args.records).iter_records())
+        server = IndexServer(args.socket, engine.search)
+        # SIGTERM时同样走finally，删除套接字文件
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        print(f'替身索引进程监听 {args.socket}（{len(engine.records)} 条记录）', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    client = IndexClient(args.socket, pool_size=1, timeout=args.timeout)
+    try:
+        for result in client.query(args.keyword, args.lng, args.lat, args.top_k):
+            print(json.dumps(result, ensure_ascii=False))
+    except IndexIPCError as e:
+        print(f'查询失败: {e}', file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
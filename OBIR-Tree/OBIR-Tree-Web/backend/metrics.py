@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标
+按路由统计请求数、错误数和延迟直方图，并为各生成器的加载/布局/差异/渲染阶段计时，
+以Prometheus文本格式在 /api/metrics 输出。
+
+多进程部署（serve.py）时各worker把自己的指标快照定期写入运行目录 OBIR_RUN_DIR 下的 metrics/<pid>.json，
+抓取时由处理该请求的worker汇总所有快照：计数器和直方图按进程累加（已退出的worker的快照保留，总数不会回退），
+抓取时计算的指标（各进程缓存的条目数、命中次数等）只取仍在运行的worker，并加上 worker="<pid>" 标签。
+渲染进程（render_executor）中记录的指标随每次渲染的结果一起交回调用的worker，计入该worker的指标
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# 延迟直方图的桶上界（秒），最后隐含 +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 各进程写入指标快照的目录；未设置运行目录（单进程运行 app.py）时只输出本进程的指标
+METRICS_DIR = os.path.join(os.environ['OBIR_RUN_DIR'], 'metrics') if os.environ.get('OBIR_RUN_DIR') else None
+# 指标有变化时写入快照的最小间隔（秒）
+FLUSH_INTERVAL = float(os.environ.get('OBIR_METRICS_FLUSH', 1.0))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+        _changed()
+
+    def snapshot(self) -> List[list]:
+        """[[标签值..., 计数], ...]，可JSON序列化"""
+        with self._lock:
+            return [list(label_values) + [value] for label_values, value in self._values.items()]
+
+    def drain(self) -> List[list]:
+        """取出当前值并清零"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return [list(label_values) + [value] for label_values, value in values.items()]
+
+    def merge(self, snapshot: List[list]):
+        with self._lock:
+            for *label_values, value in snapshot:
+                key = tuple(label_values)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数（非累计）..., +Inf桶计数], 总和
+        self._values: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+        _changed()
+
+    def snapshot(self) -> List[list]:
+        """[[标签值..., 各桶计数, 总和], ...]，可JSON序列化"""
+        with self._lock:
+            return [list(label_values) + [list(entry[0]), entry[1]] for label_values, entry in self._values.items()]
+
+    def drain(self) -> List[list]:
+        """取出当前值并清零"""
+        with self._lock:
+            values, self._values = self._values, {}
+        return [list(label_values) + [entry[0], entry[1]] for label_values, entry in values.items()]
+
+    def merge(self, snapshot: List[list]):
+        with self._lock:
+            for *label_values, counts, total in snapshot:
+                key = tuple(label_values)
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+                for i, count in enumerate(counts):
+                    entry[0][i] += count
+                entry[1] += total
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        label_names = self.labels + ('le',)
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(label_names, label_values + (_format_value(bound),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # 抓取时才计算的指标：返回 [(name, type, help, [(labels dict, value)])]
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]] = []
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable):
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """计数器和直方图的当前值，按指标名索引"""
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def drain(self) -> Dict[str, List[list]]:
+        """取出计数器和直方图的当前值并清零（渲染进程把每次渲染的指标增量交回调用进程）"""
+        return {metric.name: metric.drain() for metric in self._metrics}
+
+    def merge(self, snapshot: Dict[str, List[list]]):
+        """累加 snapshot()/drain() 的结果（如渲染进程交回的指标增量）"""
+        by_name = {metric.name: metric for metric in self._metrics}
+        for name, values in snapshot.items():
+            if name in by_name and values:
+                by_name[name].merge(values)
+                _changed()
+
+    def collect(self) -> List[list]:
+        """调用各抓取时计算的指标，返回 [[name, type, help, [[labels, value], ...]], ...]"""
+        return [[name, metric_type, documentation, [[dict(labels), value] for labels, value in samples]]
+                for collector in self._collectors
+                for name, metric_type, documentation, samples in collector()]
+
+    def write_snapshot(self, directory: str):
+        """把本进程的指标写入 directory/<pid>.json（先写临时文件再原子替换）"""
+        os.makedirs(directory, exist_ok=True)
+        data = {'pid': os.getpid(), 'metrics': self.snapshot(), 'collected': self.collect()}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+    def _aggregate(self, directory: str):
+        """汇总目录下所有进程的快照，返回 (与本注册表同结构的指标, 各运行中进程的抓取时指标)"""
+        totals = []
+        for metric in self._metrics:
+            if isinstance(metric, Histogram):
+                totals.append(Histogram(metric.name, metric.documentation, metric.labels, metric.buckets))
+            else:
+                totals.append(Counter(metric.name, metric.documentation, metric.labels))
+        by_name = {metric.name: metric for metric in totals}
+        collected = []
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, snapshot in data['metrics'].items():
+                if name in by_name:
+                    by_name[name].merge(snapshot)
+            if _alive(data['pid']):
+                collected.extend((data['pid'], item) for item in data['collected'])
+        return totals, collected
+
+    def render(self) -> str:
+        """Prometheus文本格式（version 0.0.4）"""
+        if METRICS_DIR:
+            self.write_snapshot(METRICS_DIR)
+            metrics, collected = self._aggregate(METRICS_DIR)
+        else:
+            metrics, collected = self._metrics, [(None, item) for item in self.collect()]
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        # 同名指标（各进程各一组）只输出一次 HELP/TYPE
+        grouped: Dict[str, list] = {}
+        for pid, (name, metric_type, documentation, samples) in collected:
+            entry = grouped.setdefault(name, [metric_type, documentation, []])
+            for labels, value in samples:
+                entry[2].append(({**labels, 'worker': pid} if pid is not None else labels, value))
+        for name, (metric_type, documentation, samples) in grouped.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'obir_http_requests_total', '按路由统计的请求数', ('route', 'method', 'status'))
+http_errors = registry.counter(
+    'obir_http_request_errors_total', '返回 success=false 或HTTP错误状态的请求数', ('route', 'method'))
+http_latency = registry.histogram(
+    'obir_http_request_duration_seconds', '请求处理耗时（流式响应只计到开始输出）', ('route', 'method'))
+phase_latency = registry.histogram(
+    'obir_phase_duration_seconds', '生成器内部各阶段耗时', ('generator', 'phase'))
+cache_requests = registry.counter(
+    'obir_generator_cache_requests_total', '生成器内部缓存（快照索引、LOD树索引、布局）的查询次数', ('cache', 'result'))
+
+START_TIME = time.time()
+
+# 指标变化计数：快照线程只在有变化时写文件
+_version = 0
+_flushed_version = -1
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _changed():
+    global _version
+    _version += 1
+
+
+def flush():
+    """指标有变化时把本进程的快照写入 METRICS_DIR"""
+    global _flushed_version
+    version = _version
+    if METRICS_DIR and version != _flushed_version:
+        registry.write_snapshot(METRICS_DIR)
+        _flushed_version = version
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start_flusher():
+    """在当前进程中启动定期写快照的线程（预加载模式下worker由主进程fork而来，按pid判断是否已启动）"""
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name='obir-metrics-flush', daemon=True).start()
+        atexit.register(flush)
+
+
+def cache_lookup(cache: str, hit: bool):
+    """记录一次生成器内部缓存查询"""
+    cache_requests.inc(cache, 'hit' if hit else 'miss')
+
+
+@contextmanager
+def phase_timer(generator: str, phase: str):
+    """计时一个阶段，异常时同样记录耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase_latency.observe(time.perf_counter() - start, generator, phase)
+
+
+def timed(generator: str, phase: str):
+    """函数装饰器：把每次调用的耗时记入 generator/phase"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase_timer(generator, phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(chunks: Iterable[str], generator: str, phase: str) -> Iterator[str]:
+    """流式输出时只累计产出各分段本身的耗时，不包括等待客户端读取的时间"""
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        phase_latency.observe(elapsed, generator, phase)
+
+
+def init_app(app):
+    """注册请求计时钩子；接口通过 flask.g.api_error 标记业务错误（响应仍为200）"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        start_flusher()
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.observe(time.perf_counter() - start, route, request.method)
+        http_requests.inc(route, request.method, str(response.status_code))
+        if response.status_code >= 400 or g.pop('api_error', False):
+            http_errors.inc(route, request.method)
+        return response
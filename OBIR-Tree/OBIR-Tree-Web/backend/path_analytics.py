@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+两轮查询的ORAM访问路径对比统计
+把一批查询两轮的 orampath 分别填充成矩阵（行 = 查询，列 = 路径上的位置，即PathORAM树的层），
+逐位置比较、统计相同/不同路径数、各位置的差异次数以及每层被访问桶的分布，
+全部为NumPy整列运算，10^5 条查询在一秒内完成，前端不再逐条循环比较
+"""
+
+import itertools
+import math
+from typing import Any, Dict, List, Tuple
+
+import msgspec
+import numpy as np
+
+from metrics import phase_timer, timed
+
+# 单次请求允许的最大查询数（每轮）
+MAX_PATHS = 500000
+# 填充位置的取值；比较时另用掩码区分，路径中出现该值也不会误判
+PAD = -1
+
+
+class PathAnalyticsRequest(msgspec.Struct, rename='camel'):
+    """请求体：两轮查询的路径按下标一一对应，secondRound 为空时只统计第一轮的访问分布"""
+    first_round: List[List[int]]
+    second_round: List[List[int]] = []
+    # 是否返回每条查询的差异位置（只需要汇总统计时可关闭，减小响应）
+    include_comparisons: bool = True
+    # 是否返回每层各个桶的访问次数
+    histograms: bool = False
+
+
+_request_decoder = msgspec.json.Decoder(PathAnalyticsRequest)
+
+
+def decode_request(raw: bytes) -> PathAnalyticsRequest:
+    """解码并校验请求体，不合法时抛出 ValueError（含出错位置）"""
+    try:
+        req = _request_decoder.decode(raw)
+    except msgspec.ValidationError as e:
+        raise ValueError(f'请求体字段校验失败: {e}') from None
+    except msgspec.DecodeError as e:
+        raise ValueError(f'请求体格式错误: {e}') from None
+    if len(req.first_round) > MAX_PATHS or len(req.second_round) > MAX_PATHS:
+        raise ValueError(f'每轮最多 {MAX_PATHS} 条路径')
+    if req.second_round and len(req.second_round) != len(req.first_round):
+        raise ValueError(f'两轮路径数不一致: {len(req.first_round)} != {len(req.second_round)}')
+    return req
+
+
+def pad_paths(paths: List[List[int]], width: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    变长路径 -> (矩阵, 掩码)，形状均为 (路径数, max(最长路径, width))
+
+    先把所有路径拼成一维数组，再按掩码一次性写入矩阵（布尔下标按行优先顺序填充）
+    """
+    lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+    width = max(int(lengths.max()) if len(paths) else 0, width)
+    flat = np.fromiter(itertools.chain.from_iterable(paths), dtype=np.int64, count=int(lengths.sum()))
+    mask = np.arange(width) < lengths[:, None]
+    matrix = np.full((len(paths), width), PAD, dtype=np.int64)
+    matrix[mask] = flat
+    return matrix, mask
+
+
+def _widen(matrix: np.ndarray, mask: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    extra = width - matrix.shape[1]
+    if extra <= 0:
+        return matrix, mask
+    return (np.pad(matrix, ((0, 0), (0, extra)), constant_values=PAD),
+            np.pad(mask, ((0, 0), (0, extra)), constant_values=False))
+
+
+def level_distribution(matrix: np.ndarray, mask: np.ndarray, histograms: bool = False) -> List[Dict[str, Any]]:
+    """
+    每层（路径上的每个位置）被访问桶的分布
+
+    entropy 为访问分布的熵（比特），normalizedEntropy = entropy / log2(不同桶数)，
+    越接近1说明该层的访问越接近在已访问的桶上均匀分布
+    """
+    levels = []
+    for level in range(matrix.shape[1]):
+        buckets, counts = np.unique(matrix[mask[:, level], level], return_counts=True)
+        accesses = int(counts.sum())
+        if accesses:
+            p = counts / accesses
+            entropy = float((p * np.log2(1 / p)).sum())
+        else:
+            entropy = 0.0
+        entry = {
+            'level': level,
+            'accesses': accesses,
+            'distinct': int(len(buckets)),
+            'maxCount': int(counts.max()) if accesses else 0,
+            'minCount': int(counts.min()) if accesses else 0,
+            'entropy': entropy,
+            'normalizedEntropy': entropy / math.log2(len(buckets)) if len(buckets) > 1 else 1.0
+        }
+        if histograms:
+            entry['buckets'] = buckets.tolist()
+            entry['counts'] = counts.tolist()
+        levels.append(entry)
+    return levels
+
+
+def compare_paths(first: Tuple[np.ndarray, np.ndarray],
+                  second: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    逐位置比较两轮路径，返回 (差异矩阵, 是否相同)
+
+    与前端原有逻辑一致：只有一侧有值的位置算作不同；长度相同且没有不同位置时路径相同
+    """
+    width = max(first[0].shape[1], second[0].shape[1])
+    first_matrix, first_mask = _widen(*first, width)
+    second_matrix, second_mask = _widen(*second, width)
+    differ = (first_matrix != second_matrix) | (first_mask != second_mask)
+    differ &= first_mask | second_mask
+    identical = ~differ.any(axis=1) & (first_mask.sum(axis=1) == second_mask.sum(axis=1))
+    return differ, identical
+
+
+def _length_summary(mask: np.ndarray) -> Dict[str, Any]:
+    lengths = mask.sum(axis=1)
+    if not len(lengths):
+        return {'min': 0, 'max': 0, 'mean': 0.0}
+    return {'min': int(lengths.min()), 'max': int(lengths.max()), 'mean': float(lengths.mean())}
+
+
+@timed('path_analytics', 'analyze')
+def analyze(req: PathAnalyticsRequest) -> Dict[str, Any]:
+    """计算两轮路径的对比结果和各层访问分布"""
+    with phase_timer('path_analytics', 'pad'):
+        first = pad_paths(req.first_round)
+        second = pad_paths(req.second_round) if req.second_round else None
+
+    result = {
+        'pathLengths': {'firstRound': _length_summary(first[1])},
+        'levels': {'firstRound': level_distribution(*first, histograms=req.histograms)}
+    }
+    if second is None:
+        result['summary'] = {
+            'totalQueries': len(req.first_round),
+            'identicalPaths': 0,
+            'differentPaths': 0
+        }
+        return result
+
+    result['pathLengths']['secondRound'] = _length_summary(second[1])
+    result['levels']['secondRound'] = level_distribution(*second, histograms=req.histograms)
+
+    with phase_timer('path_analytics', 'compare'):
+        differ, identical = compare_paths(first, second)
+        difference_counts = differ.sum(axis=1)
+    identical_paths = int(identical.sum())
+    result['summary'] = {
+        'totalQueries': len(req.first_round) + len(req.second_round),
+        'identicalPaths': identical_paths,
+        'differentPaths': len(identical) - identical_paths
+    }
+    # 每个位置上路径不同的查询数，以及每条查询不同位置数的分布
+    result['positionDifferences'] = differ.sum(axis=0).tolist()
+    result['differenceHistogram'] = np.bincount(difference_counts, minlength=1).tolist()
+
+    if req.include_comparisons:
+        # 一次转换为Python列表后按偏移切片，比逐行转换快
+        positions = np.nonzero(differ)[1].tolist()
+        ends = np.cumsum(difference_counts).tolist()
+        result['comparisons'] = {
+            'identical': identical.tolist(),
+            'differences': [positions[start:end] for start, end in zip([0] + ends, ends)]
+        }
+    return result
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式二进制点数据存储
+把空格分隔的记录文件转换为单个带版本号的二进制文件（id、纬度、经度三列定长数组 + 名称偏移表 + 名称字节块），
+加载时内存映射，各列直接作为零拷贝的NumPy数组使用，Flask服务和各离线脚本共享同一份文件
+
+文件布局（小端，各段按64字节对齐）:
+    header: magic, version, reserved, count, names_bytes, source_mtime_ns, source_size
+    ids:          int64[count]
+    lat:          float64[count]
+    lng:          float64[count]
+    name_offsets: uint64[count + 1]
+    names:        utf-8字节块
+"""
+
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from spatial_keyword_engine import iter_record_lines
+
+MAGIC = b'OBIRPTS\0'
+VERSION = 1
+# 转换后的文件与源文件同目录，扩展名追加 .obpts
+STORE_SUFFIX = '.obpts'
+
+_HEADER = struct.Struct('<8sIIQQqQ')
+_ALIGN = 64
+# 转换/遍历时每批处理的行数
+_FLUSH_ROWS = 1 << 20
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(count: int, names_bytes: int) -> Tuple[int, int, int, int, int, int]:
+    """各段在文件中的起始偏移：ids, lat, lng, name_offsets, names, 文件总长"""
+    ids_at = _align(_HEADER.size)
+    lat_at = _align(ids_at + 8 * count)
+    lng_at = _align(lat_at + 8 * count)
+    offsets_at = _align(lng_at + 8 * count)
+    names_at = _align(offsets_at + 8 * (count + 1))
+    return ids_at, lat_at, lng_at, offsets_at, names_at, names_at + names_bytes
+
+
+class PointStore:
+    """内存映射的只读点数据，ids/lat/lng/name_offsets 均为指向映射区的NumPy视图"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f'点数据文件不完整: {path}')
+        magic, version, _, count, names_bytes, mtime_ns, size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'不是点数据文件: {path}')
+        if version != VERSION:
+            raise ValueError(f'点数据文件版本不支持: {version}（当前版本 {VERSION}）')
+        ids_at, lat_at, lng_at, offsets_at, names_at, total = _layout(count, names_bytes)
+        if len(self._mmap) < total:
+            raise ValueError(f'点数据文件不完整: {path}')
+
+        self.source_mtime_ns = mtime_ns
+        self.source_size = size
+        buffer = memoryview(self._mmap)
+        self.ids = np.frombuffer(buffer, dtype='<i8', count=count, offset=ids_at)
+        self.lat = np.frombuffer(buffer, dtype='<f8', count=count, offset=lat_at)
+        self.lng = np.frombuffer(buffer, dtype='<f8', count=count, offset=lng_at)
+        self.name_offsets = np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=offsets_at)
+        self._names_at = names_at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def name(self, index: int) -> str:
+        start = self._names_at + int(self.name_offsets[index])
+        end = self._names_at + int(self.name_offsets[index + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def iter_records(self) -> Iterator[Tuple[int, str, float, float]]:
+        """按文件顺序产出 (id, name, x=lng, y=lat)，与 iter_record_lines 一致"""
+        names = memoryview(self._mmap)[self._names_at:]
+        for start in range(0, len(self), _FLUSH_ROWS):
+            end = min(start + _FLUSH_ROWS, len(self))
+            offsets = self.name_offsets[start:end + 1].tolist()
+            rows = zip(self.ids[start:end].tolist(), self.lng[start:end].tolist(), self.lat[start:end].tolist())
+            for i, (rect_id, lng, lat) in enumerate(rows):
+                yield rect_id, str(names[offsets[i]:offsets[i + 1]], 'utf-8'), lng, lat
+
+    def matches_source(self, source_file: str) -> bool:
+        """转换时记录的源文件mtime/size与当前源文件是否一致"""
+        try:
+            st = os.stat(source_file)
+        except OSError:
+            return False
+        return st.st_mtime_ns == self.source_mtime_ns and st.st_size == self.source_size
+
+
+def _iter_text_chunks(source_file: str) -> Iterator[Tuple[array, array, array, list]]:
+    """按批解析记录文本文件，产出 (ids, lat, lng, names) 列"""
+    ids, lat, lng, names = array('q'), array('d'), array('d'), []
+    for rect_id, name, x, y in iter_record_lines(source_file):
+        ids.append(rect_id)
+        lat.append(y)
+        lng.append(x)
+        names.append(name)
+        if len(ids) >= _FLUSH_ROWS:
+            yield ids, lat, lng, names
+            ids, lat, lng, names = array('q'), array('d'), array('d'), []
+    if ids:
+        yield ids, lat, lng, names
+
+
+def write_store(chunks: Iterable[Tuple[Sequence[int], Sequence[float], Sequence[float], Sequence[str]]],
+                store_file: str, source_mtime_ns: int = 0, source_size: int = 0) -> str:
+    """
+    把按批给出的 (ids, lat, lng, names) 列写成列式二进制文件，返回输出路径
+
+    各列先分批写入临时文件再拼接，内存占用与数据量无关；
+    输出先写临时文件再原子替换，写入过程中已加载的旧文件不受影响。
+    source_mtime_ns/source_size 为对应文本文件的stat，直接生成的文件没有源文件时为0
+    """
+    if sys.byteorder != 'little':
+        raise RuntimeError('点数据文件按小端格式写入，当前平台不支持')
+    out_dir = os.path.dirname(os.path.abspath(store_file))
+
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+        columns = {name: open(os.path.join(tmp_dir, name), 'w+b')
+                   for name in ('ids', 'lat', 'lng', 'name_offsets', 'names')}
+        try:
+            names_bytes = 0
+            count = 0
+            array('Q', [0]).tofile(columns['name_offsets'])
+            for ids, lat, lng, names in chunks:
+                encoded = [name.encode('utf-8') for name in names]
+                columns['names'].write(b''.join(encoded))
+                offsets = np.cumsum(np.fromiter(map(len, encoded), dtype=np.uint64, count=len(encoded)))
+                offsets += np.uint64(names_bytes)
+                columns['name_offsets'].write(offsets.astype('<u8').tobytes())
+                columns['ids'].write(np.asarray(ids, dtype='<i8').tobytes())
+                columns['lat'].write(np.asarray(lat, dtype='<f8').tobytes())
+                columns['lng'].write(np.asarray(lng, dtype='<f8').tobytes())
+                if encoded:
+                    names_bytes = int(offsets[-1])
+                count += len(encoded)
+
+            layout = _layout(count, names_bytes)
+            fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=STORE_SUFFIX + '.tmp')
+            with os.fdopen(fd, 'wb') as out:
+                out.write(_HEADER.pack(MAGIC, VERSION, 0, count, names_bytes, source_mtime_ns, source_size))
+                for name, at in zip(('ids', 'lat', 'lng', 'name_offsets', 'names'), layout):
+                    out.write(b'\0' * (at - out.tell()))
+                    columns[name].seek(0)
+                    shutil.copyfileobj(columns[name], out, 1 << 20)
+            os.replace(tmp_path, store_file)
+        finally:
+            for f in columns.values():
+                f.close()
+    return store_file
+
+
+def convert(source_file: str, store_file: Optional[str] = None) -> str:
+    """把记录文本文件转换为列式二进制文件，返回输出路径"""
+    store_file = store_file or source_file + STORE_SUFFIX
+    st = os.stat(source_file)
+    return write_store(_iter_text_chunks(source_file), store_file, st.st_mtime_ns, st.st_size)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def load_points(source_file: str) -> PointStore:
+    """
+    加载记录文件对应的列式点数据
+
+    参数可以是文本记录文件或 .obpts 文件；文本文件旁没有转换结果、
+    或转换结果与源文件mtime/size不一致时先重新转换。同一文件在进程内只映射一次
+    """
+    if source_file.endswith(STORE_SUFFIX):
+        source_path, store_file = None, source_file
+    else:
+        source_path, store_file = source_file, source_file + STORE_SUFFIX
+
+    with _stores_lock:
+        store = _stores.get(store_file)
+        if store is not None and (source_path is None or store.matches_source(source_path)):
+            return store
+        store = None
+        if os.path.exists(store_file):
+            try:
+                store = PointStore(store_file)
+            except ValueError:
+                store = None
+        if source_path is not None and (store is None or not store.matches_source(source_path)):
+            store = PointStore(convert(source_path, store_file))
+        if store is None:
+            raise FileNotFoundError(f'点数据文件不存在: {store_file}')
+        _stores[store_file] = store
+        return store
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    if len(sys.argv) < 2:
+        print("用法: python point_store.py <data_file> [output.obpts]")
+        sys.exit(1)
+
+    output = convert(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    store = PointStore(output)
+    print(f"已生成 {output}，共 {len(store)} 个点")
+
+
+if __name__ == "__main__":
+    main()
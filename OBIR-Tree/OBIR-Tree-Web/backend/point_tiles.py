@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按视野分块的地图点数据
+第一次请求时把列式点数据（见 point_store.py）按Web墨卡托下的Z-order（Morton）编码排序，并保存经纬度前缀和；
+任意缩放级别的网格单元都对应排序数组中的一段连续区间，
+因此某一视野内的聚类（数量 + 质心）或原始点只需对可见单元做一次二分查找；
+跨越180°经线的视野（minLng > maxLng）拆成两段分别查找
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from render_cache import file_fingerprint
+from metrics import timed
+from point_store import PointStore, load_points
+
+# 每个坐标轴的Morton编码位数（最细网格约2.4米）
+MORTON_BITS = 24
+# 聚类网格单元的屏幕尺寸为 256 >> CELL_SHIFT 像素（64px）
+CELL_SHIFT = 2
+# 支持聚类的最大缩放级别
+MAX_ZOOM = MORTON_BITS - CELL_SHIFT
+# 视野内点数不超过该值时直接返回原始点
+RAW_POINT_LIMIT = 500
+# 最大聚类级别下单次请求最多返回的原始点数，其余网格单元（如大量重合的点）仍以聚类返回
+RAW_POINT_CAP = 5000
+# 单次请求最多检查的网格单元数，超出时自动降低聚类级别
+MAX_CELLS = 4096
+
+# 墨卡托投影的纬度范围
+_MAX_LAT = 85.05112878
+
+
+def project(lng: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """经纬度 -> [0, 1) 范围内的Web墨卡托坐标（y轴向下）"""
+    lat = np.clip(lat, -_MAX_LAT, _MAX_LAT)
+    mx = (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    my = 0.5 - np.log((1.0 + sin_lat) / (1.0 - sin_lat)) / (4.0 * math.pi)
+    return np.clip(mx, 0.0, 1.0 - 1e-12), np.clip(my, 0.0, 1.0 - 1e-12)
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """把32位整数的各位间隔展开到64位的偶数位上"""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def morton_encode(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    """网格坐标 -> Morton编码，父单元编码 = 子单元编码 >> 2"""
+    return _spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))
+
+
+class PointTileIndex:
+    def __init__(self, store: PointStore):
+        """
+        Args:
+            store: 列式点数据；只额外保存排序后的坐标、编码和前缀和，id/名称按需从store读取
+        """
+        self.store = store
+        resolution = 1 << MORTON_BITS
+        mx, my = project(store.lng, store.lat)
+        codes = morton_encode((mx * resolution).astype(np.uint64), (my * resolution).astype(np.uint64))
+        order = np.argsort(codes, kind='stable')
+
+        self.order = order
+        self.codes = codes[order]
+        self.lng = store.lng[order]
+        self.lat = store.lat[order]
+        # 前缀和：任意一段连续区间的经纬度之和 = prefix[hi] - prefix[lo]
+        self.lng_prefix = np.concatenate(([0.0], np.cumsum(self.lng)))
+        self.lat_prefix = np.concatenate(([0.0], np.cumsum(self.lat)))
+        if len(order):
+            self.extent = [float(self.lng.min()), float(self.lat.min()),
+                           float(self.lng.max()), float(self.lat.max())]
+        else:
+            self.extent = None
+
+    @classmethod
+    def from_file(cls, data_file: str) -> 'PointTileIndex':
+        return cls(load_points(data_file))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _point(self, i: int) -> list:
+        """排序后第i个点 -> [id, name, lng, lat]"""
+        row = int(self.order[i])
+        return [int(self.store.ids[row]), self.store.name(row), self.lng[i].item(), self.lat[i].item()]
+
+    @staticmethod
+    def _cell_span(box: Tuple[float, float, float, float], level: int) -> Tuple[int, int, int, int]:
+        """视野在指定网格级别下覆盖的单元坐标范围 (x0, x1, y0, y1)，两端均包含"""
+        min_lng, min_lat, max_lng, max_lat = box
+        cells = 1 << level
+        mx, my = project(np.array([min_lng, max_lng]), np.array([max_lat, min_lat]))
+        x0, x1 = (mx * cells).astype(np.int64)
+        y0, y1 = (my * cells).astype(np.int64)
+        return int(x0), int(x1), int(y0), int(y1)
+
+    def _cell_ranges(self, boxes: List[Tuple[float, float, float, float]], level: int):
+        """视野在指定网格级别下覆盖的非空单元，返回每个单元在排序数组中的 [lo, hi)"""
+        codes = []
+        for box in boxes:
+            x0, x1, y0, y1 = self._cell_span(box, level)
+            gx, gy = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+            codes.append(morton_encode(gx.ravel(), gy.ravel()))
+        # 两段视野在180°经线处可能共用边缘的单元
+        cell_codes = np.unique(np.concatenate(codes))
+
+        shift = np.uint64(2 * (MORTON_BITS - level))
+        lo = np.searchsorted(self.codes, cell_codes << shift, side='left')
+        hi = np.searchsorted(self.codes, (cell_codes + np.uint64(1)) << shift, side='left')
+        non_empty = hi > lo
+        return lo[non_empty], hi[non_empty]
+
+    @timed('point_tiles', 'query')
+    def query(self, bbox: Tuple[float, float, float, float], zoom: int,
+              raw_limit: int = RAW_POINT_LIMIT) -> Dict:
+        """
+        查询视野内的点
+
+        Args:
+            bbox: (minLng, minLat, maxLng, maxLat)，minLng > maxLng 表示视野跨越180°经线
+            zoom: 地图缩放级别，聚类网格单元为 256 >> CELL_SHIFT 像素
+            raw_limit: 视野内点数不超过该值（或已超过最大聚类级别）时返回原始点
+
+        Returns:
+            total: 视野覆盖的网格单元内的点数（只返回原始点时为精确的视野内点数）
+            clusters: [[lng, lat, count], ...]，count > 1 的网格单元质心
+            points: [[id, name, lng, lat], ...]，单独成簇或不再聚类的原始点
+        """
+        zoom = max(0, min(int(zoom), MAX_ZOOM))
+        level = zoom + CELL_SHIFT
+        min_lng, min_lat, max_lng, max_lat = bbox
+        if len(self) == 0 or min_lat > max_lat:
+            return {'zoom': zoom, 'total': 0, 'clusters': [], 'points': []}
+        if min_lng > max_lng:
+            boxes = [(min_lng, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lng, max_lat)]
+        else:
+            boxes = [(min_lng, min_lat, max_lng, max_lat)]
+
+        # 视野过大（或客户端传入了异常的bbox）时降低级别，控制单次检查的单元数
+        while level > 0:
+            span = 0
+            for box in boxes:
+                x0, x1, y0, y1 = self._cell_span(box, level)
+                span += (x1 - x0 + 1) * (y1 - y0 + 1)
+            if span <= MAX_CELLS:
+                break
+            level -= 1
+
+        lo, hi = self._cell_ranges(boxes, level)
+        counts = hi - lo
+        total = int(counts.sum())
+
+        if total <= raw_limit:
+            points = self._raw_points(boxes, lo, hi)
+            return {'zoom': zoom, 'total': len(points), 'clusters': [], 'points': points}
+        if level == MAX_ZOOM + CELL_SHIFT:
+            return self._capped_points(boxes, zoom, lo, hi)
+
+        single = counts == 1
+        multi = ~single
+        clusters = self._clusters(lo[multi], hi[multi])
+        points = [self._point(i) for i in lo[single].tolist()]
+        return {'zoom': zoom, 'total': total, 'clusters': clusters, 'points': points}
+
+    def _clusters(self, lo: np.ndarray, hi: np.ndarray) -> List[list]:
+        """各单元的 [质心经度, 质心纬度, 点数]"""
+        counts = hi - lo
+        lng = (self.lng_prefix[hi] - self.lng_prefix[lo]) / counts
+        lat = (self.lat_prefix[hi] - self.lat_prefix[lo]) / counts
+        return [[round(x, 6), round(y, 6), int(c)]
+                for x, y, c in zip(lng.tolist(), lat.tolist(), counts.tolist())]
+
+    def _capped_points(self, boxes: List[Tuple[float, float, float, float]], zoom: int,
+                       lo: np.ndarray, hi: np.ndarray) -> Dict:
+        """
+        最大聚类级别：按单元点数从少到多返回原始点，累计超过 RAW_POINT_CAP 的单元
+        （如大量坐标相同或几乎相同的点）改为返回聚类，响应大小不随数据重合程度增长
+        """
+        counts = hi - lo
+        order = np.argsort(counts, kind='stable')
+        raw = np.zeros(len(counts), dtype=bool)
+        raw[order[np.cumsum(counts[order]) <= RAW_POINT_CAP]] = True
+        points = self._raw_points(boxes, lo[raw], hi[raw])
+        clusters = self._clusters(lo[~raw], hi[~raw])
+        total = len(points) + sum(cluster[2] for cluster in clusters)
+        return {'zoom': zoom, 'total': total, 'clusters': clusters, 'points': points}
+
+    def _raw_points(self, boxes: List[Tuple[float, float, float, float]],
+                    lo: np.ndarray, hi: np.ndarray) -> List[list]:
+        """边缘单元可能部分落在视野外，逐点按视野（任意一段）精确过滤"""
+        points = []
+        for start, end in zip(lo.tolist(), hi.tolist()):
+            for i in range(start, end):
+                x, y = self.lng[i].item(), self.lat[i].item()
+                if any(min_lng <= x <= max_lng and min_lat <= y <= max_lat
+                       for min_lng, min_lat, max_lng, max_lat in boxes):
+                    points.append(self._point(i))
+        return points
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def get_point_index(data_file: str) -> PointTileIndex:
+    """按文件指纹缓存索引，记录文件变化后的第一次请求重新构建"""
+    global _index, _index_key
+    key = file_fingerprint(data_file)
+    with _index_lock:
+        if _index is None or _index_key != key:
+            _index = PointTileIndex.from_file(data_file)
+            _index_key = key
+        return _index
+
+
+def parse_bbox(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """解析 `minLng,minLat,maxLng,maxLat`，格式错误时返回None"""
+    if not value:
+        return None
+    try:
+        parts = [float(v) for v in value.split(',')]
+    except ValueError:
+        return None
+    if len(parts) != 4 or not all(math.isfinite(v) for v in parts):
+        return None
+    return parts[0], parts[1], parts[2], parts[3]
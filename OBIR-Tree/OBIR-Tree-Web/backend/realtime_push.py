@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OBIR-Tree实时快照推送
+后台线程监视 data/ 下的快照文件，只有文件实际变化时才重新计算差异和SVG，
+结果通过Server-Sent Events广播给所有连接的前端。
+
+多进程部署（serve.py）时各worker共享运行目录 OBIR_RUN_DIR：同一组快照文件由持有文件锁的一个worker监视并计算，
+结果写入运行目录下的共享文件，其余worker的监视线程只检查该文件并转发给各自的连接，
+因此无论有多少worker、多少连接，每次快照变化在整台机器上只重新计算一次
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from gen_OBIR_Tree_realtime_svg import OBIRTreeRealtimeSVGGenerator
+from render_cache import file_fingerprint
+
+# 文件状态检查间隔（秒）：只做stat，不读取文件
+POLL_INTERVAL = 0.5
+# 无变化时发送SSE注释保持连接的间隔（秒）
+HEARTBEAT_INTERVAL = 15.0
+# 多进程共享的运行目录（由 serve.py 创建），未设置时每个进程独立监视
+RUN_DIR = os.environ.get('OBIR_RUN_DIR')
+
+
+class SnapshotWatcher:
+    def __init__(self, current_path: str, previous_path: Optional[str], poll_interval: float = POLL_INTERVAL,
+                 on_change: Optional[Callable[[str], None]] = None, shared_dir: Optional[str] = None):
+        """
+        Args:
+            shared_dir: 多进程共享的目录；给出时只有持有该目录下文件锁的进程重新计算，其余进程读取共享结果
+        """
+        self.current_path = current_path
+        self.previous_path = previous_path
+        self.poll_interval = poll_interval
+        # 快照变化时的回调（如写入快照历史），参数为当前快照路径；只在负责计算的进程中调用
+        self.on_change = on_change
+        self.version = 0
+        self.payload = None
+        self._subscribers = 0
+        self._thread = None
+        self._wake = threading.Event()
+        self._condition = threading.Condition()
+        self._lock_path = self._shared_path = None
+        if shared_dir:
+            name = hashlib.blake2b(repr((current_path, previous_path)).encode('utf-8'), digest_size=8).hexdigest()
+            os.makedirs(shared_dir, exist_ok=True)
+            self._lock_path = os.path.join(shared_dir, f'{name}.lock')
+            self._shared_path = os.path.join(shared_dir, f'{name}.json')
+
+    def _snapshot_fingerprints(self) -> list:
+        # 以列表形式保存，与共享文件中JSON还原的值可以直接比较
+        return json.loads(json.dumps([file_fingerprint(self.current_path), file_fingerprint(self.previous_path)]))
+
+    def _compute(self) -> str:
+        """重新生成SVG和差异，返回JSON字符串"""
+        if self.on_change is not None:
+            self.on_change(self.current_path)
+        result = OBIRTreeRealtimeSVGGenerator().generate_from_files(self.current_path, self.previous_path)
+        if result['success']:
+            payload = {
+                'success': True,
+                'svg': result['svg'],
+                'differences': result['differences'],
+                'current_nodes': result['current_nodes'],
+                'previous_nodes': result['previous_nodes']
+            }
+        else:
+            payload = {'success': False, 'error': result['error']}
+        return json.dumps(payload, ensure_ascii=False)
+
+    def _publish(self, payload: str):
+        """发布新结果并唤醒所有等待的订阅者；内容未变化时不发布"""
+        with self._condition:
+            if payload == self.payload:
+                return
+            self.version += 1
+            self.payload = payload
+            self._condition.notify_all()
+
+    def _read_shared(self) -> Optional[Dict]:
+        try:
+            with open(self._shared_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, fingerprints: list, payload: str):
+        """先写临时文件再原子替换，其他进程不会读到写了一半的结果"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._shared_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprints': fingerprints, 'payload': payload}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._shared_path)
+
+    def _try_lead(self, lock_file):
+        """尝试取得（或继续持有）文件锁，返回持有锁的文件对象，未取得时返回None"""
+        if lock_file is not None:
+            return lock_file
+        lock_file = open(self._lock_path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _run(self):
+        last_fingerprints = None
+        last_shared = None
+        lock_file = None
+        try:
+            while True:
+                with self._condition:
+                    if self._subscribers == 0:
+                        # 与 _acquire 在同一把锁下判断：退出后新的订阅者会重新启动监视线程
+                        self._thread = None
+                        return
+                if self._lock_path is None or (lock_file := self._try_lead(lock_file)) is not None:
+                    fingerprints = self._snapshot_fingerprints()
+                    if fingerprints != last_fingerprints:
+                        last_fingerprints = fingerprints
+                        shared = self._read_shared() if self._shared_path else None
+                        if shared is not None and shared.get('fingerprints') == fingerprints:
+                            # 刚接手计算：其他进程已计算过这一版本
+                            self._publish(shared['payload'])
+                        else:
+                            payload = self._compute()
+                            if self._shared_path:
+                                self._write_shared(fingerprints, payload)
+                            self._publish(payload)
+                else:
+                    shared_fingerprint = file_fingerprint(self._shared_path)
+                    if shared_fingerprint != last_shared:
+                        last_shared = shared_fingerprint
+                        shared = self._read_shared()
+                        if shared is not None:
+                            self._publish(shared['payload'])
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        finally:
+            if lock_file is not None:
+                # 关闭文件即释放锁，由仍有订阅者的其他进程接手
+                lock_file.close()
+
+    def _acquire(self):
+        with self._condition:
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='obir-snapshot-watcher', daemon=True)
+                self._thread.start()
+
+    def _release(self):
+        with self._condition:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                # 最后一个订阅者断开时让监视线程尽快检查并退出
+                self._wake.set()
+
+    def events(self, heartbeat: float = HEARTBEAT_INTERVAL) -> Iterator[str]:
+        """
+        单个客户端的SSE事件流
+
+        每个版本只计算一次，所有订阅者共享同一份payload；
+        慢客户端会直接跳到最新版本，不会积压中间帧
+        """
+        self._acquire()
+        try:
+            seen = 0
+            while True:
+                with self._condition:
+                    if self.version == seen:
+                        self._condition.wait(timeout=heartbeat)
+                    version, payload = self.version, self.payload
+                if version == seen:
+                    yield ': keepalive\n\n'
+                    continue
+                seen = version
+                yield f'id: {version}\nevent: snapshot\ndata: {payload}\n\n'
+        finally:
+            self._release()
+
+
+_watchers: Dict[Tuple[str, Optional[str]], SnapshotWatcher] = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(current_path: str, previous_path: Optional[str],
+                on_change: Optional[Callable[[str], None]] = None) -> SnapshotWatcher:
+    """同一组快照文件共享一个监视器（on_change 以第一次创建时给出的为准）"""
+    key = (current_path, previous_path)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None:
+            shared_dir = os.path.join(RUN_DIR, 'realtime') if RUN_DIR else None
+            watcher = SnapshotWatcher(current_path, previous_path, on_change=on_change, shared_dir=shared_dir)
+            _watchers[key] = watcher
+        return watcher
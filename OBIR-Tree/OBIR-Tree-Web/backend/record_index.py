@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+记录文件的id -> 字节偏移索引
+扫描一次 `id name lat lng` / `name lng lat` 记录文件，把每条记录的id和所在行的字节偏移按id排序后
+写入同目录的 `<源文件>.obidx`；查询时内存映射该文件，在排序的id数组上二分查找，
+再按偏移只读取对应的行。按id批量取k条记录只需 O(k log n) 次页读取，不再全量扫描记录文件
+
+文件布局（小端，各段按64字节对齐）:
+    header:  magic, version, reserved, count, source_mtime_ns, source_size
+    ids:     int64[count]   升序，id相同的记录保持文件中的顺序
+    offsets: uint64[count]  对应行在源文件中的字节偏移
+
+与 iter_record_lines 一样跳过格式不符的行；3列格式的id为行号（按 \\n 分行计数）
+"""
+
+import codecs
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import phase_timer, timed
+from spatial_keyword_engine import parse_record_line
+
+MAGIC = b'OBIRIDX\0'
+VERSION = 1
+# 索引文件与源文件同目录，扩展名追加 .obidx
+INDEX_SUFFIX = '.obidx'
+# 读取单条记录时一次读取的字节数，行更长时继续读取
+READ_SIZE = 4096
+
+_HEADER = struct.Struct('<8sIIQqQ')
+_ALIGN = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(count: int) -> Tuple[int, int, int]:
+    """ids、offsets 的起始偏移和文件总长"""
+    ids_at = _align(_HEADER.size)
+    offsets_at = _align(ids_at + 8 * count)
+    return ids_at, offsets_at, offsets_at + 8 * count
+
+
+@timed('record_index', 'build')
+def build_index(source_file: str, index_file: Optional[str] = None) -> str:
+    """扫描记录文件生成索引文件，返回输出路径；先写临时文件再原子替换"""
+    if sys.byteorder != 'little':
+        raise RuntimeError('索引文件按小端格式写入，当前平台不支持')
+    index_file = index_file or source_file + INDEX_SUFFIX
+    st = os.stat(source_file)
+
+    ids, offsets = array('q'), array('Q')
+    with open(source_file, 'rb') as f:
+        offset = 0
+        for line_no, line in enumerate(f):
+            text = line[len(codecs.BOM_UTF8):] if line_no == 0 and line.startswith(codecs.BOM_UTF8) else line
+            record = parse_record_line(text.decode('utf-8'), line_no)
+            if record is not None:
+                ids.append(record[0])
+                offsets.append(offset)
+            offset += len(line)
+
+    ids = np.frombuffer(ids, dtype=np.int64) if ids else np.zeros(0, dtype=np.int64)
+    offsets = np.frombuffer(offsets, dtype=np.uint64) if offsets else np.zeros(0, dtype=np.uint64)
+    with phase_timer('record_index', 'sort'):
+        order = np.argsort(ids, kind='stable')
+    ids_at, offsets_at, _ = _layout(len(ids))
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_file)), suffix=INDEX_SUFFIX + '.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, 0, len(ids), st.st_mtime_ns, st.st_size))
+        out.write(b'\0' * (ids_at - out.tell()))
+        out.write(ids[order].astype('<i8').tobytes())
+        out.write(b'\0' * (offsets_at - out.tell()))
+        out.write(offsets[order].astype('<u8').tobytes())
+    os.replace(tmp_path, index_file)
+    return index_file
+
+
+class RecordIndex:
+    """内存映射的只读索引；ids/offsets 为指向映射区的NumPy视图"""
+
+    def __init__(self, source_file: str, index_file: str):
+        self.source_file = source_file
+        self.index_file = index_file
+        with open(index_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f'索引文件不完整: {index_file}')
+        magic, version, _, count, mtime_ns, size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'不是记录索引文件: {index_file}')
+        if version != VERSION:
+            raise ValueError(f'记录索引文件版本不支持: {version}（当前版本 {VERSION}）')
+        ids_at, offsets_at, total = _layout(count)
+        if len(self._mmap) < total:
+            raise ValueError(f'索引文件不完整: {index_file}')
+
+        self.source_mtime_ns = mtime_ns
+        self.source_size = size
+        buffer = memoryview(self._mmap)
+        self.ids = np.frombuffer(buffer, dtype='<i8', count=count, offset=ids_at)
+        self.offsets = np.frombuffer(buffer, dtype='<u8', count=count, offset=offsets_at)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def matches_source(self) -> bool:
+        """生成索引时记录的源文件mtime/size与当前源文件是否一致"""
+        try:
+            st = os.stat(self.source_file)
+        except OSError:
+            return False
+        return st.st_mtime_ns == self.source_mtime_ns and st.st_size == self.source_size
+
+    def _read_line(self, fd: int, offset: int) -> str:
+        chunks = []
+        while True:
+            data = os.pread(fd, READ_SIZE, offset)
+            end = data.find(b'\n')
+            if end >= 0 or len(data) < READ_SIZE:
+                chunks.append(data if end < 0 else data[:end])
+                break
+            chunks.append(data)
+            offset += len(data)
+        line = b''.join(chunks)
+        if line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        return line.decode('utf-8')
+
+    @timed('record_index', 'lookup')
+    def lookup(self, ids: Iterable[int]) -> List[Optional[Tuple[int, str, float, float]]]:
+        """
+        按id批量读取记录，返回与输入顺序对应的 (id, name, x=lng, y=lat)，不存在的id为None
+
+        id相同的多条记录返回文件中的第一条；按偏移顺序读取，相邻记录落在同一页时不重复读盘
+        """
+        wanted = np.fromiter(ids, dtype=np.int64)
+        slots = np.searchsorted(self.ids, wanted)
+        found = slots < len(self.ids)
+        found[found] = self.ids[slots[found]] == wanted[found]
+
+        results: List[Optional[Tuple[int, str, float, float]]] = [None] * len(wanted)
+        hits = np.flatnonzero(found)
+        offsets = self.offsets[slots[hits]]
+        by_offset = np.argsort(offsets, kind='stable')
+        fd = os.open(self.source_file, os.O_RDONLY)
+        try:
+            cache: Dict[int, Optional[Tuple[int, str, float, float]]] = {}
+            for i, offset in zip(hits[by_offset].tolist(), offsets[by_offset].tolist()):
+                record = cache.get(offset)
+                if record is None:
+                    record = cache[offset] = parse_record_line(self._read_line(fd, offset), int(wanted[i]))
+                if record is not None:
+                    # 3列格式的id为行号，即查找用的id
+                    results[i] = (int(wanted[i]),) + record[1:]
+        finally:
+            os.close(fd)
+        return results
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_record_index(source_file: str) -> RecordIndex:
+    """
+    加载记录文件的id索引
+
+    旁边没有索引文件、或索引与源文件mtime/size不一致时先重新生成。同一文件在进程内只映射一次
+    """
+    index_file = source_file + INDEX_SUFFIX
+    with _indexes_lock:
+        index = _indexes.get(index_file)
+        if index is not None and index.matches_source():
+            return index
+        index = None
+        if os.path.exists(index_file):
+            try:
+                index = RecordIndex(source_file, index_file)
+            except ValueError:
+                index = None
+        if index is None or not index.matches_source():
+            index = RecordIndex(source_file, build_index(source_file, index_file))
+        _indexes[index_file] = index
+        return index
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    if len(sys.argv) < 2:
+        print("用法: python record_index.py <data_file> [id ...]")
+        sys.exit(1)
+
+    index = load_record_index(sys.argv[1])
+    print(f"{index.index_file}，共 {len(index)} 条记录")
+    if len(sys.argv) > 2:
+        for record in index.lookup(int(arg) for arg in sys.argv[2:]):
+            print(record)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SVG渲染结果缓存
+以 (生成器, 输入文件路径及其mtime/size, 渲染参数) 为键，LRU淘汰并限制总内存；
+未命中时经 render_executor 生成，相同键的并发请求只生成一次
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from render_executor import render_executor
+
+# 默认缓存上限
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def file_fingerprint(path: Optional[str]) -> Tuple:
+    """文件版本指纹：路径 + 修改时间 + 大小，文件不存在时只保留路径"""
+    if not path:
+        return (None,)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (os.path.abspath(path),)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def estimate_size(value: Any) -> int:
+    """粗略估计渲染结果占用的内存字节数"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, generator: str, paths: Iterable[Optional[str]], params: Any = None) -> Hashable:
+        """构造缓存键，参数需可哈希（dict会被转换为排序后的元组）"""
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        return (generator, tuple(file_fingerprint(p) for p in paths), params)
+
+    def get_or_render(self, generator: str, paths: Iterable[Optional[str]],
+                      render: Callable[[], Any], params: Any = None, offload: bool = False,
+                      finish: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        命中则直接返回缓存结果，否则调用render()生成并写入缓存
+
+        同一键的并发未命中只调用一次render()，其余请求等待同一结果；
+        offload为真时render()在渲染进程中执行，需可pickle（如 functools.partial 包装的方法）。
+        finish 在调用进程中处理render()的返回值（如取出不应缓存的部分交给调用方自己保存），
+        其返回值写入缓存并返回；等待同一结果的请求各自调用一次，因此需可重复调用且不修改参数。
+        render抛出异常时不写入缓存；返回值会被多个请求共享，调用方不应修改
+        """
+        key = self.make_key(generator, paths, params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = render_executor.run((id(self), key), render, offload)
+        if finish is not None:
+            value = finish(value)
+        self._store(key, value)
+        return value
+
+    def lookup(self, generator: str, paths: Iterable[Optional[str]], params: Any = None) -> Any:
+        """只查询不生成，未命中返回None（用于流式输出，未命中时不写入缓存）"""
+        key = self.make_key(generator, paths, params)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        return None
+
+    def _store(self, key: Hashable, value: Any):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中统计，供 /api/health 展示"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+
+# 所有SVG生成器共享的缓存实例
+render_cache = RenderCache(
+    max_entries=int(os.environ.get('OBIR_RENDER_CACHE_ENTRIES', DEFAULT_MAX_ENTRIES)),
+    max_bytes=int(os.environ.get('OBIR_RENDER_CACHE_BYTES', DEFAULT_MAX_BYTES))
+)
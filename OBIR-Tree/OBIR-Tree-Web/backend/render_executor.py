@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+渲染任务执行器
+- 合并（single-flight）：同一缓存键（生成器 + 输入文件版本 + 参数）的渲染同一时间只计算一次，
+  计算期间到达的相同请求等待同一个结果，突发的N个相同请求只渲染一次；
+- 进程池：CPU密集的SVG渲染交给独立的渲染进程，不占用处理请求的线程（也不受GIL限制）；
+  排队中和计算中的任务数有上限，超出时立即报错而不是无限堆积。
+渲染进程按需创建（spawn方式，不继承请求线程的锁状态），某个渲染进程异常退出后下次提交时重建进程池。
+渲染进程中记录的阶段耗时和缓存命中次数随结果一起交回，计入提交任务的进程的指标（渲染进程本身不被抓取）。
+
+执行器是进程内的：serve.py 的每个worker各有一个执行器和一组渲染进程（数量见 serve.py 的 --render-workers），
+合并只在同一worker内生效，不同worker收到的相同请求各自渲染一次
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Hashable, Optional
+import metrics
+
+# 默认渲染进程数，0表示在请求线程中渲染（仍合并相同请求）
+DEFAULT_WORKERS = 2
+# 默认的排队上限（正在计算和等待计算的不同任务数）
+DEFAULT_MAX_PENDING = 32
+# 等待渲染结果的默认超时（秒）
+DEFAULT_TIMEOUT = 60.0
+
+
+class RenderQueueFull(RuntimeError):
+    """渲染队列已满"""
+
+
+def _run_in_worker(render: Callable[[], Any]):
+    """
+    在渲染进程中执行render()，返回 (结果, 异常, 本次渲染的指标增量)
+
+    渲染进程一次只执行一个任务，取出并清零的指标即为这次渲染产生的部分
+    """
+    metrics.registry.drain()
+    try:
+        value = render()
+    except Exception as e:
+        return None, e, metrics.registry.drain()
+    return value, None, metrics.registry.drain()
+
+
+class RenderExecutor:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT):
+        """
+        Args:
+            workers: 渲染进程数，0表示不使用进程池
+            max_pending: 交给进程池的、尚未完成的不同任务数上限
+            timeout: 等待结果的超时（秒），None为一直等待
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[Hashable, Future] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def run(self, key: Hashable, render: Callable[[], Any], offload: bool = False) -> Any:
+        """
+        计算render()并返回结果；同一key已有计算在进行时等待其结果
+
+        Args:
+            key: 任务标识，通常为渲染缓存键
+            render: 无参数的渲染函数；offload为真时需可pickle（如模块级函数或 functools.partial）
+            offload: 是否交给渲染进程（workers为0时忽略）
+        """
+        offload = offload and self.workers > 0
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                if offload and self._pending >= self.max_pending:
+                    self.rejected += 1
+                    raise RenderQueueFull(f'渲染队列已满（{self.max_pending}个任务），请稍后重试')
+                future = Future()
+                self._inflight[key] = future
+                self.executed += 1
+                if offload:
+                    self._pending += 1
+                leader = True
+
+        if leader:
+            if offload:
+                self._submit(key, future, render)
+            else:
+                self._run_inline(key, future, render)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # 渲染仍在继续，完成后的结果照常交给其余等待者
+            raise TimeoutError(f'渲染超时（{self.timeout}秒）') from None
+
+    def _run_inline(self, key: Hashable, future: Future, render: Callable[[], Any]):
+        try:
+            value = render()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value=value)
+
+    def _submit(self, key: Hashable, future: Future, render: Callable[[], Any]):
+        try:
+            with self._lock:
+                pool = self._get_pool()
+            task = pool.submit(_run_in_worker, render)
+        except BaseException as e:
+            self._finish(key, future, error=e, offloaded=True)
+            return
+
+        def done(task: Future):
+            error = task.exception()
+            value = None
+            if error is None:
+                value, error, delta = task.result()
+                metrics.registry.merge(delta)
+            self._finish(key, future, value=value, error=error, offloaded=True)
+
+        task.add_done_callback(done)
+
+    def _finish(self, key: Hashable, future: Future, value: Any = None,
+                error: Optional[BaseException] = None, offloaded: bool = False):
+        """先移出进行中的任务再公布结果：之后到达的相同请求由调用方的缓存命中或重新计算"""
+        with self._lock:
+            self._inflight.pop(key, None)
+            if offloaded:
+                self._pending -= 1
+            if error is not None:
+                self.failed += 1
+                if isinstance(error, BrokenProcessPool):
+                    # 渲染进程异常退出后进程池不可再用，下次提交时重建
+                    self._pool = None
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def stats(self) -> Dict[str, Any]:
+        """执行/合并/拒绝次数，供 /api/health 和 /api/metrics 展示"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'inflight': len(self._inflight),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'failed': self.failed
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _env_timeout() -> Optional[float]:
+    value = float(os.environ.get('OBIR_RENDER_TIMEOUT', DEFAULT_TIMEOUT))
+    return value if value > 0 else None
+
+
+# 所有渲染缓存共享的执行器
+render_executor = RenderExecutor(
+    workers=int(os.environ.get('OBIR_RENDER_WORKERS', DEFAULT_WORKERS)),
+    max_pending=int(os.environ.get('OBIR_RENDER_QUEUE', DEFAULT_MAX_PENDING)),
+    timeout=_env_timeout()
+)
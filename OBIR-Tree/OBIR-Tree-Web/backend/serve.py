@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产模式启动入口
+以gunicorn预派生（prefork）多进程方式运行 app.py 中的同一组路由：SVG渲染等CPU密集任务分散到多个worker进程，
+每个worker用线程池处理并发连接（SSE长连接只占用线程，不会占满进程）；
+worker在接受请求前完成预热，记录文件变化时主进程平滑重启全部worker；
+主进程创建各worker共享的运行目录（OBIR_RUN_DIR），用于跨worker只执行一次的工作（如实时快照的监视和计算）。
+渲染执行器（render_executor）的进程池、相同请求的合并和渲染缓存都在各worker进程内：
+每个worker各有 --render-workers 个渲染进程，不同worker收到的相同请求各自渲染一次
+
+用法:
+    python serve.py --workers 8 --bind 0.0.0.0:5000
+开发调试仍可直接运行 python app.py
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from gunicorn.app.base import BaseApplication
+
+from render_cache import file_fingerprint
+from render_executor import render_executor
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# 数据文件检查间隔（秒）
+WATCH_INTERVAL = 2.0
+
+
+def default_watch_files():
+    """
+    需要重启worker才能生效的数据文件：记录文件（Top-K索引在启动时构建）及其列式点数据；
+    data/ 下的SVG数据文件由渲染缓存按mtime自动失效，无需重启
+    """
+    records_file = os.environ.get('OBIR_RECORDS_FILE', os.path.join(BACKEND_DIR, '../public/mock/10.txt'))
+    files = [records_file]
+    extra = os.environ.get('OBIR_RELOAD_WATCH', '')
+    for pattern in filter(None, extra.split(os.pathsep)):
+        files.extend(glob.glob(pattern))
+    return files
+
+
+def prepare_run_dir():
+    """
+    创建各worker共享的运行目录并通过环境变量传给worker，返回 (路径, 是否由本进程创建)
+
+    已设置 OBIR_RUN_DIR 时沿用该目录（不在退出时删除），但清除上次运行留下的指标快照
+    """
+    run_dir = os.environ.get('OBIR_RUN_DIR')
+    if run_dir:
+        os.makedirs(run_dir, exist_ok=True)
+        shutil.rmtree(os.path.join(run_dir, 'metrics'), ignore_errors=True)
+        return run_dir, False
+    run_dir = tempfile.mkdtemp(prefix='obir-run-')
+    os.environ['OBIR_RUN_DIR'] = run_dir
+    return run_dir, True
+
+
+def default_render_workers(workers):
+    """
+    每个worker的渲染进程数：各worker的渲染进程合计不超过CPU核数；
+    worker数不少于核数时为0，直接在请求线程中渲染（worker进程本身已占满各核，仍合并相同请求）
+    """
+    return (os.cpu_count() or 1) // max(workers, 1)
+
+
+def watch_files(paths, interval, on_change, stop_event):
+    """
+    轮询文件指纹，变化且连续两次检查结果一致（写入已完成）后调用on_change
+    """
+    last = [file_fingerprint(p) for p in paths]
+    pending = None
+    while not stop_event.wait(interval):
+        current = [file_fingerprint(p) for p in paths]
+        if current == last:
+            pending = None
+            continue
+        if current != pending:
+            pending = current
+            continue
+        last, pending = current, None
+        on_change()
+
+
+class OBIRApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        from app import app
+        return app
+
+
+def build_options(args, run_dir=None, owns_run_dir=False):
+    stop_event = threading.Event()
+
+    def when_ready(server):
+        if args.watch_interval <= 0:
+            return
+        if args.preload:
+            server.log.warning('预加载模式下重启worker不会重新加载数据，不监视数据文件')
+            return
+        paths = default_watch_files()
+        server.log.info('监视数据文件: %s', ', '.join(paths))
+
+        def reload_workers():
+            server.log.info('数据文件已变化，平滑重启worker')
+            # 交给主进程的信号处理循环执行，不在监视线程里直接操作arbiter
+            os.kill(os.getpid(), signal.SIGHUP)
+
+        threading.Thread(target=watch_files, args=(paths, args.watch_interval, reload_workers, stop_event),
+                         name='obir-data-watcher', daemon=True).start()
+
+    def on_exit(server):
+        stop_event.set()
+        if owns_run_dir:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    def post_worker_init(worker):
+        if args.no_warmup:
+            return
+        start = time.perf_counter()
+        from app import warm_up
+        warm_up()
+        worker.log.info('worker %s 预热完成，用时 %.2fs', worker.pid, time.perf_counter() - start)
+
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        # 预加载时worker共享主进程中已构建的索引（写时复制），但数据变化后的重启不会重新加载数据
+        'preload_app': args.preload,
+        'chdir': BACKEND_DIR,
+        'accesslog': '-' if args.access_log else None,
+        'when_ready': when_ready,
+        'on_exit': on_exit,
+        'post_worker_init': post_worker_init,
+    }
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    parser = argparse.ArgumentParser(description='以多进程方式运行IR-Tree SVG API服务')
+    parser.add_argument('--bind', default=os.environ.get('OBIR_BIND', '0.0.0.0:5000'), help='监听地址')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('OBIR_WORKERS', os.cpu_count() or 1)),
+                        help='worker进程数，默认CPU核数')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('OBIR_THREADS', 8)),
+                        help='每个worker的线程数（SSE长连接各占一个线程）')
+    parser.add_argument('--render-workers', type=int, default=None,
+                        help='每个worker的渲染进程数（OBIR_RENDER_WORKERS），默认CPU核数除以worker数')
+    parser.add_argument('--timeout', type=int, default=120, help='worker无响应多少秒后被重启')
+    parser.add_argument('--graceful-timeout', type=int, default=30, help='重启时等待正在处理的请求完成的秒数')
+    parser.add_argument('--watch-interval', type=float, default=WATCH_INTERVAL,
+                        help='数据文件检查间隔（秒），0表示不监视')
+    parser.add_argument('--preload', action='store_true', help='在主进程中预加载应用（省内存，但数据变化时不会重新加载）')
+    parser.add_argument('--no-warmup', action='store_true', help='worker启动时不预热')
+    parser.add_argument('--access-log', action='store_true', help='输出访问日志')
+    args = parser.parse_args()
+
+    # 在加载应用（预加载模式）和派生worker之前设置，worker继承该环境变量
+    run_dir, owns_run_dir = prepare_run_dir()
+    render_workers = args.render_workers
+    if render_workers is None:
+        render_workers = int(os.environ.get('OBIR_RENDER_WORKERS', default_render_workers(args.workers)))
+    # 渲染进程池按worker创建，合计 workers * render_workers 个渲染进程；
+    # 执行器已随 render_cache 在主进程中导入，worker由主进程fork而来，因此直接设置（进程池在第一次提交时才创建）
+    os.environ['OBIR_RENDER_WORKERS'] = str(render_workers)
+    render_executor.workers = render_workers
+    OBIRApplication(build_options(args, run_dir, owns_run_dir)).run()
+
+
+if __name__ == "__main__":
+    main()
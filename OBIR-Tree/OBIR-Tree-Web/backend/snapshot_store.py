@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OBIR-Tree快照历史
+依次接收OBIR-Tree的各个状态，按版本号保存在目录中：每隔CHECKPOINT_INTERVAL个版本存一次完整快照（检查点），
+其余版本只存相对上一版本的增量（新增/修改的节点、删除的节点、边的增删），均为zlib压缩的msgpack。
+只保留最近约HISTORY_SIZE个版本（按检查点整段淘汰，保留的每个版本都能还原）。
+还原某个版本时从不晚于它的检查点（或进程内缓存的更近版本）开始依次应用增量，
+至多读取一个检查点和CHECKPOINT_INTERVAL-1个增量，各增量在同一份id→节点字典上依次应用，不重新读取和解析完整的JSON文件。
+追加版本时持有目录下的文件锁，多个工作进程共享同一份历史
+"""
+
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import msgspec
+from metrics import phase_timer, timed
+from render_cache import file_fingerprint
+from tree_schema import Edge, Node, NodeId, TreeDocument, load_tree
+
+# 保留的版本数
+HISTORY_SIZE = 256
+# 检查点间隔：还原任意版本至多应用 CHECKPOINT_INTERVAL-1 个增量
+CHECKPOINT_INTERVAL = 16
+# 进程内缓存的已还原版本数
+DOC_CACHE_SIZE = 8
+# 压缩级别
+COMPRESS_LEVEL = 6
+
+# 版本文件：u32头部长度 | 头部（msgpack） | 压缩后的正文
+_HEADER_LENGTH = struct.Struct('<I')
+_SUFFIX = '.snap'
+
+
+class SnapshotHeader(msgspec.Struct):
+    """版本元数据；parent为None表示检查点"""
+    version: int
+    timestamp: float
+    digest: str
+    node_count: int
+    edge_count: int
+    parent: Optional[int] = None
+
+
+class SnapshotDelta(msgspec.Struct):
+    """
+    相对上一版本的增量
+
+    节点和边的顺序影响布局，顺序无法由“旧顺序去掉删除项再追加新增项”得到时，才保存完整的id/边序列
+    """
+    upserts: List[Node] = []
+    removed: List[NodeId] = []
+    order: Optional[List[NodeId]] = None
+    edges_added: List[Edge] = []
+    edges_removed: List[Edge] = []
+    edge_order: Optional[List[Edge]] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+
+def document_digest(doc: TreeDocument) -> str:
+    """快照内容摘要（与JSON的格式、空白无关），相同内容不重复入库"""
+    return hashlib.blake2b(msgspec.msgpack.encode(doc), digest_size=16).hexdigest()
+
+
+def compute_delta(previous: TreeDocument, current: TreeDocument) -> SnapshotDelta:
+    """计算从previous到current的增量"""
+    previous_nodes = {node.id: node for node in previous.nodes}
+    current_ids = {node.id for node in current.nodes}
+    upserts = [node for node in current.nodes if previous_nodes.get(node.id) != node]
+    removed = [node_id for node_id in previous_nodes if node_id not in current_ids]
+    derived = [node.id for node in previous.nodes if node.id in current_ids]
+    derived.extend(node.id for node in upserts if node.id not in previous_nodes)
+    order = [node.id for node in current.nodes]
+
+    previous_pairs = {(edge.source, edge.target) for edge in previous.edges}
+    current_pairs = {(edge.source, edge.target) for edge in current.edges}
+    edges_removed = [edge for edge in previous.edges if (edge.source, edge.target) not in current_pairs]
+    edges_added = [edge for edge in current.edges if (edge.source, edge.target) not in previous_pairs]
+    derived_edges = [edge for edge in previous.edges if (edge.source, edge.target) in current_pairs] + edges_added
+
+    return SnapshotDelta(
+        upserts=upserts,
+        removed=removed,
+        order=order if order != derived else None,
+        edges_added=edges_added,
+        edges_removed=edges_removed,
+        edge_order=list(current.edges) if derived_edges != current.edges else None,
+        metadata=current.metadata if current.metadata != previous.metadata else None
+    )
+
+
+def apply_delta(previous: TreeDocument, delta: SnapshotDelta) -> TreeDocument:
+    """在previous上应用增量得到新版本（不修改previous，未变化的节点记录与之共享）"""
+    nodes = {node.id: node for node in previous.nodes}
+    for node_id in delta.removed:
+        del nodes[node_id]
+    appended = []
+    for node in delta.upserts:
+        if node.id not in nodes:
+            appended.append(node.id)
+        nodes[node.id] = node
+    if delta.order is not None:
+        order = delta.order
+    else:
+        removed = set(delta.removed)
+        order = [node.id for node in previous.nodes if node.id not in removed] + appended
+
+    if delta.edge_order is not None:
+        edges = delta.edge_order
+    else:
+        removed_pairs = {(edge.source, edge.target) for edge in delta.edges_removed}
+        edges = [edge for edge in previous.edges if (edge.source, edge.target) not in removed_pairs]
+        edges.extend(delta.edges_added)
+
+    return TreeDocument(
+        nodes=[nodes[node_id] for node_id in order],
+        edges=edges,
+        metadata=delta.metadata if delta.metadata is not None else previous.metadata
+    )
+
+
+def _keeps_unique(delta: SnapshotDelta, edges: Dict[Tuple[NodeId, NodeId], Edge]) -> bool:
+    """应用增量后节点id、边（起点, 终点）仍各不相同"""
+    if delta.order is not None and len(set(delta.order)) != len(delta.order):
+        return False
+    if delta.edge_order is not None:
+        return len({(edge.source, edge.target) for edge in delta.edge_order}) == len(delta.edge_order)
+    added = {(edge.source, edge.target) for edge in delta.edges_added}
+    return len(added) == len(delta.edges_added) and added.isdisjoint(edges)
+
+
+def apply_deltas(base: TreeDocument, deltas: List[SnapshotDelta]) -> TreeDocument:
+    """
+    在base上依次应用一串增量（不修改base），结果与逐个调用apply_delta相同
+
+    id→节点、(起点, 终点)→边的有序字典只建立一次，各增量只处理其中变化的部分，
+    开销为检查点大小加各增量大小之和；出现重复的节点id或边时改为逐个调用apply_delta
+    """
+    if not deltas:
+        return base
+    nodes = {node.id: node for node in base.nodes}
+    edges = {(edge.source, edge.target): edge for edge in base.edges}
+    if len(nodes) != len(base.nodes) or len(edges) != len(base.edges):
+        for delta in deltas:
+            base = apply_delta(base, delta)
+        return base
+
+    metadata = base.metadata
+    for index, delta in enumerate(deltas):
+        if not _keeps_unique(delta, edges):
+            doc = TreeDocument(nodes=list(nodes.values()), edges=list(edges.values()), metadata=metadata)
+            return apply_deltas(apply_delta(doc, delta), deltas[index + 1:])
+        for node_id in delta.removed:
+            del nodes[node_id]
+        # 已有的id保持原位置，新增的id追加在末尾，与apply_delta推导的顺序相同
+        for node in delta.upserts:
+            nodes[node.id] = node
+        if delta.order is not None:
+            nodes = {node_id: nodes[node_id] for node_id in delta.order}
+
+        if delta.edge_order is not None:
+            edges = {(edge.source, edge.target): edge for edge in delta.edge_order}
+        else:
+            for edge in delta.edges_removed:
+                edges.pop((edge.source, edge.target), None)
+            for edge in delta.edges_added:
+                edges[(edge.source, edge.target)] = edge
+        if delta.metadata is not None:
+            metadata = delta.metadata
+
+    return TreeDocument(nodes=list(nodes.values()), edges=list(edges.values()), metadata=metadata)
+
+
+class SnapshotStore:
+    def __init__(self, directory: str, capacity: int = HISTORY_SIZE,
+                 checkpoint_interval: int = CHECKPOINT_INTERVAL):
+        self.directory = directory
+        self.capacity = max(int(capacity), 1)
+        self.checkpoint_interval = max(int(checkpoint_interval), 1)
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ingested = {}
+        self._encoder = msgspec.msgpack.Encoder()
+        self._header_decoder = msgspec.msgpack.Decoder(SnapshotHeader)
+        self._base_decoder = msgspec.msgpack.Decoder(TreeDocument)
+        self._delta_decoder = msgspec.msgpack.Decoder(SnapshotDelta)
+
+    # ---- 文件 ----
+
+    def _path(self, version: int) -> str:
+        return os.path.join(self.directory, f'{version:010d}{_SUFFIX}')
+
+    def _list_versions(self) -> List[int]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-len(_SUFFIX)]) for name in names
+                      if name.endswith(_SUFFIX) and name[:-len(_SUFFIX)].isdigit())
+
+    def _write(self, header: SnapshotHeader, body: Any):
+        head = self._encoder.encode(header)
+        payload = zlib.compress(self._encoder.encode(body), COMPRESS_LEVEL)
+        path = self._path(header.version)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER_LENGTH.pack(len(head)) + head + payload)
+        os.replace(tmp_path, path)
+
+    def _read_header(self, version: int) -> SnapshotHeader:
+        try:
+            with open(self._path(version), 'rb') as f:
+                (length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+                return self._header_decoder.decode(f.read(length))
+        except FileNotFoundError:
+            raise KeyError(f'快照版本不存在或已被淘汰: {version}') from None
+
+    def _read(self, version: int) -> Tuple[SnapshotHeader, Any]:
+        try:
+            with open(self._path(version), 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raise KeyError(f'快照版本不存在或已被淘汰: {version}') from None
+        (length,) = _HEADER_LENGTH.unpack_from(raw)
+        start = _HEADER_LENGTH.size
+        header = self._header_decoder.decode(raw[start:start + length])
+        body = zlib.decompress(raw[start + length:])
+        decoder = self._base_decoder if header.parent is None else self._delta_decoder
+        return header, decoder.decode(body)
+
+    def _file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(os.path.join(self.directory, '.lock'), 'a+b')
+
+    # ---- 还原 ----
+
+    def _cached(self, version: int) -> Optional[TreeDocument]:
+        with self._lock:
+            entry = self._docs.get(version)
+            if entry is not None:
+                self._docs.move_to_end(version)
+            return entry
+
+    def _remember(self, version: int, doc: TreeDocument):
+        with self._lock:
+            self._docs[version] = doc
+            self._docs.move_to_end(version)
+            while len(self._docs) > DOC_CACHE_SIZE:
+                self._docs.popitem(last=False)
+
+    @timed('obir_history', 'restore')
+    def get(self, version: int) -> TreeDocument:
+        """
+        还原指定版本（返回的记录被多个请求共享，调用方不应修改）
+
+        从最近的检查点或进程内已缓存的更近版本开始，依次应用增量
+        """
+        version = int(version)
+        doc = self._cached(version)
+        if doc is not None:
+            return doc
+
+        # 向前找到检查点，途中遇到已缓存的版本即可停止
+        chain = []
+        current = version
+        while True:
+            doc = self._cached(current)
+            if doc is not None:
+                break
+            header, body = self._read(current)
+            if header.parent is None:
+                doc = body
+                break
+            chain.append(body)
+            current = header.parent
+        doc = apply_deltas(doc, chain[::-1])
+        self._remember(version, doc)
+        return doc
+
+    # ---- 写入 ----
+
+    @timed('obir_history', 'ingest')
+    def ingest(self, doc: TreeDocument, timestamp: Optional[float] = None) -> int:
+        """
+        追加一个状态，返回其版本号；与最新版本内容相同时不新增版本
+
+        新版本是检查点时保存完整快照，否则保存相对最新版本的增量；之后淘汰超出容量的旧版本
+        """
+        digest = document_digest(doc)
+        with self._file_lock() as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            versions = self._list_versions()
+            latest = versions[-1] if versions else None
+            if latest is not None and self._read_header(latest).digest == digest:
+                return latest
+
+            version = latest + 1 if latest is not None else 1
+            header = SnapshotHeader(
+                version=version,
+                timestamp=time.time() if timestamp is None else timestamp,
+                digest=digest,
+                node_count=len(doc.nodes),
+                edge_count=len(doc.edges)
+            )
+            if latest is None or (version - 1) % self.checkpoint_interval == 0:
+                body = doc
+            else:
+                with phase_timer('obir_history', 'delta'):
+                    body = compute_delta(self.get(latest), doc)
+                header.parent = latest
+            self._write(header, body)
+            self._remember(version, doc)
+            self._prune(versions + [version])
+            return version
+
+    def ingest_file(self, path: str) -> Optional[int]:
+        """读取快照文件并入库；文件指纹未变化时只做stat。文件不存在时返回None"""
+        fingerprint = file_fingerprint(path)
+        if len(fingerprint) == 1:
+            return None
+        with self._lock:
+            entry = self._ingested.get(path)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        version = self.ingest(load_tree(path))
+        with self._lock:
+            self._ingested[path] = (fingerprint, version)
+        return version
+
+    def _prune(self, versions: List[int]):
+        """淘汰旧版本：保留最近capacity个版本所依赖的最早检查点及之后的全部版本"""
+        if len(versions) <= self.capacity:
+            return
+        keep_from = versions[-self.capacity]
+        header = self._read_header(keep_from)
+        while header.parent is not None:
+            keep_from = header.parent
+            header = self._read_header(keep_from)
+        for version in versions:
+            if version >= keep_from:
+                break
+            try:
+                os.remove(self._path(version))
+            except FileNotFoundError:
+                pass
+
+    # ---- 查询 ----
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """全部保留版本的元数据（只读取各文件的头部）"""
+        result = []
+        for version in self._list_versions():
+            try:
+                header = self._read_header(version)
+            except KeyError:
+                # 与淘汰并发，文件已被删除
+                continue
+            result.append({
+                'version': header.version,
+                'timestamp': header.timestamp,
+                'digest': header.digest,
+                'node_count': header.node_count,
+                'edge_count': header.edge_count,
+                'checkpoint': header.parent is None
+            })
+        return result
+
+    def header(self, version: int) -> SnapshotHeader:
+        """单个版本的元数据"""
+        return self._read_header(int(version))
+
+    def latest(self) -> Optional[int]:
+        versions = self._list_versions()
+        return versions[-1] if versions else None
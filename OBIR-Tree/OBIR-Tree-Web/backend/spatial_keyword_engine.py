@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+空间关键词Top-K查询引擎
+读取 `id name lat lng`（c_for_data/data.txt）或 `name lng lat`（public/mock/10.txt）格式的记录，
+构建IR-Tree索引（R-Tree节点附带关键词倒排信息），按空间距离与关键词相似度的加权得分做best-first检索；
+指定编辑距离时，查询关键词与词表中编辑距离不超过该值的关键词都算作命中（见 fuzzy_index.py）
+"""
+
+import heapq
+import math
+import re
+import sys
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from fuzzy_index import FuzzyTermIndex, levenshtein
+from metrics import phase_timer, timed
+
+# 叶子/内部节点的最大扇出
+NODE_CAPACITY = 64
+# 批量查询时把数据范围切成 BATCH_GRID x BATCH_GRID 的网格，同一关键词、同一网格内的查询共享一次索引遍历
+BATCH_GRID = 64
+# 每组共享遍历的最大查询数
+BATCH_GROUP_SIZE = 64
+# 枢轴第k近邻半径内至少有这么多条查询时才共享一次索引遍历，否则逐条best-first检索
+BATCH_MIN_SHARED = 4
+# 共享遍历得到的候选记录超过该数量时（k很大或关键词区分度低），这些查询退回逐条best-first检索
+BATCH_MAX_CANDIDATES = 20000
+# 近似匹配允许的最大编辑距离
+MAX_FUZZY_DISTANCE = 3
+
+# 关键词切分：非字母数字字符、驼峰边界
+_SPLIT_RE = re.compile(r'[^0-9A-Za-z\u4e00-\u9fff]+')
+_CAMEL_RE = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+
+def tokenize(text: str) -> List[str]:
+    """将名称切分为小写关键词，如 SunWenzheHealthClinic -> sun/wenzhe/health/clinic"""
+    terms = []
+    for part in _SPLIT_RE.split(text):
+        if not part:
+            continue
+        for term in _CAMEL_RE.split(part):
+            if term:
+                terms.append(term.lower())
+    return terms
+
+
+class Record:
+    """单条空间文本对象"""
+    __slots__ = ('rect_id', 'name', 'x', 'y', 'terms')
+
+    def __init__(self, rect_id: int, name: str, x: float, y: float, terms: Tuple[int, ...]):
+        self.rect_id = rect_id
+        self.name = name
+        self.x = x
+        self.y = y
+        self.terms = terms
+
+
+class IRNode:
+    """IR-Tree节点：MBR + 子节点/记录 + 子树关键词集合"""
+    __slots__ = ('min_x', 'min_y', 'max_x', 'max_y', 'children', 'is_leaf', 'terms')
+
+    def __init__(self, children: list, is_leaf: bool):
+        self.children = children
+        self.is_leaf = is_leaf
+        if is_leaf:
+            self.min_x = min(r.x for r in children)
+            self.min_y = min(r.y for r in children)
+            self.max_x = max(r.x for r in children)
+            self.max_y = max(r.y for r in children)
+            terms = set()
+            for r in children:
+                terms.update(r.terms)
+        else:
+            self.min_x = min(c.min_x for c in children)
+            self.min_y = min(c.min_y for c in children)
+            self.max_x = max(c.max_x for c in children)
+            self.max_y = max(c.max_y for c in children)
+            terms = set()
+            for c in children:
+                terms.update(c.terms)
+        self.terms = frozenset(terms)
+
+    def min_dist(self, x: float, y: float) -> float:
+        """查询点到MBR的最小距离"""
+        dx = self.min_x - x if x < self.min_x else (x - self.max_x if x > self.max_x else 0.0)
+        dy = self.min_y - y if y < self.min_y else (y - self.max_y if y > self.max_y else 0.0)
+        return math.hypot(dx, dy)
+
+    def min_dist_box(self, min_x: float, min_y: float, max_x: float, max_y: float) -> float:
+        """查询点包围盒到MBR的最小距离（盒内任一查询点到MBR的距离都不小于它）"""
+        dx = max(self.min_x - max_x, min_x - self.max_x, 0.0)
+        dy = max(self.min_y - max_y, min_y - self.max_y, 0.0)
+        return math.hypot(dx, dy)
+
+
+def _fuzzy_matched(term_groups: Tuple[frozenset, ...], terms) -> int:
+    """近似匹配时的命中数：与terms有交集的查询关键词组数（每个查询关键词最多算一次）"""
+    return sum(1 for group in term_groups if not group.isdisjoint(terms))
+
+
+def _box_dist(x: float, y: float, min_x: float, min_y: float, max_x: float, max_y: float) -> float:
+    """点到包围盒的最小距离"""
+    dx = max(min_x - x, x - max_x, 0.0)
+    dy = max(min_y - y, y - max_y, 0.0)
+    return math.hypot(dx, dy)
+
+
+def parse_record_line(line: str, line_no: int) -> Optional[Tuple[int, str, float, float]]:
+    """
+    解析一行记录，返回 (id, name, x=lng, y=lat)，格式不符时返回None
+
+    4列格式为 `id name lat lng`；3列格式为 `name lng lat`，id取行号
+    """
+    parts = line.split()
+    try:
+        if len(parts) == 4:
+            return int(parts[0]), parts[1], float(parts[3]), float(parts[2])
+        if len(parts) == 3:
+            return line_no, parts[0], float(parts[1]), float(parts[2])
+    except ValueError:
+        pass
+    return None
+
+
+def iter_record_lines(data_file: str) -> Iterator[Tuple[int, str, float, float]]:
+    """逐行解析记录文件，产出 (id, name, x=lng, y=lat)，跳过格式不符的行"""
+    with open(data_file, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f):
+            record = parse_record_line(line, line_no)
+            if record is not None:
+                yield record
+
+
+def _str_pack(items: list, key_x, key_y, capacity: int) -> List[list]:
+    """Sort-Tile-Recursive分组"""
+    count = len(items)
+    leaf_count = math.ceil(count / capacity)
+    slab_count = math.ceil(math.sqrt(leaf_count))
+    slab_size = slab_count * capacity
+    items = sorted(items, key=key_x)
+    groups = []
+    for i in range(0, count, slab_size):
+        slab = sorted(items[i:i + slab_size], key=key_y)
+        for j in range(0, len(slab), capacity):
+            groups.append(slab[j:j + capacity])
+    return groups
+
+
+class SpatialKeywordEngine:
+    def __init__(self, records: List[Record], vocabulary: Dict[str, int], alpha: float = 0.5):
+        """
+        Args:
+            records: 已切分关键词的记录列表
+            vocabulary: 关键词 -> 关键词id
+            alpha: 空间距离权重，(1 - alpha) 为关键词不相似度权重
+        """
+        self.records = records
+        self.vocabulary = vocabulary
+        self.alpha = alpha
+        self._fuzzy_index = None
+        self._fuzzy_lock = threading.Lock()
+        self.root = self._bulk_load(records) if records else None
+        if self.root:
+            diagonal = math.hypot(self.root.max_x - self.root.min_x, self.root.max_y - self.root.min_y)
+            self.max_dist = diagonal or 1.0
+        else:
+            self.max_dist = 1.0
+
+    @classmethod
+    def from_file(cls, data_file: str, alpha: float = 0.5) -> 'SpatialKeywordEngine':
+        """从记录文件构建索引"""
+        return cls.from_records(iter_record_lines(data_file), alpha)
+
+    @classmethod
+    def from_records(cls, rows: Iterable[Tuple[int, str, float, float]], alpha: float = 0.5) -> 'SpatialKeywordEngine':
+        """从 (id, name, x, y) 序列构建索引，如 point_store.PointStore.iter_records()"""
+        vocabulary = {}
+        records = []
+        for rect_id, name, x, y in rows:
+            term_ids = []
+            for term in tokenize(name):
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id not in term_ids:
+                    term_ids.append(term_id)
+            records.append(Record(rect_id, name, x, y, tuple(term_ids)))
+        return cls(records, vocabulary, alpha)
+
+    def _bulk_load(self, records: List[Record]) -> IRNode:
+        """STR批量装载，自底向上构建IR-Tree"""
+        level = [IRNode(group, True) for group in
+                 _str_pack(records, lambda r: r.x, lambda r: r.y, NODE_CAPACITY)]
+        while len(level) > 1:
+            level = [IRNode(group, False) for group in
+                     _str_pack(level,
+                               lambda n: n.min_x + n.max_x,
+                               lambda n: n.min_y + n.max_y,
+                               NODE_CAPACITY)]
+        return level[0]
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        """数据集MBR中心，查询未给出坐标时使用"""
+        if not self.root:
+            return 0.0, 0.0
+        return (self.root.min_x + self.root.max_x) / 2, (self.root.min_y + self.root.max_y) / 2
+
+    @property
+    def fuzzy_index(self) -> FuzzyTermIndex:
+        """词表的近似匹配索引，第一次近似查询时构建"""
+        if self._fuzzy_index is None:
+            with self._fuzzy_lock:
+                if self._fuzzy_index is None:
+                    with phase_timer('query_engine', 'fuzzy_index_build'):
+                        self._fuzzy_index = FuzzyTermIndex(list(self.vocabulary))
+        return self._fuzzy_index
+
+    def similar_terms(self, term: str, max_distance: int) -> List[Tuple[str, int]]:
+        """词表中与term编辑距离不超过max_distance的关键词，(关键词, 编辑距离)，按距离升序"""
+        index = self.fuzzy_index
+        return [(index.terms[term_id], distance)
+                for term_id, distance in index.lookup(term.lower(), min(max_distance, MAX_FUZZY_DISTANCE))]
+
+    def _query_terms(self, keyword: str, fuzzy: int = 0) -> Tuple[frozenset, int, Optional[Tuple[frozenset, ...]]]:
+        """
+        返回 (可命中的关键词id集合, 查询关键词总数, 近似匹配时每个查询关键词可命中的id集合)
+
+        精确匹配时第三项为None，命中数即id集合与记录关键词的交集大小；
+        近似匹配时一个查询关键词可能对应多个词表关键词，命中数按组计算
+        """
+        terms = set(tokenize(keyword))
+        if fuzzy <= 0:
+            ids = frozenset(self.vocabulary[t] for t in terms if t in self.vocabulary)
+            return ids, len(terms), None
+        distance = min(int(fuzzy), MAX_FUZZY_DISTANCE)
+        term_groups = []
+        for term in sorted(terms):
+            group = frozenset(term_id for term_id, _ in self.fuzzy_index.lookup(term, distance))
+            if group:
+                term_groups.append(group)
+        return frozenset().union(*term_groups), len(terms), tuple(term_groups)
+
+    def _weights(self, total: int) -> Tuple[float, float, float]:
+        """返回 (空间距离系数, 每个命中关键词的减分, 关键词不相似度基数)，得分 = 前者 * 距离 + 基数 - 减分 * 命中数"""
+        space_weight = self.alpha / self.max_dist
+        text_weight = (1.0 - self.alpha) / total if total else 0.0
+        return space_weight, text_weight, 1.0 - self.alpha
+
+    def _best_first(self, query_ids: frozenset, total: int, x: float, y: float, k: int,
+                    term_groups: Optional[Tuple[frozenset, ...]] = None) -> List[Tuple[float, Record]]:
+        space_weight, text_weight, base = self._weights(total)
+
+        heap = [(0.0, 0, self.root)]
+        counter = 1
+        results = []
+        # 已见精确得分中最小的k个（取负数的大顶堆），堆顶为剪枝阈值
+        kth_best = []
+        threshold = math.inf
+
+        while heap and len(results) < k:
+            score, _, item = heapq.heappop(heap)
+            if score > threshold:
+                break
+            if isinstance(item, Record):
+                results.append((score, item))
+                continue
+            if item.is_leaf:
+                for record in item.children:
+                    dist = math.hypot(record.x - x, record.y - y)
+                    matched = len(query_ids.intersection(record.terms)) if query_ids else 0
+                    if matched and term_groups is not None:
+                        matched = _fuzzy_matched(term_groups, record.terms)
+                    exact = space_weight * dist + base - text_weight * matched
+                    if exact > threshold:
+                        continue
+                    heapq.heappush(heap, (exact, counter, record))
+                    counter += 1
+                    if len(kth_best) < k:
+                        heapq.heappush(kth_best, -exact)
+                    else:
+                        heapq.heapreplace(kth_best, -exact)
+                    if len(kth_best) == k:
+                        threshold = -kth_best[0]
+            else:
+                for child in item.children:
+                    matched = len(query_ids & child.terms) if query_ids else 0
+                    if matched and term_groups is not None:
+                        matched = _fuzzy_matched(term_groups, child.terms)
+                    bound = space_weight * child.min_dist(x, y) + base - text_weight * matched
+                    if bound > threshold:
+                        continue
+                    heapq.heappush(heap, (bound, counter, child))
+                    counter += 1
+        return results
+
+    @staticmethod
+    def _format_results(results: List[Tuple[float, Record]], keyword: str, x: float, y: float,
+                        lev_cache: Dict[str, int] = None) -> List[Dict]:
+        keyword_lower = keyword.lower()
+        formatted = []
+        for score, record in results:
+            name_lower = record.name.lower()
+            if lev_cache is None:
+                lev = levenshtein(keyword_lower, name_lower)
+            else:
+                lev = lev_cache.get(name_lower)
+                if lev is None:
+                    lev = lev_cache[name_lower] = levenshtein(keyword_lower, name_lower)
+            formatted.append({
+                'rect_id': record.rect_id,
+                'keyword': record.name,
+                'center_x': record.x,
+                'center_y': record.y,
+                'weighted_dist': score,
+                'original_dist': math.hypot(record.x - x, record.y - y),
+                'lev_distance': lev,
+                'orampath': []
+            })
+        return formatted
+
+    @timed('query_engine', 'search')
+    def search(self, keyword: str, x: float, y: float, k: int = 5, fuzzy: int = 0) -> List[Dict]:
+        """
+        best-first检索Top-K
+
+        节点的下界得分由MBR最小距离和子树关键词集合上界得到，
+        出堆的记录即为按得分从小到大的精确结果；
+        已知的第k个精确得分作为剪枝阈值，不可能进入Top-K的条目不入堆。
+        fuzzy > 0 时查询关键词与编辑距离不超过fuzzy的关键词都算作命中
+        """
+        if not self.root or k <= 0:
+            return []
+        query_ids, total, term_groups = self._query_terms(keyword, fuzzy)
+        return self._format_results(self._best_first(query_ids, total, x, y, k, term_groups), keyword, x, y)
+
+    @timed('query_engine', 'search_batch')
+    def search_batch(self, queries: Sequence[Tuple[str, float, float, int]], fuzzy: int = 0) -> List[List[Dict]]:
+        """
+        批量检索Top-K，queries 为 (keyword, x, y, k) 序列，按输入顺序返回每条查询的结果；
+        fuzzy 为所有查询共用的近似匹配编辑距离
+
+        查询按 (查询关键词id集合, 关键词总数) 和所在网格分组，组内得分函数只差查询点；
+        组内相互靠近的查询共享一次索引遍历，分散的查询逐条best-first（见 _search_group）
+        """
+        output: List[List[Dict]] = [[] for _ in queries]
+        if not self.root:
+            return output
+
+        cell_w = (self.root.max_x - self.root.min_x) / BATCH_GRID or 1.0
+        cell_h = (self.root.max_y - self.root.min_y) / BATCH_GRID or 1.0
+        terms_cache: Dict[str, Tuple[frozenset, int, Optional[Tuple[frozenset, ...]]]] = {}
+        groups = defaultdict(list)
+        for i, (keyword, x, y, k) in enumerate(queries):
+            if k <= 0:
+                continue
+            terms = terms_cache.get(keyword)
+            if terms is None:
+                terms = terms_cache[keyword] = self._query_terms(keyword, fuzzy)
+            cell = (min(max(int((x - self.root.min_x) / cell_w), -1), BATCH_GRID),
+                    min(max(int((y - self.root.min_y) / cell_h), -1), BATCH_GRID))
+            groups[terms + cell].append(i)
+
+        lev_caches: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for (query_ids, total, term_groups, _, _), indices in groups.items():
+            for start in range(0, len(indices), BATCH_GROUP_SIZE):
+                chunk = indices[start:start + BATCH_GROUP_SIZE]
+                group_queries = [queries[i] for i in chunk]
+                for i, results in zip(chunk, self._search_group(query_ids, total, group_queries, term_groups)):
+                    keyword, x, y, _ = queries[i]
+                    output[i] = self._format_results(results, keyword, x, y, lev_caches[keyword.lower()])
+        return output
+
+    def _search_group(self, query_ids: frozenset, total: int, queries: List[Tuple[str, float, float, int]],
+                      term_groups: Optional[Tuple[frozenset, ...]] = None) -> List[List[Tuple[float, Record]]]:
+        """
+        同一组查询，返回各查询的 (得分, 记录) 列表
+
+        反复取剩余查询中最靠近中心的一条作为枢轴做best-first，只有落在枢轴第k近邻半径内的查询
+        （各自第k名得分的上界与枢轴相近，候选集合小）共享一次索引遍历；
+        半径内不足 BATCH_MIN_SHARED 条时只返回枢轴自己的结果，其余查询留给后续枢轴，
+        分散的查询因此与逐条检索的开销相同，不会先做一次无用的遍历
+        """
+        xs = np.array([q[1] for q in queries], dtype=np.float64)
+        ys = np.array([q[2] for q in queries], dtype=np.float64)
+        ks = [q[3] for q in queries]
+        results: List[Optional[List[Tuple[float, Record]]]] = [None] * len(queries)
+        remaining = np.arange(len(queries))
+        while len(remaining):
+            rx, ry = xs[remaining], ys[remaining]
+            pivot = int(remaining[np.argmin(np.hypot(rx - rx.mean(), ry - ry.mean()))])
+            k_max = max(ks[i] for i in remaining)
+            seeds = self._best_first(query_ids, total, xs[pivot], ys[pivot], k_max, term_groups)
+            if len(seeds) < k_max:
+                radius = math.inf
+            else:
+                radius = max(math.hypot(record.x - xs[pivot], record.y - ys[pivot]) for _, record in seeds)
+            near = np.hypot(rx - xs[pivot], ry - ys[pivot]) <= radius
+            members = remaining[near]
+            if len(members) < BATCH_MIN_SHARED:
+                k = ks[pivot]
+                results[pivot] = seeds if k == k_max else self._best_first(
+                    query_ids, total, xs[pivot], ys[pivot], k, term_groups)
+                remaining = remaining[remaining != pivot]
+                continue
+            shared = self._shared_traversal(query_ids, total, xs[members], ys[members], [ks[i] for i in members],
+                                            [record for _, record in seeds], term_groups)
+            for i, result in zip(members, shared):
+                results[i] = result
+            remaining = remaining[~near]
+        return results
+
+    def _shared_traversal(self, query_ids: frozenset, total: int, xs: np.ndarray, ys: np.ndarray, ks: List[int],
+                          seeds: List[Record], term_groups: Optional[Tuple[frozenset, ...]] = None
+                          ) -> List[List[Tuple[float, Record]]]:
+        """
+        相邻查询共享一次索引遍历：seeds（枢轴的Top-k_max记录）给每条查询的第k名得分定一个上界，
+        以查询点包围盒到MBR的距离为下界遍历一次索引收集候选，再用NumPy算出 查询 x 候选 的得分矩阵逐行取前k个
+        """
+        def count_matched(terms) -> int:
+            matched = len(query_ids.intersection(terms)) if query_ids else 0
+            if matched and term_groups is not None:
+                matched = _fuzzy_matched(term_groups, terms)
+            return matched
+
+        k_max = max(ks)
+        space_weight, text_weight, base = self._weights(total)
+
+        def score_matrix(records: List[Record]) -> np.ndarray:
+            rx = np.array([r.x for r in records], dtype=np.float64)
+            ry = np.array([r.y for r in records], dtype=np.float64)
+            matched = np.array([count_matched(r.terms) for r in records], dtype=np.float64)
+            # 与逐条检索相同的运算顺序，保证得分逐位一致
+            scores = np.hypot(rx[None, :] - xs[:, None], ry[None, :] - ys[:, None])
+            scores *= space_weight
+            scores += base
+            scores -= text_weight * matched
+            return scores
+
+        # 1. 枢轴的Top-k_max给出每条查询第k名得分的上界
+        if len(seeds) < k_max:
+            threshold = math.inf
+        else:
+            seed_scores = np.sort(score_matrix(seeds), axis=1)
+            threshold = max(seed_scores[row, k - 1] for row, k in enumerate(ks))
+
+        # 2. 以查询点包围盒为下界遍历一次索引，收集候选
+        box = (float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()))
+        candidates = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                for record in node.children:
+                    matched = count_matched(record.terms)
+                    if space_weight * _box_dist(record.x, record.y, *box) + base - text_weight * matched <= threshold:
+                        candidates.append(record)
+                if len(candidates) > BATCH_MAX_CANDIDATES:
+                    return [self._best_first(query_ids, total, x, y, k, term_groups) for x, y, k in zip(xs, ys, ks)]
+                continue
+            for child in node.children:
+                matched = count_matched(child.terms)
+                if space_weight * child.min_dist_box(*box) + base - text_weight * matched <= threshold:
+                    stack.append(child)
+
+        if not candidates:
+            return [[] for _ in ks]
+
+        # 3. 得分矩阵逐行取前k个
+        scores = score_matrix(candidates)
+        results = []
+        for row, k in enumerate(ks):
+            row_scores = scores[row]
+            if k < len(candidates):
+                top = np.argpartition(row_scores, k - 1)[:k]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(row_scores[top], kind='stable')]
+            results.append([(float(row_scores[j]), candidates[j]) for j in top])
+        return results
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    if len(sys.argv) < 5:
+        print("用法: python spatial_keyword_engine.py <data_file> <keyword> <lng> <lat> [k]")
+        sys.exit(1)
+
+    engine = SpatialKeywordEngine.from_file(sys.argv[1])
+    k = int(sys.argv[5]) if len(sys.argv) > 5 else 5
+    for result in engine.search(sys.argv[2], float(sys.argv[3]), float(sys.argv[4]), k):
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
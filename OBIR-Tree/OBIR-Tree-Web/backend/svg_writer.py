@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式SVG输出工具
+各生成器以生成器函数逐段产出SVG文本，需要完整字符串时再一次性拼接，
+避免在节点/边循环中反复 `svg += ...` 造成的二次复制
+"""
+
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+# 流式响应中每个分块的目标字符数
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def text(value) -> str:
+    """转义SVG文本节点内容"""
+    return escape(str(value))
+
+
+def attr(value) -> str:
+    """转义双引号包围的SVG属性值（不含外层引号）"""
+    return escape(str(value), {'"': '&quot;'})
+
+
+def render(chunks: Iterable[str]) -> str:
+    """将分段SVG一次性拼接为完整文档"""
+    return ''.join(chunks)
+
+
+def iter_chunks(chunks: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """将细碎的SVG片段合并为约chunk_size大小的分块，减少流式响应的分块数量"""
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
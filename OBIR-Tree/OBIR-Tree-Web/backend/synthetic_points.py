@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成点数据生成器
+生成与 c_for_data/data_sim.c 相同的 `id name lat lng` 记录文件，也可直接生成 `name lng lat` 文本、
+.obpts 列式二进制（见 point_store.py）和 points.json，并生成相应的Top-K查询负载，用于压力测试。
+数据按块流式生成和写出，10^8 行也不会把数据全部放在内存中；每块的随机数只由 (种子, 块序号) 决定，
+相同参数和种子总是生成相同的数据，且前N行与总行数无关。
+空间分布可选均匀分布（同 data_sim.c）或高斯混合（按Zipf分布分配大小的簇 + 均匀噪声）；
+名称由按Zipf分布抽取的人名/地名、修饰词和类别拼成，风格同 public/mock/10.txt
+"""
+
+import argparse
+import json
+import math
+import os
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+import point_store
+
+# 每块的行数；决定随机数的划分方式，修改后同一种子生成的数据会改变
+CHUNK_ROWS = 1 << 18
+# 随机数流编号：模型参数（簇、词表）、记录、查询
+_MODEL_STREAM, _RECORD_STREAM, _QUERY_STREAM = 0, 1, 2
+
+# 高斯混合的默认簇数和均匀噪声比例
+DEFAULT_CLUSTERS = 64
+DEFAULT_NOISE = 0.05
+# 簇的标准差范围（度），在对数尺度上均匀抽取
+CLUSTER_SIGMA = (0.01, 2.0)
+# 簇中心的纬度范围
+CLUSTER_MAX_LAT = 70.0
+# 地名/人名词表大小和Zipf指数
+DEFAULT_VOCABULARY = 20000
+DEFAULT_ZIPF = 1.07
+
+# 名称各部分的出现概率
+PERSON_NAME_RATE = 0.35
+DESCRIPTOR_RATE = 0.3
+BRANCH_RATE = 0.08
+
+# data_sim.c 的编号方式：每200条为一组
+LEGACY_GROUP = 200
+LEGACY_FIRST_ID = 372
+LEGACY_GROUP_STRIDE = 10000
+
+_SYLLABLES = [
+    'an', 'bai', 'bei', 'chang', 'cheng', 'chun', 'da', 'de', 'ding', 'dong', 'fang', 'feng', 'fu', 'gao',
+    'guang', 'hai', 'han', 'hao', 'he', 'hong', 'hua', 'hui', 'jia', 'jian', 'jin', 'jing', 'jun', 'kang',
+    'le', 'li', 'lin', 'long', 'mei', 'ming', 'nan', 'ning', 'ping', 'qi', 'qing', 'rong', 'rui', 'shan',
+    'sheng', 'shi', 'shun', 'tai', 'tian', 'ting', 'wan', 'wei', 'wen', 'xi', 'xin', 'xing', 'yang', 'yi',
+    'ying', 'yong', 'yu', 'yuan', 'yun', 'ze', 'zhe', 'zheng', 'zhi', 'zhong', 'zhou', 'zi',
+]
+_SURNAMES = [
+    'Wang', 'Li', 'Zhang', 'Liu', 'Chen', 'Yang', 'Zhao', 'Huang', 'Zhou', 'Wu', 'Xu', 'Sun', 'Hu', 'Zhu',
+    'Gao', 'Lin', 'He', 'Guo', 'Ma', 'Luo', 'Liang', 'Song', 'Zheng', 'Xie', 'Han', 'Tang', 'Feng', 'Yu',
+    'Dong', 'Xiao',
+]
+_DESCRIPTORS = [
+    'New', 'Central', 'Community', 'Chain', 'Large', 'Traditional', 'Modern', 'Family', 'Golden', 'Green',
+    'Oriental', 'Peoples',
+]
+# 按常见程度排列，类别同样按Zipf分布抽取
+_CATEGORIES = [
+    'Pharmacy', 'Clinic', 'HealthClinic', 'Restaurant', 'Supermarket', 'DentalClinic', 'Hotel', 'Bank',
+    'HealthServiceStation', 'School', 'Bakery', 'TeaHouse', 'Hospital', 'Kindergarten', 'Barbershop',
+    'TraditionalChineseMedicineClinic', 'CommunityHealthServiceCenter', 'MassageClinic', 'Gym', 'Laundry',
+    'Bookstore', 'Hardware', 'EyeCareCenter', 'Cinema', 'PetHospital', 'FlowerShop', 'HotpotRestaurant',
+    'NoodleHouse', 'ConvenienceStore', 'MaternalandChildHealthCareCenter',
+]
+
+
+def zipf_cdf(size: int, exponent: float) -> np.ndarray:
+    """有限集合上的Zipf分布的累积概率，第r个（从1起）的概率与 1/r^exponent 成正比"""
+    weights = 1.0 / np.arange(1, size + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def _sample(cdf: np.ndarray, rng: np.random.Generator, count: int) -> np.ndarray:
+    return np.minimum(np.searchsorted(cdf, rng.random(count), side='right'), len(cdf) - 1)
+
+
+class PointModel:
+    """数据集的生成参数；簇和词表在构造时由种子确定"""
+
+    def __init__(self, seed: int = 0, distribution: str = 'gaussian', clusters: int = DEFAULT_CLUSTERS,
+                 noise: float = DEFAULT_NOISE, cluster_skew: float = 1.0, vocabulary: int = DEFAULT_VOCABULARY,
+                 zipf: float = DEFAULT_ZIPF, names: str = 'realistic'):
+        if distribution not in ('uniform', 'gaussian'):
+            raise ValueError(f'未知的空间分布: {distribution}')
+        if names not in ('realistic', 'legacy'):
+            raise ValueError(f'未知的名称风格: {names}')
+        self.seed = seed
+        self.distribution = distribution
+        self.noise = noise
+        self.names = names
+        rng = np.random.default_rng([seed, _MODEL_STREAM])
+
+        # 簇：中心在球面上均匀分布，大小按Zipf分布，标准差在对数尺度上均匀
+        clusters = max(int(clusters), 1)
+        max_sin = math.sin(math.radians(CLUSTER_MAX_LAT))
+        self.center_lat = np.degrees(np.arcsin(rng.uniform(-max_sin, max_sin, clusters)))
+        self.center_lng = rng.uniform(-180.0, 180.0, clusters)
+        self.sigma = np.exp(rng.uniform(math.log(CLUSTER_SIGMA[0]), math.log(CLUSTER_SIGMA[1]), clusters))
+        self.cluster_cdf = zipf_cdf(clusters, cluster_skew)
+
+        # 词表：2~3个音节拼成的地名/人名，按生成顺序排名
+        self.vocabulary = self._make_vocabulary(rng, max(int(vocabulary), 1))
+        self.vocabulary_cdf = zipf_cdf(len(self.vocabulary), zipf)
+        self.surname_cdf = zipf_cdf(len(_SURNAMES), zipf)
+        self.category_cdf = zipf_cdf(len(_CATEGORIES), zipf)
+        self._vocabulary = np.array(self.vocabulary, dtype=object)
+        self._surnames = np.array(_SURNAMES, dtype=object)
+        self._descriptors = np.array(_DESCRIPTORS, dtype=object)
+        self._categories = np.array(_CATEGORIES, dtype=object)
+
+    @staticmethod
+    def _make_vocabulary(rng: np.random.Generator, size: int) -> List[str]:
+        size = min(size, len(_SYLLABLES) ** 2 + len(_SYLLABLES) ** 3)
+        words = {}
+        while len(words) < size:
+            batch = size - len(words)
+            syllables = rng.integers(0, len(_SYLLABLES), (batch, 3))
+            three = rng.random(batch) < 0.5
+            for row, use_three in zip(syllables.tolist(), three.tolist()):
+                parts = [_SYLLABLES[i] for i in row[:3 if use_three else 2]]
+                words[''.join(parts).capitalize()] = None
+        return list(words)[:size]
+
+    # ---- 坐标 ----
+
+    def _coordinates(self, rng: np.random.Generator, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (lat, lng)"""
+        uniform_lat = rng.random(count) * 180.0 - 90.0
+        uniform_lng = rng.random(count) * 360.0 - 180.0
+        if self.distribution == 'uniform':
+            return uniform_lat, uniform_lng
+        cluster = _sample(self.cluster_cdf, rng, count)
+        offsets = rng.standard_normal((2, count)) * self.sigma[cluster]
+        lat = self.center_lat[cluster] + offsets[0]
+        # 经度方向按纬度缩放，簇在地面上近似为圆形
+        lng = self.center_lng[cluster] + offsets[1] / np.maximum(np.cos(np.radians(self.center_lat[cluster])), 0.1)
+        noise = rng.random(count) < self.noise
+        lat = np.where(noise, uniform_lat, np.clip(lat, -90.0, 90.0))
+        lng = np.where(noise, uniform_lng, (lng + 180.0) % 360.0 - 180.0)
+        return lat, lng
+
+    # ---- 名称 ----
+
+    def _realistic_names(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        """如 SunWenzheHealthClinic、XinmeiCommunityPharmacy(HongjiaStore)"""
+        first = self._vocabulary[_sample(self.vocabulary_cdf, rng, count)]
+        person = rng.random(count) < PERSON_NAME_RATE
+        surnames = self._surnames[_sample(self.surname_cdf, rng, count)]
+        names = np.where(person, surnames, '') + first
+        descriptors = self._descriptors[rng.integers(0, len(_DESCRIPTORS), count)]
+        names = names + np.where(rng.random(count) < DESCRIPTOR_RATE, descriptors, '')
+        names = names + self._categories[_sample(self.category_cdf, rng, count)]
+        branches = self._vocabulary[_sample(self.vocabulary_cdf, rng, count)]
+        branch = rng.random(count) < BRANCH_RATE
+        return names + np.where(branch, '(' + branches + 'Store)', '')
+
+    @staticmethod
+    def _legacy_rows(start: int, count: int) -> Tuple[np.ndarray, List[str]]:
+        """data_sim.c 的编号和 `文本N_copyM` 名称"""
+        rows = np.arange(start, start + count, dtype=np.int64)
+        group, member = np.divmod(rows, LEGACY_GROUP)
+        ids = LEGACY_FIRST_ID + member + group * LEGACY_GROUP_STRIDE
+        names = [f'文本{m + 1}_copy{g}' for m, g in zip(member.tolist(), group.tolist())]
+        return ids, names
+
+    # ---- 记录 ----
+
+    def chunk(self, index: int, count: int = CHUNK_ROWS) -> Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]:
+        """第index块的前count行，返回 (ids, names, lat, lng)"""
+        rng = np.random.default_rng([self.seed, _RECORD_STREAM, index])
+        lat, lng = self._coordinates(rng, CHUNK_ROWS)
+        start = index * CHUNK_ROWS
+        if self.names == 'legacy':
+            ids, names = self._legacy_rows(start, count)
+        else:
+            ids = np.arange(start, start + count, dtype=np.int64)
+            names = self._realistic_names(rng, CHUNK_ROWS)[:count].tolist()
+        # 坐标保留6位小数，与文本格式往返一致
+        return ids, names, np.round(lat[:count], 6), np.round(lng[:count], 6)
+
+    def iter_chunks(self, rows: int) -> Iterator[Tuple[np.ndarray, List[str], np.ndarray, np.ndarray]]:
+        """依次产出前rows行的各块"""
+        for index in range((rows + CHUNK_ROWS - 1) // CHUNK_ROWS):
+            yield self.chunk(index, min(CHUNK_ROWS, rows - index * CHUNK_ROWS))
+
+    # ---- 查询负载 ----
+
+    def iter_queries(self, count: int, top_k: int = 10, typo_rate: float = 0.0) -> Iterator[Dict]:
+        """
+        产出与数据分布一致的Top-K查询：查询点取自同样的空间分布，关键词按Zipf分布取自类别或词表，
+        typo_rate 的查询关键词带一处拼写错误（替换/删除/插入一个字母），用于测试近似匹配
+        """
+        for index in range((count + CHUNK_ROWS - 1) // CHUNK_ROWS):
+            rows = min(CHUNK_ROWS, count - index * CHUNK_ROWS)
+            rng = np.random.default_rng([self.seed, _QUERY_STREAM, index])
+            lat, lng = self._coordinates(rng, CHUNK_ROWS)
+            use_category = rng.random(CHUNK_ROWS) < 0.5
+            category = _sample(self.category_cdf, rng, CHUNK_ROWS)
+            word = _sample(self.vocabulary_cdf, rng, CHUNK_ROWS)
+            typo = rng.random(CHUNK_ROWS) < typo_rate
+            edit = rng.integers(0, 3, CHUNK_ROWS)
+            position = rng.random(CHUNK_ROWS)
+            letter = rng.integers(0, 26, CHUNK_ROWS)
+            for i in range(rows):
+                keyword = _CATEGORIES[category[i]] if use_category[i] else self.vocabulary[word[i]]
+                if typo[i]:
+                    keyword = _misspell(keyword, int(edit[i]), float(position[i]), chr(ord('a') + int(letter[i])))
+                yield {'query': keyword, 'lng': round(float(lng[i]), 6), 'lat': round(float(lat[i]), 6),
+                       'topK': top_k}
+
+
+def _misspell(word: str, edit: int, position: float, letter: str) -> str:
+    """在word中做一处编辑：0替换，1删除，2插入"""
+    if edit == 2 or len(word) < 2:
+        at = int(position * (len(word) + 1))
+        return word[:at] + letter + word[at:]
+    at = int(position * len(word))
+    if edit == 1:
+        return word[:at] + word[at + 1:]
+    return word[:at] + (letter if word[at].lower() != letter else 'z') + word[at + 1:]
+
+
+# ---- 输出 ----
+
+def write_records(path: str, model: PointModel, rows: int, columns: int = 4) -> str:
+    """
+    写出记录文本文件：4列为 `id name lat lng`（同 data_sim.c），3列为 `name lng lat`（同 public/mock/10.txt）
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for ids, names, lat, lng in model.iter_chunks(rows):
+            if columns == 4:
+                lines = [f'{i} {n} {a:.6f} {b:.6f}\n' for i, n, a, b in zip(ids.tolist(), names, lat.tolist(), lng.tolist())]
+            else:
+                lines = [f'{n} {b:.6f} {a:.6f}\n' for n, a, b in zip(names, lat.tolist(), lng.tolist())]
+            f.write(''.join(lines))
+    return path
+
+
+def write_points_store(path: str, model: PointModel, rows: int) -> str:
+    """直接写出 .obpts 列式二进制文件，不经过文本文件"""
+    chunks = ((ids, lat, lng, names) for ids, names, lat, lng in model.iter_chunks(rows))
+    return point_store.write_store(chunks, path)
+
+
+def write_points_json(path: str, model: PointModel, rows: int) -> str:
+    """写出 points.json 格式（[{lng, lat}, ...]，同 gen_points_json.py），逐块写出"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        first = True
+        for _, _, lat, lng in model.iter_chunks(rows):
+            body = ',\n'.join(f'{{"lng": {b}, "lat": {a}}}' for a, b in zip(lat.tolist(), lng.tolist()))
+            if body:
+                f.write(('\n' if first else ',\n') + body)
+                first = False
+        f.write('\n]\n')
+    return path
+
+
+def write_queries(path: str, model: PointModel, count: int, top_k: int = 10, typo_rate: float = 0.0) -> str:
+    """
+    写出查询负载：.jsonl 为每行一条查询；否则为 /api/query-results/batch 的请求体 {"queries": [...]}
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        queries = model.iter_queries(count, top_k, typo_rate)
+        if path.endswith('.jsonl'):
+            for query in queries:
+                f.write(json.dumps(query, ensure_ascii=False) + '\n')
+        else:
+            f.write('{"queries": [')
+            for i, query in enumerate(queries):
+                f.write((',\n' if i else '\n') + json.dumps(query, ensure_ascii=False))
+            f.write('\n]}\n')
+    return path
+
+
+def write_dataset(path: str, model: PointModel, rows: int, columns: int = 4) -> str:
+    """按扩展名选择输出格式：.obpts 为列式二进制，.json 为 points.json，其余为记录文本"""
+    if path.endswith(point_store.STORE_SUFFIX):
+        return write_points_store(path, model, rows)
+    if path.endswith('.json'):
+        return write_points_json(path, model, rows)
+    return write_records(path, model, rows, columns)
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    parser = argparse.ArgumentParser(description='生成合成点数据和查询负载')
+    parser.add_argument('output', help='输出文件：.obpts 为列式二进制，.json 为 points.json，其余为记录文本')
+    parser.add_argument('--rows', type=int, default=10000, help='记录数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--distribution', choices=['uniform', 'gaussian'], default='gaussian', help='空间分布')
+    parser.add_argument('--clusters', type=int, default=DEFAULT_CLUSTERS, help='高斯混合的簇数')
+    parser.add_argument('--noise', type=float, default=DEFAULT_NOISE, help='高斯混合中均匀噪声点的比例')
+    parser.add_argument('--cluster-skew', type=float, default=1.0, help='簇大小的Zipf指数，0为等大')
+    parser.add_argument('--vocabulary', type=int, default=DEFAULT_VOCABULARY, help='地名/人名词表大小')
+    parser.add_argument('--zipf', type=float, default=DEFAULT_ZIPF, help='关键词频率的Zipf指数')
+    parser.add_argument('--names', choices=['realistic', 'legacy'], default='realistic',
+                        help='名称风格：legacy 与 data_sim.c 相同（文本N_copyM）')
+    parser.add_argument('--columns', type=int, choices=[3, 4], default=4,
+                        help='文本格式：4列 `id name lat lng`，3列 `name lng lat`')
+    parser.add_argument('--queries', type=int, default=0, help='同时生成的查询条数')
+    parser.add_argument('--queries-out', default=None, help='查询输出文件（.jsonl 或批量查询请求体 .json）')
+    parser.add_argument('--top-k', type=int, default=10, help='查询的k')
+    parser.add_argument('--typo-rate', type=float, default=0.0, help='带拼写错误的查询比例')
+    args = parser.parse_args()
+
+    model = PointModel(args.seed, args.distribution, args.clusters, args.noise, args.cluster_skew,
+                       args.vocabulary, args.zipf, args.names)
+    print(write_dataset(args.output, model, args.rows, args.columns))
+    if args.queries:
+        queries_out = args.queries_out or os.path.splitext(args.output)[0] + '.queries.jsonl'
+        print(write_queries(queries_out, model, args.queries, args.top_k, args.typo_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成树数据生成器
+按节点数、扇出、深度生成与 data/ 下示例文件同结构的IR-Tree、IR-OBIR映射、逻辑路径和OBIR-Tree快照数据，
+并可按变化率生成下一时刻的快照，用于基准测试和压力测试；相同参数和种子总是生成相同的数据
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+
+def tree_shape(nodes: int, fanout: Optional[int] = None, depth: Optional[int] = None) -> Tuple[int, int]:
+    """
+    由节点数和扇出/深度之一推出另一个参数，返回 (fanout, depth)
+
+    只给深度时取能在该深度内容纳全部节点的最小扇出；都不给时扇出默认为4
+    """
+    if fanout is None:
+        if depth:
+            fanout = 2
+            while (fanout ** (depth + 1) - 1) // (fanout - 1) < nodes:
+                fanout += 1
+        else:
+            fanout = 4
+    fanout = max(fanout, 1)
+    if fanout == 1:
+        return 1, max(nodes - 1, 0)
+    return fanout, max(math.ceil(math.log(nodes * (fanout - 1) + 1, fanout)) - 1, 0)
+
+
+def _parents(nodes: int, fanout: int) -> List[int]:
+    """按层序编号的完全fanout叉树，第i个节点的父节点为 (i - 1) // fanout"""
+    return [-1] + [(i - 1) // fanout for i in range(1, nodes)]
+
+
+def _levels(parents: List[int]) -> List[int]:
+    levels = [0] * len(parents)
+    for i in range(1, len(parents)):
+        levels[i] = levels[parents[i]] + 1
+    return levels
+
+
+def _node_type(i: int, nodes: int, fanout: int) -> str:
+    if i == 0:
+        return 'root'
+    return 'leaf' if i * fanout + 1 >= nodes else 'node'
+
+
+def make_ir_tree(nodes: int, fanout: Optional[int] = None, depth: Optional[int] = None) -> Dict:
+    """IR-Tree数据，结构同 data/ir_tree_data.json"""
+    fanout, _ = tree_shape(nodes, fanout, depth)
+    parents = _parents(nodes, fanout)
+    levels = _levels(parents)
+    return {
+        'nodes': [{'id': f'n{i}', 'label': f'Node{i}', 'type': _node_type(i, nodes, fanout), 'level': levels[i]}
+                  for i in range(nodes)],
+        'edges': [{'from': f'n{parents[i]}', 'to': f'n{i}'} for i in range(1, nodes)]
+    }
+
+
+def make_logic_path(nodes: int, fanout: Optional[int] = None, depth: Optional[int] = None, seed: int = 0) -> Dict:
+    """逻辑路径数据，结构同 data/ir_logic_path_data.json，路径为根到随机叶子"""
+    rng = random.Random(seed)
+    fanout, _ = tree_shape(nodes, fanout, depth)
+    parents = _parents(nodes, fanout)
+    levels = _levels(parents)
+    leaf = rng.randrange((nodes - 2) // fanout + 1 if nodes > 1 else 0, nodes)
+    path = []
+    while leaf >= 0:
+        path.append(f'n{leaf}')
+        leaf = parents[leaf]
+    type_names = {'root': 'root', 'node': 'internal', 'leaf': 'leaf'}
+    return {
+        'nodes': [{'id': f'n{i}', 'name': f'节点{i}', 'level': levels[i],
+                   'type': type_names[_node_type(i, nodes, fanout)]} for i in range(nodes)],
+        'edges': [{'from': f'n{parents[i]}', 'to': f'n{i}'} for i in range(1, nodes)],
+        'logic_path': path[::-1],
+        'query_info': {
+            'query_keyword': 'synthetic',
+            'timestamp': '2024-01-15 14:30:25',
+            'session_id': f'sess_synthetic_{seed}',
+            'user_id': 'bench',
+            'query_type': '精确匹配'
+        }
+    }
+
+
+def make_mapping(nodes: int, seed: int = 0) -> Tuple[Dict, Dict]:
+    """IR-OBIR映射和标注数据，结构同 data/ir_obir_mapping.json / ir_obir_annotations.json"""
+    rng = random.Random(seed)
+    obir_ids = [f'obir_{i}' for i in range(nodes)]
+    rng.shuffle(obir_ids)
+    mapping = {
+        'ir_nodes': [{'id': f'ir_{i}', 'label': f'IR_{i}', 'type': 'root' if i == 0 else 'node'}
+                     for i in range(nodes)],
+        'obir_nodes': [{'id': f'obir_{i}', 'label': f'OBIR_{i}', 'type': 'root' if i == 0 else 'node'}
+                       for i in range(nodes)],
+        'mappings': [{'ir_id': f'ir_{i}', 'obir_id': obir_ids[i], 'label': f'映射{i}'} for i in range(nodes)]
+    }
+    annotations = {
+        'annotations': [{
+            'id': f'mapping_{i}',
+            'type': 'mapping',
+            'title': f'映射{i}',
+            'description': '合成数据',
+            'details': {'IR节点': f'ir_{i}', 'OBIR节点': obir_ids[i]}
+        } for i in range(min(nodes, 100))]
+    }
+    return mapping, annotations
+
+
+def make_obir_snapshot(nodes: int, fanout: Optional[int] = None, depth: Optional[int] = None) -> Dict:
+    """OBIR-Tree快照，结构同 data/obir_tree_current.json"""
+    fanout, _ = tree_shape(nodes, fanout, depth)
+    parents = _parents(nodes, fanout)
+    levels = _levels(parents)
+    return {
+        'nodes': [{'id': f'n{i}', 'value': f'Node{i}', 'level': levels[i], 'status': 'active'}
+                  for i in range(nodes)],
+        'edges': [{'from': f'n{parents[i]}', 'to': f'n{i}'} for i in range(1, nodes)],
+        'metadata': {'timestamp': '2024-01-15T10:30:00Z', 'version': '1.0', 'description': '合成快照'}
+    }
+
+
+def mutate_snapshot(snapshot: Dict, change_rate: float, seed: int = 0) -> Dict:
+    """
+    生成下一时刻的快照：约 change_rate 比例的节点发生变化，
+    其中一半修改值，四分之一删除叶子，四分之一在随机节点下新增叶子
+    """
+    rng = random.Random(seed)
+    nodes = [dict(node) for node in snapshot['nodes']]
+    edges = list(snapshot['edges'])
+    changes = int(len(nodes) * change_rate)
+    if changes == 0:
+        return {'nodes': nodes, 'edges': edges, 'metadata': dict(snapshot.get('metadata', {}))}
+
+    has_child = {edge['from'] for edge in edges}
+    leaves = [i for i, node in enumerate(nodes) if node['id'] not in has_child and i > 0]
+    removed = set(rng.sample(leaves, min(len(leaves), changes // 4)))
+    for i in rng.sample(range(len(nodes)), changes - changes // 2):
+        if i not in removed:
+            nodes[i]['value'] = f"{nodes[i]['value']}*"
+            nodes[i]['status'] = 'updated'
+
+    removed_ids = {nodes[i]['id'] for i in removed}
+    kept = [node for i, node in enumerate(nodes) if i not in removed]
+    edges = [edge for edge in edges if edge['to'] not in removed_ids]
+    levels = {node['id']: node['level'] for node in kept}
+    kept_ids = list(levels)
+    for j in range(changes // 4):
+        parent_id = rng.choice(kept_ids)
+        node_id = f'new{seed}_{j}'
+        kept.append({'id': node_id, 'value': f'New{j}', 'level': levels[parent_id] + 1, 'status': 'active'})
+        edges.append({'from': parent_id, 'to': node_id})
+    return {'nodes': kept, 'edges': edges, 'metadata': dict(snapshot.get('metadata', {}))}
+
+
+def write_dataset(out_dir: str, nodes: int, fanout: Optional[int] = None, depth: Optional[int] = None,
+                  change_rate: float = 0.01, seed: int = 0) -> Dict[str, str]:
+    """在out_dir下写出与 data/ 同名的全套数据文件，返回 文件用途 -> 路径"""
+    os.makedirs(out_dir, exist_ok=True)
+    mapping, annotations = make_mapping(nodes, seed)
+    previous = make_obir_snapshot(nodes, fanout, depth)
+    files = {
+        'ir_tree': ('ir_tree_data.json', make_ir_tree(nodes, fanout, depth)),
+        'logic_path': ('ir_logic_path_data.json', make_logic_path(nodes, fanout, depth, seed)),
+        'mapping': ('ir_obir_mapping.json', mapping),
+        'annotations': ('ir_obir_annotations.json', annotations),
+        'obir_previous': ('obir_tree_previous.json', previous),
+        'obir_current': ('obir_tree_current.json', mutate_snapshot(previous, change_rate, seed)),
+    }
+    paths = {}
+    for key, (name, value) in files.items():
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        paths[key] = path
+    return paths
+
+
+def main():
+    """主函数 - 用于命令行调用"""
+    parser = argparse.ArgumentParser(description='生成合成树数据文件')
+    parser.add_argument('out_dir', help='输出目录')
+    parser.add_argument('--nodes', type=int, default=1000, help='节点数')
+    parser.add_argument('--fanout', type=int, default=None, help='扇出')
+    parser.add_argument('--depth', type=int, default=None, help='深度（未给出扇出时由深度推出扇出）')
+    parser.add_argument('--change-rate', type=float, default=0.01, help='前后两个快照之间的节点变化率')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    paths = write_dataset(args.out_dir, args.nodes, args.fanout, args.depth, args.change_rate, args.seed)
+    for path in paths.values():
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
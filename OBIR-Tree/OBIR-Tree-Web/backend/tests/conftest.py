@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""后端测试：以 backend/ 为模块搜索路径，数据文件取自 backend/data/"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, 'data')
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""关键词近似匹配索引：查找结果与逐个计算编辑距离完全一致（含中文、字母表之外的字符和超长词）"""
+
+import random
+
+import pytest
+
+from fuzzy_index import MAX_PATTERN_LENGTH, FuzzyTermIndex, levenshtein
+
+LATIN = 'abcdehilmnorst'
+CJK = '银行酒店健身药房诊所学校公园咖啡北京上海'
+
+
+def brute_force(terms, term, distances):
+    """逐个计算编辑距离，返回各最大距离下的期望结果"""
+    matches = sorted(((levenshtein(term, t), term_id) for term_id, t in enumerate(terms)))
+    return {distance: [(i, d) for d, i in matches if d <= distance] for distance in distances}
+
+
+def random_word(rng, alphabet, low=1, high=9):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(low, high)))
+
+
+def edit(rng, word, alphabet, count):
+    """对word做count次随机的替换、插入或删除"""
+    chars = list(word)
+    for _ in range(count):
+        op = rng.randrange(3)
+        if op == 0 and chars:
+            chars[rng.randrange(len(chars))] = rng.choice(alphabet)
+        elif op == 1 or not chars:
+            chars.insert(rng.randint(0, len(chars)), rng.choice(alphabet))
+        else:
+            del chars[rng.randrange(len(chars))]
+    return ''.join(chars)
+
+
+@pytest.fixture(scope='module')
+def terms():
+    rng = random.Random(8)
+    words = {random_word(rng, LATIN) for _ in range(1500)}
+    words |= {random_word(rng, CJK, high=6) for _ in range(800)}
+    words |= {random_word(rng, LATIN + CJK) for _ in range(300)}
+    # 超过位并行算法长度的词
+    words |= {random_word(rng, 'ab', MAX_PATTERN_LENGTH - 2, MAX_PATTERN_LENGTH + 4) for _ in range(20)}
+    return sorted(words)
+
+
+def test_lookup_matches_brute_force(terms):
+    rng = random.Random(9)
+    index = FuzzyTermIndex(terms)
+    queries = [edit(rng, rng.choice(terms), LATIN + CJK, rng.randint(0, 3)) for _ in range(60)]
+    # 字母表之外的字符
+    queries += ['银行x', 'zzz', '東京', 'bank€', 'é']
+    for query in queries:
+        for distance, expected in brute_force(terms, query, range(4)).items():
+            assert index.lookup(query, distance) == expected, (query, distance)
+
+
+def test_long_terms_match_brute_force(terms):
+    rng = random.Random(10)
+    index = FuzzyTermIndex(terms)
+    long_terms = [t for t in terms if len(t) >= MAX_PATTERN_LENGTH - 2]
+    for term in rng.sample(long_terms, 5):
+        query = edit(rng, term, 'abc', 2)
+        assert index.lookup(query, 2) == brute_force(terms, query, [2])[2]
+
+
+def test_degenerate_inputs():
+    assert FuzzyTermIndex([]).lookup('银行', 2) == []
+    index = FuzzyTermIndex(['银行', '银', 'bank'])
+    assert index.lookup('', 3) == []
+    assert index.lookup('银行', 0) == [(0, 0)]
+    assert index.lookup('银行', -1) == [(0, 0)]
+    assert index.lookup('银', 1) == [(1, 0), (0, 1)]
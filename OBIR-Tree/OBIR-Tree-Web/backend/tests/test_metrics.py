@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""运行指标：多进程快照的汇总"""
+
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _registry():
+    registry = metrics.Registry()
+    counter = registry.counter('t_requests_total', '请求数', ('route',))
+    histogram = registry.histogram('t_duration_seconds', '耗时', ('route',), buckets=(0.1, 1.0))
+    registry.add_collector(lambda: [('t_cache_entries', 'gauge', '条目数', [({}, 3)])])
+    return registry, counter, histogram
+
+
+def _sample(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_single_process_output_unchanged(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', None)
+    registry, counter, _ = _registry()
+    counter.inc('/a')
+    text = registry.render()
+    assert _sample(text, 't_requests_total{') == ['t_requests_total{route="/a"} 1']
+    assert _sample(text, 't_cache_entries') == ['t_cache_entries 3']
+
+
+def test_worker_snapshots_are_aggregated(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    registry, counter, histogram = _registry()
+    counter.inc('/a')
+    histogram.observe(0.5, '/a')
+
+    # 已退出的worker：计数器和直方图仍计入总数，抓取时计算的指标不再输出
+    dead = _dead_pid()
+    with open(tmp_path / f'{dead}.json', 'w', encoding='utf-8') as f:
+        json.dump({'pid': dead,
+                   'metrics': {'t_requests_total': [['/a', 4], ['/b', 2]],
+                               't_duration_seconds': [['/a', [1, 0, 0], 0.05]]},
+                   'collected': [['t_cache_entries', 'gauge', '条目数', [[{}, 7]]]]}, f)
+    # 仍在运行的另一个worker（用父进程代替）
+    other = os.getppid()
+    with open(tmp_path / f'{other}.json', 'w', encoding='utf-8') as f:
+        json.dump({'pid': other, 'metrics': {'t_requests_total': [['/a', 10]]},
+                   'collected': [['t_cache_entries', 'gauge', '条目数', [[{}, 5]]]]}, f)
+
+    text = registry.render()
+    assert _sample(text, 't_requests_total{') == ['t_requests_total{route="/a"} 15', 't_requests_total{route="/b"} 2']
+    assert 't_duration_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 't_duration_seconds_count{route="/a"} 2' in text
+    assert sorted(_sample(text, 't_cache_entries{')) == sorted([
+        f't_cache_entries{{worker="{os.getpid()}"}} 3', f't_cache_entries{{worker="{other}"}} 5'])
+    assert text.count('# TYPE t_cache_entries gauge') == 1
+    # 本进程的快照在抓取时写入
+    assert (tmp_path / f'{os.getpid()}.json').exists()
+
+    counter.inc('/a')
+    assert _sample(registry.render(), 't_requests_total{route="/a"}') == ['t_requests_total{route="/a"} 16']
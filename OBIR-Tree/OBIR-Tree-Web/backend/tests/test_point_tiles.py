@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""地图点分块查询：最大级别的原始点上限和跨越180°经线的视野"""
+
+import point_tiles
+from point_tiles import MAX_ZOOM, PointTileIndex
+
+
+def _index(tmp_path, rows):
+    path = tmp_path / 'records.txt'
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, (lng, lat) in enumerate(rows):
+            f.write(f'{i} P{i} {lat} {lng}\n')
+    return PointTileIndex.from_file(str(path))
+
+
+def test_identical_points_fall_back_to_cluster(tmp_path, monkeypatch):
+    monkeypatch.setattr(point_tiles, 'RAW_POINT_CAP', 50)
+    rows = [(123.35, 41.43)] * 400 + [(123.3501 + i * 1e-6, 41.4301) for i in range(5)]
+    index = _index(tmp_path, rows)
+    result = index.query((123.3498, 41.4298, 123.3503, 41.4303), MAX_ZOOM, raw_limit=10)
+    assert len(result['points']) <= 50
+    assert [c[2] for c in result['clusters']] == [400]
+    assert result['clusters'][0][:2] == [123.35, 41.43]
+    assert result['total'] == 405
+
+
+def test_raw_points_below_cap_unchanged(tmp_path):
+    rows = [(123.35 + i * 1e-5, 41.43) for i in range(20)]
+    index = _index(tmp_path, rows)
+    result = index.query((123.3499, 41.4299, 123.3503, 41.4301), MAX_ZOOM, raw_limit=5)
+    assert result['clusters'] == []
+    assert sorted(p[0] for p in result['points']) == list(range(20))
+
+
+def test_antimeridian_bbox_is_split(tmp_path):
+    rows = [(179.5, 10.0), (179.9, 10.5), (-179.8, 10.2), (-179.2, 10.1), (0.0, 10.0), (179.5, 30.0)]
+    index = _index(tmp_path, rows)
+    result = index.query((179.0, 9.0, -179.0, 11.0), 8)
+    assert result['clusters'] == []
+    assert sorted(p[0] for p in result['points']) == [0, 1, 2, 3]
+    assert result['total'] == 4
+
+    # 低级别时两段各自聚类，不包括视野外的点
+    clustered = index.query((179.0, 9.0, -179.0, 11.0), 4, raw_limit=1)
+    assert sum(c[2] for c in clustered['clusters']) + len(clustered['points']) == 4
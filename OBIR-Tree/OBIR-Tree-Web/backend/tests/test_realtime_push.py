@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""实时快照推送：监视线程的启停和多进程共享计算"""
+
+import os
+import shutil
+import threading
+import time
+
+from conftest import DATA_DIR
+from realtime_push import SnapshotWatcher
+
+
+def _snapshots(tmp_path):
+    current = tmp_path / 'current.json'
+    previous = tmp_path / 'previous.json'
+    shutil.copy(os.path.join(DATA_DIR, 'obir_tree_current.json'), current)
+    shutil.copy(os.path.join(DATA_DIR, 'obir_tree_previous.json'), previous)
+    return str(current), str(previous)
+
+
+def _counting(watcher, calls):
+    compute = watcher._compute
+
+    def counted():
+        calls.append(watcher)
+        return compute()
+    watcher._compute = counted
+    return watcher
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _watcher_threads():
+    return [t for t in threading.enumerate() if t.name == 'obir-snapshot-watcher' and t.is_alive()]
+
+
+def test_resubscribe_reuses_running_thread(tmp_path):
+    current, previous = _snapshots(tmp_path)
+    watcher = SnapshotWatcher(current, previous, poll_interval=0.01)
+    for _ in range(200):
+        watcher._acquire()
+        watcher._release()
+    watcher._acquire()
+    try:
+        assert _wait_for(lambda: watcher.version > 0)
+        assert len(_watcher_threads()) <= 1
+    finally:
+        watcher._release()
+    assert _wait_for(lambda: watcher._thread is None)
+    assert _wait_for(lambda: not _watcher_threads())
+
+
+def test_shared_dir_computes_once_per_change(tmp_path):
+    current, previous = _snapshots(tmp_path)
+    shared = str(tmp_path / 'run')
+    calls = []
+    watchers = [_counting(SnapshotWatcher(current, previous, poll_interval=0.01, shared_dir=shared), calls)
+                for _ in range(3)]
+    for watcher in watchers:
+        watcher._acquire()
+    try:
+        assert _wait_for(lambda: all(w.version == 1 for w in watchers))
+        assert len(calls) == 1
+        payload = watchers[0].payload
+
+        # 快照变化：仍只计算一次，所有监视器收到同一结果
+        shutil.copy(previous, current)
+        assert _wait_for(lambda: len(calls) == 2)
+        assert _wait_for(lambda: all(w.version == 2 for w in watchers))
+        assert len({w.payload for w in watchers}) == 1
+        assert watchers[0].payload != payload
+
+        # 负责计算的监视器退出后由其他监视器接手，已计算过的版本不重新计算
+        leader = calls[-1]
+        leader._release()
+        assert _wait_for(lambda: leader._thread is None)
+        time.sleep(0.1)
+        assert len(calls) == 2
+        os.utime(current)
+        assert _wait_for(lambda: len(calls) == 3)
+        assert calls[-1] is not leader
+    finally:
+        for watcher in watchers:
+            if watcher._subscribers:
+                watcher._release()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""记录id索引：按id批量读取的结果与逐行解析记录文件一致（不存在、重复的id，末行没有换行符）"""
+
+import codecs
+
+from record_index import READ_SIZE, build_index, load_record_index
+from spatial_keyword_engine import iter_record_lines
+
+
+def first_records(path):
+    """逐行解析，id相同时取文件中的第一条"""
+    records = {}
+    for record in iter_record_lines(str(path)):
+        records.setdefault(record[0], record)
+    return records
+
+
+def write(path, lines, trailing_newline=False, bom=False):
+    text = '\n'.join(lines) + ('\n' if trailing_newline else '')
+    path.write_bytes((codecs.BOM_UTF8 if bom else b'') + text.encode('utf-8'))
+
+
+def test_lookup_four_columns(tmp_path):
+    source = tmp_path / 'records.txt'
+    write(source, [
+        '7 银行 39.9 116.4',
+        '3 Hotel 31.2 121.5',
+        'not a record',
+        '7 重复的第二条 0 0',
+        '12 ' + 'x' * (READ_SIZE * 2 + 5) + ' 1.5 2.5',
+        '-4 Gym -10 -20',
+        '3 Hotel重复 1 1',
+        '',
+        '5 bad lat lng',
+        '9 末行 22.5 114.1',
+    ], bom=True)
+    expected = first_records(source)
+    index = load_record_index(str(source))
+    assert len(index) == 7
+
+    wanted = [9, 7, 1, 3, 12, -4, 5, 7, 100, 9]
+    assert index.lookup(wanted) == [expected.get(i) for i in wanted]
+    assert index.lookup([9]) == [(9, '末行', 114.1, 22.5)]
+    assert index.lookup([7, 3]) == [(7, '银行', 116.4, 39.9), (3, 'Hotel', 121.5, 31.2)]
+    assert index.lookup([]) == []
+
+
+def test_lookup_three_columns_uses_line_numbers(tmp_path):
+    source = tmp_path / 'records.txt'
+    write(source, ['Bank 116.4 39.9', 'skip', 'Hotel 121.5 31.2', '药房 114.1 22.5'])
+    expected = first_records(source)
+    assert sorted(expected) == [0, 2, 3]
+
+    index = load_record_index(str(source))
+    wanted = [3, 1, 0, 2, 4, -1]
+    assert index.lookup(wanted) == [expected.get(i) for i in wanted]
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    source = tmp_path / 'records.txt'
+    write(source, ['1 Bank 1 2'], trailing_newline=True)
+    build_index(str(source))
+    assert load_record_index(str(source)).lookup([1, 2]) == [(1, 'Bank', 2.0, 1.0), None]
+
+    write(source, ['1 Bank 1 2', '2 Hotel 3 4'])
+    index = load_record_index(str(source))
+    assert index.matches_source()
+    assert index.lookup([2, 1]) == [(2, 'Hotel', 4.0, 3.0), (1, 'Bank', 2.0, 1.0)]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""渲染进程中记录的阶段耗时和缓存命中次数交回调用进程，在 /api/metrics 中可见"""
+
+import importlib
+import shutil
+
+from conftest import DATA_DIR
+
+SNAPSHOT_FILES = ('ir_tree_data.json', 'obir_tree_current.json', 'obir_tree_previous.json')
+
+
+def test_pool_render_metrics(tmp_path, monkeypatch):
+    monkeypatch.setenv('OBIR_HISTORY_DIR', str(tmp_path / 'history'))
+    app_module = importlib.import_module('app')
+    from render_cache import render_cache
+    from render_executor import render_executor
+    from snapshot_store import SnapshotStore
+
+    assert render_executor.workers > 0
+    for name in SNAPSHOT_FILES:
+        shutil.copy(f'{DATA_DIR}/{name}', tmp_path / name)
+    monkeypatch.setattr(app_module, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'history_store', SnapshotStore(str(tmp_path / 'history')))
+    render_cache.clear()
+    executed = render_executor.stats()['executed']
+
+    client = app_module.app.test_client()
+    for url in ('/api/ir-tree-svg', '/api/obir-tree-realtime'):
+        assert client.post(url, json={}).get_json()['success']
+    assert render_executor.stats()['executed'] == executed + 2
+    text = client.get('/api/metrics').get_data(as_text=True)
+
+    for generator, phase in (('ir_tree', 'layout'), ('obir_realtime', 'layout'), ('obir_realtime', 'render')):
+        assert f'obir_phase_duration_seconds_count{{generator="{generator}",phase="{phase}"}}' in text
+    assert 'obir_generator_cache_requests_total{cache="layout",result="miss"}' in text
+    assert 'obir_generator_cache_requests_total{cache="tree_index",result=' in text
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""快照历史：跨检查点、淘汰旧版本后，保留的每个版本都能原样还原"""
+
+import random
+
+import pytest
+
+from snapshot_store import SnapshotStore, apply_delta, apply_deltas, compute_delta
+from tree_schema import Edge, Node, TreeDocument
+
+
+def random_document(rng, size):
+    nodes = [Node(id=f'n{k}', level=0, label=f'L{k}') for k in range(size)]
+    edges = [Edge(f'n{rng.randrange(k)}', f'n{k}') for k in range(1, size)]
+    return TreeDocument(nodes=nodes, edges=edges, metadata={'frame': 0})
+
+
+def mutate(rng, doc, frame):
+    """修改、删除、追加节点和边，偶尔打乱顺序或修改元数据"""
+    nodes = [Node(id=n.id, level=n.level, label=f'{n.label}*') if rng.random() < 0.05 else n for n in doc.nodes]
+    removed = {n.id for n in rng.sample(nodes[1:], 2)}
+    nodes = [n for n in nodes if n.id not in removed]
+    edges = [e for e in doc.edges if e.source not in removed and e.target not in removed]
+    for k in range(rng.randint(1, 4)):
+        node_id = f'f{frame}_{k}'
+        edges.append(Edge(rng.choice(nodes).id, node_id))
+        nodes.append(Node(id=node_id, level=frame))
+    if rng.random() < 0.2:
+        rng.shuffle(nodes)
+    if rng.random() < 0.2:
+        rng.shuffle(edges)
+    metadata = {'frame': frame} if rng.random() < 0.5 else doc.metadata
+    return TreeDocument(nodes=nodes, edges=edges, metadata=metadata)
+
+
+def frames(count, seed=1):
+    rng = random.Random(seed)
+    doc = random_document(rng, 60)
+    result = [doc]
+    for frame in range(1, count):
+        doc = mutate(rng, doc, frame)
+        result.append(doc)
+    return result
+
+
+def test_round_trip_across_checkpoints(tmp_path):
+    docs = frames(11)
+    store = SnapshotStore(str(tmp_path), capacity=100, checkpoint_interval=4)
+    versions = [store.ingest(doc) for doc in docs]
+    assert versions == list(range(1, 12))
+    assert [v['checkpoint'] for v in store.versions()] == [v % 4 == 1 for v in versions]
+
+    # 新的实例没有进程内缓存，每个版本都从检查点开始还原
+    for version, doc in zip(versions, docs):
+        assert SnapshotStore(str(tmp_path), checkpoint_interval=4).get(version) == doc
+    # 从已缓存的较近版本继续应用增量
+    fresh = SnapshotStore(str(tmp_path), checkpoint_interval=4)
+    for version, doc in zip(versions, docs):
+        assert fresh.get(version) == doc
+
+
+def test_round_trip_after_pruning(tmp_path):
+    docs = frames(20, seed=2)
+    store = SnapshotStore(str(tmp_path), capacity=6, checkpoint_interval=4)
+    for doc in docs:
+        store.ingest(doc)
+
+    kept = [v['version'] for v in store.versions()]
+    # 最近6个版本为15..20，依赖的检查点为13
+    assert kept == list(range(13, 21))
+    with pytest.raises(KeyError):
+        SnapshotStore(str(tmp_path)).get(12)
+    for version in kept:
+        assert SnapshotStore(str(tmp_path), checkpoint_interval=4).get(version) == docs[version - 1]
+
+
+def test_same_content_is_not_stored_twice(tmp_path):
+    docs = frames(3, seed=3)
+    store = SnapshotStore(str(tmp_path))
+    assert [store.ingest(doc) for doc in docs + docs[-1:]] == [1, 2, 3, 3]
+
+
+def test_apply_deltas_matches_apply_delta():
+    """重复的边在整条链上退回逐个应用，结果与逐个调用apply_delta相同"""
+    docs = frames(8, seed=4)
+    duplicated = TreeDocument(nodes=docs[4].nodes, edges=docs[4].edges + docs[4].edges[:2],
+                              metadata=docs[4].metadata)
+    docs = docs[:4] + [duplicated] + docs[5:]
+    deltas = [compute_delta(a, b) for a, b in zip(docs, docs[1:])]
+
+    for start in range(len(docs)):
+        expected = docs[start]
+        for delta in deltas[start:]:
+            expected = apply_delta(expected, delta)
+        assert apply_deltas(docs[start], deltas[start:]) == expected == docs[-1]
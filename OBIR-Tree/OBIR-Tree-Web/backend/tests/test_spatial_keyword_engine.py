@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""批量Top-K查询：结果与逐条检索一致，分散的查询不做多余的共享遍历"""
+
+import random
+
+import pytest
+
+from spatial_keyword_engine import SpatialKeywordEngine
+
+WORDS = ['Bank', 'Hotel', 'Gym', 'Pharmacy', 'Clinic', 'Haotai', 'Andong', 'School', 'Park', 'Cafe']
+
+
+@pytest.fixture(scope='module')
+def engine():
+    rng = random.Random(3)
+    rows = [(i, rng.choice(WORDS) + rng.choice(WORDS), rng.uniform(-180, 180), rng.uniform(-90, 90))
+            for i in range(20000)]
+    return SpatialKeywordEngine.from_records(rows)
+
+
+def ranked(results):
+    return [[(r['rect_id'], r['weighted_dist']) for r in result] for result in results]
+
+
+def count_calls(monkeypatch, engine):
+    calls = {'best_first': 0, 'shared': 0}
+    best_first, shared = engine._best_first, engine._shared_traversal
+
+    def counting_best_first(*args, **kwargs):
+        calls['best_first'] += 1
+        return best_first(*args, **kwargs)
+
+    def counting_shared(*args, **kwargs):
+        calls['shared'] += 1
+        return shared(*args, **kwargs)
+
+    monkeypatch.setattr(engine, '_best_first', counting_best_first)
+    monkeypatch.setattr(engine, '_shared_traversal', counting_shared)
+    return calls
+
+
+def test_scattered_queries_cost_no_more_than_sequential(engine, monkeypatch):
+    rng = random.Random(5)
+    queries = [(rng.choice(WORDS), rng.uniform(-180, 180), rng.uniform(-90, 90), 10) for _ in range(300)]
+    expected = [engine.search(*q) for q in queries]
+
+    calls = count_calls(monkeypatch, engine)
+    assert ranked(engine.search_batch(queries)) == ranked(expected)
+    # 每条查询恰好一次best-first，与逐条检索相同，没有额外的共享遍历
+    assert calls == {'best_first': len(queries), 'shared': 0}
+
+
+def test_clustered_queries_share_traversal(engine, monkeypatch):
+    rng = random.Random(6)
+    queries = [('Bank', 40 + rng.uniform(-2, 2), 10 + rng.uniform(-2, 2), rng.choice((5, 10)))
+               for _ in range(200)]
+    queries += [('Hotel Gym', rng.uniform(-180, 180), rng.uniform(-90, 90), 3) for _ in range(20)]
+    expected = [engine.search(*q) for q in queries]
+
+    calls = count_calls(monkeypatch, engine)
+    assert ranked(engine.search_batch(queries)) == ranked(expected)
+    assert calls['shared'] > 0
+    assert calls['best_first'] < len(queries) // 2
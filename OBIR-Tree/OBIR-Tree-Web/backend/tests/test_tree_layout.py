@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""带锚点的整齐树布局：未变化的子树在相邻两帧中坐标相同，结果始终是合法的布局"""
+
+import json
+import random
+import re
+
+import pytest
+
+import tree_layout
+from gen_OBIR_Tree_realtime_svg import OBIRTreeRealtimeSVGGenerator
+from render_cache import estimate_size, render_cache
+from tree_layout import pack_layout, tidy_layout, unpack_layout
+from tree_schema import Edge, Node
+
+
+def build(tree):
+    """{父节点: [子节点...]} -> (nodes, edges)，第一个键为根"""
+    ids = list(tree)
+    for kids in tree.values():
+        ids.extend(c for c in kids if c not in ids)
+    nodes = [Node(id=node_id) for node_id in ids]
+    edges = [Edge(parent, child) for parent, kids in tree.items() for child in kids]
+    return nodes, edges
+
+
+def subtree_ids(tree, root):
+    result = [root]
+    for child in tree.get(root, []):
+        result.extend(subtree_ids(tree, child))
+    return result
+
+
+def assert_valid(layout, nodes, edges, distance=1.0):
+    """同层顺序与整齐树布局相同，同层间距不小于 distance"""
+    plain = tree_layout._compute(nodes, edges, 'check', distance)[0]
+    rows = {}
+    for node_id, d in layout.depth.items():
+        rows.setdefault(d, []).append(node_id)
+    for row in rows.values():
+        row.sort(key=plain.x.get)
+        xs = [layout.x[node_id] for node_id in row]
+        assert all(b - a >= distance - 1e-9 for a, b in zip(xs, xs[1:]))
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    tree_layout._layout_cache.clear()
+    render_cache.clear()
+    OBIRTreeRealtimeSVGGenerator._placements.clear()
+    OBIRTreeRealtimeSVGGenerator._placements_bytes = 0
+    yield
+
+
+BEFORE = {'root': ['a', 'b', 'c'], 'a': ['a1', 'a2'], 'b': ['b1'], 'c': ['c1', 'c2']}
+AFTER = {'root': ['a', 'b', 'c'], 'a': ['a1', 'a2'], 'b': ['b1'], 'c': ['c1', 'c2', 'c3']}
+
+
+def test_unchanged_subtrees_keep_coordinates():
+    previous = tidy_layout(*build(BEFORE))
+    nodes, edges = build(AFTER)
+    current = tidy_layout(nodes, edges, previous)
+
+    for node_id in subtree_ids(BEFORE, 'a') + subtree_ids(BEFORE, 'b'):
+        assert current.x[node_id] == previous.x[node_id]
+    assert_valid(current, nodes, edges)
+
+
+def test_anchor_is_part_of_cache_key():
+    nodes, edges = build(AFTER)
+    plain = tidy_layout(nodes, edges)
+    previous = tidy_layout(*build(BEFORE))
+    shifted = tree_layout.TreeLayout({k: v + 7 for k, v in previous.x.items()}, previous.depth,
+                                     previous.structure_hash, previous.subtree)
+
+    anchored = tidy_layout(nodes, edges, shifted)
+    assert anchored is not plain
+    assert anchored.x['a1'] == shifted.x['a1']
+    assert tidy_layout(nodes, edges) is plain
+
+
+def test_identical_structure_reproduces_anchor():
+    previous = tidy_layout(*build(AFTER))
+    shifted = tree_layout.TreeLayout({k: v - 3.5 for k, v in previous.x.items()}, previous.depth,
+                                     previous.structure_hash, previous.subtree)
+    assert tidy_layout(*build(AFTER), shifted).x == shifted.x
+
+
+def random_tree(rng, size, prefix=''):
+    tree = {'root': []}
+    ids = ['root']
+    for k in range(size):
+        node_id = f'{prefix}n{k}'
+        tree.setdefault(rng.choice(ids), []).append(node_id)
+        ids.append(node_id)
+    return tree
+
+
+def mutate(rng, tree):
+    """在随机位置增删叶子节点"""
+    tree = {k: list(v) for k, v in tree.items()}
+    for k in range(rng.randint(1, 4)):
+        parent = rng.choice(list(tree))
+        if tree[parent] and rng.random() < 0.5:
+            leaf = tree[parent][-1]
+            if not tree.get(leaf):
+                tree[parent].pop()
+                tree.pop(leaf, None)
+                continue
+        tree[parent].append(f'x{k}_{rng.random()}')
+    return tree
+
+
+def test_random_frames_stay_valid():
+    rng = random.Random(7)
+    for _ in range(50):
+        before = random_tree(rng, rng.randint(5, 60))
+        after = mutate(rng, before)
+        previous = tidy_layout(*build(before))
+        nodes, edges = build(after)
+        current = tidy_layout(nodes, edges, previous)
+        assert_valid(current, nodes, edges)
+        # 下一帧以本帧为锚点，结构不变时位置不变
+        assert tidy_layout(nodes, edges, current).x == current.x
+
+
+def text_positions(svg):
+    return {m.group(3): (m.group(1), m.group(2))
+            for m in re.finditer(r'<text x="([^"]+)" y="([^"]+)" class="text">([^<]+)</text>', svg)}
+
+
+def write_snapshot(path, tree):
+    nodes, edges = build(tree)
+    path.write_text(json.dumps({
+        'nodes': [{'id': n.id} for n in nodes],
+        'edges': [{'from': e.source, 'to': e.target} for e in edges]
+    }))
+
+
+def test_realtime_frames_keep_unchanged_subtrees(tmp_path):
+    """C++端轮换快照：上一帧的current成为previous，未变化的子树在各帧SVG中绘制在同一位置"""
+    current, previous = tmp_path / 'current.json', tmp_path / 'previous.json'
+    generator = OBIRTreeRealtimeSVGGenerator()
+    # 各帧在 a、b 下增删节点，使整齐树布局整体变化；第三帧以第二帧实际绘制的布局为锚点
+    frames = [
+        {'root': ['a', 'b', 'c'], 'a': ['a1', 'a2', 'a3'], 'b': ['b1'], 'c': ['c1', 'c2'], 'c2': ['c21', 'c22']},
+        {'root': ['a', 'b', 'c'], 'a': ['a1', 'a2'], 'b': ['b1', 'b2', 'b3'], 'c': ['c1', 'c2'], 'c2': ['c21', 'c22']},
+        {'root': ['a', 'b', 'c'], 'a': ['a1'], 'b': ['b1', 'b2', 'b3', 'b4'], 'c': ['c1', 'c2'], 'c2': ['c21', 'c22']},
+    ]
+    positions = []
+    for frame in frames:
+        if current.exists():
+            previous.write_bytes(current.read_bytes())
+        write_snapshot(current, frame)
+        result = generator.generate_from_files(str(current), str(previous))
+        assert result['success'], result.get('error')
+        positions.append(text_positions(result['svg']))
+
+    for before, after in zip(positions, positions[1:]):
+        for node_id in subtree_ids(frames[0], 'c'):
+            assert after[node_id] == before[node_id]
+    assert 'b4' in positions[2]
+
+
+def test_pack_layout_round_trip():
+    nodes, edges = build(random_tree(random.Random(2), 200))
+    layout = tidy_layout(nodes, edges)
+    restored = unpack_layout(pack_layout(layout))
+    assert (restored.x, restored.depth, restored.subtree) == (layout.x, layout.depth, layout.subtree)
+    assert restored.signature == layout.signature
+
+
+def plain_leaves(value):
+    """渲染结果只由 dict/list/tuple 和标量组成时 estimate_size 才能计入全部内存"""
+    if isinstance(value, dict):
+        return all(plain_leaves(k) and plain_leaves(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return all(plain_leaves(v) for v in value)
+    return value is None or isinstance(value, (str, bytes, int, float, bool))
+
+
+def test_realtime_cache_accounts_all_memory(tmp_path):
+    """锚点布局不进入渲染缓存：缓存条目的估计大小覆盖其全部内容，布局单独计入 _placements"""
+    current, previous = tmp_path / 'current.json', tmp_path / 'previous.json'
+    rng = random.Random(11)
+    before = random_tree(rng, 2000)
+    write_snapshot(current, before)
+    generator = OBIRTreeRealtimeSVGGenerator()
+    assert generator.generate_from_files(str(current), str(previous))['success']
+    previous.write_bytes(current.read_bytes())
+    write_snapshot(current, mutate(rng, before))
+    result = generator.generate_from_files(str(current), str(previous))
+    assert result['success'] and 'placement' not in result and 'layout' not in result
+
+    entries = [(value, size) for key, (value, size) in render_cache._entries.items() if key[0] == 'obir_tree_realtime']
+    assert len(entries) == 2
+    for value, size in entries:
+        assert plain_leaves(value)
+        assert size == estimate_size(value) >= len(value['svg'])
+    assert render_cache.current_bytes == sum(size for _, (_, size) in render_cache._entries.items())
+
+    placements = OBIRTreeRealtimeSVGGenerator._placements
+    assert len(placements) == 2
+    assert OBIRTreeRealtimeSVGGenerator._placements_bytes == sum(len(blob) for _, blob in placements.values())
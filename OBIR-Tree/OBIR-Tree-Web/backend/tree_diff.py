@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+树结构差异引擎
+为每个快照建立带Merkle子树哈希的索引，比较时子树哈希相同即整棵跳过，
+差异计算的开销与变化规模成正比，而不是与树的大小成正比
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from msgspec.structs import astuple
+from metrics import cache_lookup, phase_timer, timed
+from render_cache import file_fingerprint
+from tree_schema import Node, TreeDocument, decode_tree
+
+# 按文件内容摘要缓存的快照索引数量（当前/前一时刻快照轮换时可直接复用）
+INDEX_CACHE_SIZE = 8
+
+# Node 的前两个字段（id单独计入，level由结构决定）不参与节点内容哈希
+_STRUCTURAL_FIELDS = 2
+
+
+def _digest(*parts: bytes) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+def _content_digest(node: Node) -> bytes:
+    return _digest(repr(astuple(node)[_STRUCTURAL_FIELDS:]).encode('utf-8'))
+
+
+class TreeIndex:
+    """单个快照的结构索引：父子关系 + 节点内容哈希 + 子树Merkle哈希"""
+    __slots__ = ('data', 'nodes', 'parent', 'children', 'content', 'subtree', 'roots')
+
+    def __init__(self, data: TreeDocument):
+        self.data = data
+        self.nodes = {node.id: node for node in data.nodes}
+        self.parent = {}
+        self.children = {node_id: [] for node_id in self.nodes}
+        for edge in data.edges:
+            parent_id, child_id = edge.source, edge.target
+            if parent_id not in self.nodes or child_id not in self.nodes or child_id in self.parent:
+                continue
+            self.parent[child_id] = parent_id
+            self.children[parent_id].append(child_id)
+        self.content = {node_id: _content_digest(node) for node_id, node in self.nodes.items()}
+        self.roots = [node_id for node_id in self.nodes if node_id not in self.parent]
+        self.subtree = {}
+        self._hash_subtrees()
+
+    def _hash_subtrees(self):
+        """后序遍历计算子树哈希（迭代实现，避免深树递归溢出；成环的节点被当作额外的根）"""
+        pending = list(self.roots) + [node_id for node_id in self.nodes if node_id in self.parent]
+        for start in pending:
+            if start in self.subtree:
+                continue
+            stack = [(start, False)]
+            on_stack = {start}
+            while stack:
+                node_id, expanded = stack.pop()
+                if expanded:
+                    child_digests = b''.join(self.subtree[c] for c in self.children[node_id] if c in self.subtree)
+                    self.subtree[node_id] = _digest(self.content[node_id], str(node_id).encode('utf-8'), child_digests)
+                    continue
+                stack.append((node_id, True))
+                for child_id in self.children[node_id]:
+                    if child_id not in self.subtree and child_id not in on_stack:
+                        on_stack.add(child_id)
+                        stack.append((child_id, False))
+            if start not in self.roots:
+                self.roots.append(start)
+
+    @property
+    def root_hash(self) -> str:
+        """整棵树的摘要，可用作快照版本号"""
+        return _digest(*(self.subtree[r] for r in self.roots)).hex()
+
+
+@timed('tree_diff', 'diff')
+def diff_trees(current: TreeIndex, previous: Optional[TreeIndex]) -> Dict[str, List]:
+    """
+    计算两个快照的结构差异
+
+    Returns:
+        added/removed/modified: 新增、删除、内容变化的节点id
+        moved: 父节点变化的节点 {'id', 'from', 'to'}（子树整体随之移动）
+        edges_added/edges_removed: 新增、删除的边 {'from', 'to'}
+    """
+    result = {
+        'added': [],
+        'removed': [],
+        'modified': [],
+        'moved': [],
+        'edges_added': [],
+        'edges_removed': []
+    }
+    if previous is None:
+        return result
+
+    # 两个快照中都存在、需要比较的节点；只有子树哈希不同才会展开其子节点
+    stack = []
+    for root_id in current.roots:
+        if root_id in previous.nodes:
+            if root_id in previous.parent:
+                result['moved'].append({'id': root_id, 'from': previous.parent[root_id], 'to': None})
+            stack.append(root_id)
+        else:
+            _collect_added(current, previous, root_id, result, stack)
+    for root_id in previous.roots:
+        if root_id not in current.nodes:
+            _collect_removed(current, previous, root_id, result)
+
+    while stack:
+        node_id = stack.pop()
+        if current.subtree[node_id] == previous.subtree[node_id]:
+            continue
+        if current.content[node_id] != previous.content[node_id]:
+            result['modified'].append(node_id)
+
+        current_children = current.children[node_id]
+        previous_children = previous.children[node_id]
+        previous_set = set(previous_children)
+        current_set = set(current_children)
+
+        for child_id in current_children:
+            if child_id in previous_set:
+                stack.append(child_id)
+                continue
+            result['edges_added'].append({'from': node_id, 'to': child_id})
+            if child_id in previous.nodes:
+                result['moved'].append({'id': child_id, 'from': previous.parent.get(child_id), 'to': node_id})
+                stack.append(child_id)
+            else:
+                _collect_added(current, previous, child_id, result, stack)
+
+        for child_id in previous_children:
+            if child_id in current_set:
+                continue
+            result['edges_removed'].append({'from': node_id, 'to': child_id})
+            if child_id not in current.nodes:
+                _collect_removed(current, previous, child_id, result)
+
+    return result
+
+
+def _collect_added(current: TreeIndex, previous: TreeIndex, start, result: Dict, stack: List):
+    """新出现的子树：其中在旧快照里已存在的节点视为被移动过来，继续逐个比较"""
+    walk = [start]
+    while walk:
+        node_id = walk.pop()
+        result['added'].append(node_id)
+        for child_id in current.children[node_id]:
+            result['edges_added'].append({'from': node_id, 'to': child_id})
+            if child_id in previous.nodes:
+                result['moved'].append({'id': child_id, 'from': previous.parent.get(child_id), 'to': node_id})
+                stack.append(child_id)
+            else:
+                walk.append(child_id)
+
+
+def _collect_removed(current: TreeIndex, previous: TreeIndex, start, result: Dict):
+    """消失的子树：仍存在于新快照的节点已在其新父节点处记为移动"""
+    walk = [start]
+    while walk:
+        node_id = walk.pop()
+        result['removed'].append(node_id)
+        for child_id in previous.children[node_id]:
+            result['edges_removed'].append({'from': node_id, 'to': child_id})
+            if child_id not in current.nodes:
+                walk.append(child_id)
+
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+
+def load_tree_index(data_file: str) -> TreeIndex:
+    """
+    读取快照文件并建立索引
+
+    索引按文件内容摘要缓存：C++端把旧的current轮换为previous时，
+    previous的索引直接复用上一轮current的结果，不再重新解析和哈希
+    """
+    with phase_timer('tree_diff', 'load'), open(data_file, 'rb') as f:
+        raw = f.read()
+    key = _digest(raw)
+    with _index_cache_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+    cache_lookup('tree_index', index is not None)
+    if index is not None:
+        return index
+
+    with phase_timer('tree_diff', 'parse'):
+        data = decode_tree(raw, data_file)
+    with phase_timer('tree_diff', 'index'):
+        index = TreeIndex(data)
+    with _index_cache_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+_snapshot_digests = OrderedDict()
+
+
+def snapshot_digest(data_file: str) -> bytes:
+    """
+    快照文件的内容摘要（与 load_tree_index 的缓存键相同），按文件版本缓存，文件未变化时不重新读取
+
+    C++端轮换快照后，previous的摘要与上一轮current相同，可据此找到上一帧的结果
+    """
+    fingerprint = file_fingerprint(data_file)
+    with _index_cache_lock:
+        digest = _snapshot_digests.get(fingerprint)
+        if digest is not None:
+            _snapshot_digests.move_to_end(fingerprint)
+            return digest
+    with open(data_file, 'rb') as f:
+        digest = _digest(f.read())
+    with _index_cache_lock:
+        _snapshot_digests[fingerprint] = digest
+        while len(_snapshot_digests) > INDEX_CACHE_SIZE:
+            _snapshot_digests.popitem(last=False)
+    return digest
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+树形布局引擎
+对 nodes/edges 格式的树（或森林）做线性时间的整齐树布局（Walker算法，Buchheim等人的O(n)改进），
+各SVG生成器共用；结果以抽象单位给出（同层相邻节点间距为1、层深为整数），由生成器换算为像素。
+布局按树结构哈希（和对齐的上一帧布局）缓存：只有节点内容变化的实时帧直接复用上一帧的布局；
+给出上一帧的布局时，新布局放在上一帧的坐标系中：先整体平移对齐，再把结构未变化的子树和原有节点
+移回上一帧的位置（只在不与同层相邻节点重叠、不改变同层顺序时移动），新增或需要让位的部分保持整齐树布局
+"""
+
+import bisect
+import hashlib
+import math
+import pickle
+import statistics
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from metrics import cache_lookup, timed
+from tree_schema import Edge, Node
+
+# 按结构哈希缓存的布局数量
+LAYOUT_CACHE_SIZE = 16
+# 同层相邻节点（含相邻子树轮廓之间）的最小间距
+SIBLING_DISTANCE = 1.0
+
+
+class TreeLayout:
+    """
+    布局结果：x 为水平位置（单位间距），depth 为到根的深度；森林的各根深度均为0。
+    subtree 为各节点子树的结构摘要（只由节点id和子节点顺序决定），用于识别下一帧中未变化的子树
+    """
+    __slots__ = ('x', 'depth', 'subtree', 'structure_hash', 'min_x', 'max_x', 'max_depth', '_signature')
+
+    def __init__(self, x: Dict, depth: Dict, structure_hash: str, subtree: Optional[Dict] = None):
+        self.x = x
+        self.depth = depth
+        self.subtree = subtree or {}
+        self.structure_hash = structure_hash
+        self.min_x = min(x.values()) if x else 0.0
+        self.max_x = max(x.values()) if x else 0.0
+        self.max_depth = max(depth.values()) if depth else 0
+        self._signature = None
+
+    @property
+    def width(self) -> float:
+        return self.max_x - self.min_x
+
+    @property
+    def signature(self) -> str:
+        """结构和各节点位置的摘要，作为以本布局为锚点的布局的缓存键"""
+        if self._signature is None:
+            h = hashlib.blake2b(self.structure_hash.encode('utf-8'), digest_size=16)
+            # 节点id和顺序已由结构哈希确定，只需再加上各节点位置
+            h.update(array('d', self.x.values()).tobytes())
+            self._signature = h.hexdigest()
+        return self._signature
+
+
+def structure_hash(nodes: List[Node], edges: List[Edge]) -> str:
+    """只由节点id顺序和边决定的摘要，节点内容变化不影响"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([node.id for node in nodes]).encode('utf-8'))
+    h.update(repr([(edge.source, edge.target) for edge in edges]).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _build_forest(ids: List, edges: List[Edge]):
+    """
+    由边建立子节点列表；与 tree_diff.TreeIndex 一致：忽略指向未知节点的边，重复父节点以先出现的为准，
+    无父节点的节点为根，环上的节点断开其父边作为额外的根
+    """
+    position = {node_id: i for i, node_id in enumerate(ids)}
+    n = len(ids)
+    parent = [-1] * n
+    children = [[] for _ in range(n)]
+    for edge in edges:
+        p = position.get(edge.source)
+        c = position.get(edge.target)
+        if p is None or c is None or parent[c] >= 0 or p == c:
+            continue
+        parent[c] = p
+        children[p].append(c)
+
+    roots = [i for i in range(n) if parent[i] < 0]
+    reached = [False] * n
+    stack = list(roots)
+    while stack:
+        v = stack.pop()
+        reached[v] = True
+        stack.extend(children[v])
+    for i in range(n):
+        if reached[i]:
+            continue
+        # 环：从i断开，把i作为新的根
+        children[parent[i]].remove(i)
+        parent[i] = -1
+        roots.append(i)
+        stack = [i]
+        while stack:
+            v = stack.pop()
+            reached[v] = True
+            stack.extend(children[v])
+    return parent, children, roots
+
+
+def _walker(children: List[List[int]], root: int, distance: float) -> List[float]:
+    """Buchheim-Walker整齐树布局（迭代实现，避免深树递归溢出），返回各节点的x"""
+    n = len(children)
+    parent = [-1] * n
+    number = [0] * n
+    for v in range(n):
+        for i, c in enumerate(children[v]):
+            parent[c] = v
+            number[c] = i
+    prelim = [0.0] * n
+    mod = [0.0] * n
+    shift = [0.0] * n
+    change = [0.0] * n
+    thread = [-1] * n
+    ancestor = list(range(n))
+    default_ancestor = [-1] * n
+
+    def next_left(v):
+        return children[v][0] if children[v] else thread[v]
+
+    def next_right(v):
+        return children[v][-1] if children[v] else thread[v]
+
+    def move_subtree(wm, wp, amount):
+        subtrees = number[wp] - number[wm]
+        change[wp] -= amount / subtrees
+        shift[wp] += amount
+        change[wm] += amount / subtrees
+        prelim[wp] += amount
+        mod[wp] += amount
+
+    def apportion(v, default):
+        siblings = children[parent[v]]
+        if number[v] == 0:
+            return default
+        vip = vop = v
+        vim = siblings[number[v] - 1]
+        vom = siblings[0]
+        sip = mod[vip]
+        sop = mod[vop]
+        sim = mod[vim]
+        som = mod[vom]
+        while True:
+            right = next_right(vim)
+            left = next_left(vip)
+            if right < 0 or left < 0:
+                break
+            vim = right
+            vip = left
+            vom = next_left(vom)
+            vop = next_right(vop)
+            ancestor[vop] = v
+            amount = prelim[vim] + sim - (prelim[vip] + sip) + distance
+            if amount > 0:
+                a = ancestor[vim]
+                move_subtree(a if parent[a] == parent[v] else default, v, amount)
+                sip += amount
+                sop += amount
+            sim += mod[vim]
+            sip += mod[vip]
+            som += mod[vom]
+            sop += mod[vop]
+        right = next_right(vim)
+        if right >= 0 and next_right(vop) < 0:
+            thread[vop] = right
+            mod[vop] += sim - sop
+        left = next_left(vip)
+        if left >= 0 and next_left(vom) < 0:
+            thread[vom] = left
+            mod[vom] += sip - som
+            default = v
+        return default
+
+    # 第一遍：后序，离开节点时确定其相对位置，再与左侧兄弟子树的轮廓分开
+    stack = [(root, False)]
+    while stack:
+        v, expanded = stack.pop()
+        kids = children[v]
+        if not expanded:
+            stack.append((v, True))
+            if kids:
+                default_ancestor[v] = kids[0]
+                for c in reversed(kids):
+                    stack.append((c, False))
+            continue
+        left_sibling = children[parent[v]][number[v] - 1] if parent[v] >= 0 and number[v] > 0 else -1
+        if kids:
+            # 执行子节点的累计平移
+            total_shift = total_change = 0.0
+            for c in reversed(kids):
+                prelim[c] += total_shift
+                mod[c] += total_shift
+                total_change += change[c]
+                total_shift += shift[c] + total_change
+            midpoint = (prelim[kids[0]] + prelim[kids[-1]]) / 2
+            if left_sibling >= 0:
+                prelim[v] = prelim[left_sibling] + distance
+                mod[v] = prelim[v] - midpoint
+            else:
+                prelim[v] = midpoint
+        elif left_sibling >= 0:
+            prelim[v] = prelim[left_sibling] + distance
+        if parent[v] >= 0:
+            default_ancestor[parent[v]] = apportion(v, default_ancestor[parent[v]])
+
+    # 第二遍：前序累加祖先的mod得到最终位置
+    x = [0.0] * n
+    stack = [(root, 0.0)]
+    while stack:
+        v, m = stack.pop()
+        x[v] = prelim[v] + m
+        for c in children[v]:
+            stack.append((c, m + mod[v]))
+    return x
+
+
+def _subtree_digests(ids: List, children: List[List[int]], roots: List[int]) -> Dict:
+    """后序计算各节点子树的结构摘要：节点id + 各子节点子树摘要（按子节点顺序）"""
+    digests = [b''] * len(ids)
+    stack = [(r, False) for r in roots]
+    while stack:
+        v, expanded = stack.pop()
+        if not expanded:
+            stack.append((v, True))
+            stack.extend((c, False) for c in children[v])
+            continue
+        h = hashlib.blake2b(repr(ids[v]).encode('utf-8'), digest_size=16)
+        for c in children[v]:
+            h.update(digests[c])
+        digests[v] = h.digest()
+    return {ids[i]: digests[i] for i in range(len(ids))}
+
+
+def _compute(nodes: List[Node], edges: List[Edge], key: str, distance: float):
+    """整齐树布局（最小x为0），同时返回 (布局, 节点id列表, 父节点下标, 子节点下标列表)"""
+    ids = [node.id for node in nodes]
+    if not ids:
+        return TreeLayout({}, {}, key), ids, [], []
+    parent, children, roots = _build_forest(ids, edges)
+    subtree = _subtree_digests(ids, children, roots)
+    if len(roots) > 1:
+        # 森林：挂到虚拟根下一起布局，各棵树之间同样按轮廓紧凑排列
+        children.append(roots)
+        root = len(ids)
+    else:
+        root = roots[0]
+    xs = _walker(children, root, distance)
+
+    depth = {}
+    stack = [(r, 0) for r in roots]
+    while stack:
+        v, d = stack.pop()
+        depth[ids[v]] = d
+        for c in children[v]:
+            stack.append((c, d + 1))
+    min_x = min(xs[i] for i in range(len(ids)))
+    layout = TreeLayout({ids[i]: xs[i] - min_x for i in range(len(ids))}, depth, key, subtree)
+    return layout, ids, parent, children[:len(ids)]
+
+
+def _pin(layout: TreeLayout, ids: List, parent: List[int], children: List[List[int]],
+         anchor: TreeLayout, key: str, distance: float) -> TreeLayout:
+    """
+    把布局放到上一帧（anchor）的坐标系中
+
+    1. 整体平移，使两帧共有节点的位移中位数为0；
+    2. 固定节点：先尝试结构未变化（子树摘要和深度都相同）的极大子树，从大到小整体固定在上一帧的位置，
+       再逐个尝试其余（含未能整体固定的子树中）在上一帧中出现过、深度相同的节点；
+       只在同层相邻的两个固定节点之间仍能以 distance 间距放下它们之间的其余节点时固定；
+    3. 其余节点在所在层相邻固定节点之间的可行区间内尽量靠近平移后的整齐树位置。
+    同层顺序与整齐树布局相同、同层间距不小于 distance，因此结果仍是合法的树布局
+    """
+    n = len(ids)
+    depth = [layout.depth[node_id] for node_id in ids]
+    deltas = [anchor.x[node_id] - x for node_id, x in layout.x.items() if node_id in anchor.x]
+    offset = statistics.median(deltas) if deltas else 0.0
+    base = [layout.x[node_id] + offset for node_id in ids]
+
+    # 同层节点按整齐树布局中的顺序排列，任何子树在每一层都占连续的一段
+    rows: Dict[int, List[int]] = {}
+    for i in sorted(range(n), key=lambda i: base[i]):
+        rows.setdefault(depth[i], []).append(i)
+    rank = [0] * n
+    for row in rows.values():
+        for r, i in enumerate(row):
+            rank[i] = r
+
+    present = [ids[i] in anchor.x and anchor.depth.get(ids[i]) == depth[i] for i in range(n)]
+    unchanged = [present[i] and layout.subtree[ids[i]] == anchor.subtree.get(ids[i]) for i in range(n)]
+    candidates = []
+    for i in range(n):
+        if unchanged[i] and not (parent[i] >= 0 and unchanged[parent[i]]):
+            members = []
+            stack = [i]
+            while stack:
+                v = stack.pop()
+                members.append(v)
+                stack.extend(children[v])
+            candidates.append(members)
+    candidates.sort(key=len, reverse=True)
+    candidates.extend([i] for i in sorted(range(n), key=lambda i: base[i]) if present[i])
+
+    x = [None] * n
+    # 层 -> 已固定节点的排名（有序）
+    pinned_ranks: Dict[int, List[int]] = {d: [] for d in rows}
+
+    def fits(members: List[int]) -> bool:
+        span: Dict[int, List] = {}
+        for v in members:
+            if x[v] is not None:
+                return False
+            entry = span.get(depth[v])
+            if entry is None:
+                span[depth[v]] = [v, v]
+            else:
+                if rank[v] < rank[entry[0]]:
+                    entry[0] = v
+                if rank[v] > rank[entry[1]]:
+                    entry[1] = v
+        for d, (first, last) in span.items():
+            row, ranks = rows[d], pinned_ranks[d]
+            k = bisect.bisect_left(ranks, rank[first])
+            if k > 0:
+                left = row[ranks[k - 1]]
+                if anchor.x[ids[first]] - x[left] < (rank[first] - rank[left]) * distance - 1e-9:
+                    return False
+            if k < len(ranks):
+                right = row[ranks[k]]
+                if x[right] - anchor.x[ids[last]] < (rank[right] - rank[last]) * distance - 1e-9:
+                    return False
+        return True
+
+    for members in candidates:
+        if fits(members):
+            for v in members:
+                x[v] = anchor.x[ids[v]]
+                bisect.insort(pinned_ranks[depth[v]], rank[v])
+
+    for row in rows.values():
+        # 每个未固定节点的可行区间：[左侧固定节点 + 间隔数*distance, 右侧固定节点 - 间隔数*distance]
+        upper = [math.inf] * len(row)
+        bound, bound_rank = math.inf, len(row)
+        for r in range(len(row) - 1, -1, -1):
+            if x[row[r]] is not None:
+                bound, bound_rank = x[row[r]], r
+            else:
+                upper[r] = bound - (bound_rank - r) * distance
+        previous = -math.inf
+        for r, i in enumerate(row):
+            if x[i] is None:
+                x[i] = max(min(base[i], upper[r]), previous + distance)
+            previous = x[i]
+
+    return TreeLayout({ids[i]: x[i] for i in range(n)}, layout.depth, key, layout.subtree)
+
+
+def pack_layout(layout: TreeLayout) -> bytes:
+    """
+    紧凑序列化（用作下一帧的锚点）：节点id列表 + 定长数组，
+    比直接pickle三个字典小得多，传给渲染进程和在调用进程中保存时都按这个大小计
+    """
+    ids = list(layout.x)
+    return pickle.dumps((
+        ids,
+        array('d', layout.x.values()).tobytes(),
+        array('l', map(layout.depth.__getitem__, ids)).tobytes(),
+        b''.join(map(layout.subtree.__getitem__, ids)) if len(layout.subtree) == len(ids) else b'',
+        layout.structure_hash,
+        layout.signature
+    ), pickle.HIGHEST_PROTOCOL)
+
+
+def unpack_layout(data: bytes) -> TreeLayout:
+    """pack_layout 的逆操作"""
+    ids, xs, depths, digests, key, signature = pickle.loads(data)
+    xs, depths = array('d', xs), array('l', depths)
+    size = len(digests) // len(ids) if ids else 0
+    subtree = {node_id: digests[i * size:(i + 1) * size] for i, node_id in enumerate(ids)} if size else {}
+    layout = TreeLayout(dict(zip(ids, xs)), dict(zip(ids, depths)), key, subtree)
+    layout._signature = signature
+    return layout
+
+
+_layout_cache = OrderedDict()
+_layout_cache_lock = threading.Lock()
+
+
+@timed('tree_layout', 'layout')
+def tidy_layout(nodes: List[Node], edges: List[Edge], anchor: Optional[TreeLayout] = None,
+                distance: float = SIBLING_DISTANCE) -> TreeLayout:
+    """
+    计算（或从缓存取得）整齐树布局
+
+    Args:
+        nodes/edges: 树结构（tree_schema 的节点和边记录）
+        anchor: 上一帧实际绘制的布局；给出时结果位于其坐标系中，未变化的子树保持原位（见 _pin）
+        distance: 相邻节点的最小间距
+
+    Returns:
+        TreeLayout，调用方不应修改其中的字典；不给出anchor时最小x为0
+    """
+    key = f'{structure_hash(nodes, edges)}:{distance}'
+    cache_key = key if anchor is None else f'{key}:{anchor.signature}'
+    with _layout_cache_lock:
+        layout = _layout_cache.get(cache_key)
+        if layout is not None:
+            _layout_cache.move_to_end(cache_key)
+    cache_lookup('layout', layout is not None)
+    if layout is not None:
+        return layout
+
+    layout, ids, parent, children = _compute(nodes, edges, key, distance)
+    if anchor is not None:
+        layout = _pin(layout, ids, parent, children, anchor, key, distance)
+    with _layout_cache_lock:
+        _layout_cache[cache_key] = layout
+        while len(_layout_cache) > LAYOUT_CACHE_SIZE:
+            _layout_cache.popitem(last=False)
+    return layout
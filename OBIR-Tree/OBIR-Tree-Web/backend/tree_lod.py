@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+树的分层细节（LOD）渲染支持
+每个数据文件在内存中保留一份已解析、带子树规模和高度的索引（按文件指纹缓存），
+按需截取从某个节点开始的前N层：更深的子树折叠为一个占位节点（标注隐藏的节点数和深度），
+前端点击占位节点时再请求该节点的子树，开销只与可见部分的大小有关，与整个文件无关
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+from metrics import cache_lookup, phase_timer
+from render_cache import file_fingerprint
+from tree_diff import TreeIndex, load_tree_index
+from tree_schema import Edge, Node, NodeId, TreeDocument
+
+# 按文件缓存的树索引数量
+TREE_CACHE_SIZE = 8
+# 未指定层数时LOD模式渲染的层数
+DEFAULT_LEVELS = 6
+# 占位节点id前缀（与数据中的节点id区分）
+PLACEHOLDER_PREFIX = '__collapsed__:'
+
+
+class CollapsedNode(Node):
+    """折叠子树的占位节点（type为'collapsed'，label为'+隐藏节点数'）"""
+    collapsed_of: Optional[NodeId] = None
+    hidden_count: int = 0
+    hidden_depth: int = 0
+    # 子树中是否含有变化（实时差异图使用）
+    changed: bool = False
+
+
+class IndexedTree:
+    """在 TreeIndex 基础上补充各节点的深度、子树规模（含自身）和子树高度"""
+    __slots__ = ('index', 'children', 'depth', 'size', 'height', '_id_lookup')
+
+    def __init__(self, index: TreeIndex):
+        self.index = index
+        # TreeIndex 把环上的一个节点作为额外的根但保留了指向它的边，遍历时去掉这些边
+        cycle_roots = {root_id for root_id in index.roots if root_id in index.parent}
+        if cycle_roots:
+            self.children = {node_id: [c for c in children if c not in cycle_roots]
+                             for node_id, children in index.children.items()}
+        else:
+            self.children = index.children
+        self.depth = {}
+        self.size = {}
+        self.height = {}
+        self._id_lookup = None
+        order = []
+        stack = [(root_id, 0) for root_id in index.roots]
+        while stack:
+            node_id, d = stack.pop()
+            self.depth[node_id] = d
+            order.append(node_id)
+            for child_id in self.children[node_id]:
+                stack.append((child_id, d + 1))
+        # 先序的逆序保证子节点先于父节点处理
+        for node_id in reversed(order):
+            size = 1
+            height = 0
+            for child_id in self.children[node_id]:
+                size += self.size[child_id]
+                height = max(height, self.height[child_id] + 1)
+            self.size[node_id] = size
+            self.height[node_id] = height
+
+    def resolve(self, node_id) -> object:
+        """按id查找节点；前端传回的id都是字符串，数据中的数字id按字符串形式匹配"""
+        if node_id in self.index.nodes:
+            return node_id
+        if self._id_lookup is None:
+            self._id_lookup = {str(k): k for k in self.index.nodes}
+        key = str(node_id)
+        if key.startswith(PLACEHOLDER_PREFIX):
+            key = key[len(PLACEHOLDER_PREFIX):]
+        if key not in self._id_lookup:
+            raise KeyError(f'节点不存在: {node_id}')
+        return self._id_lookup[key]
+
+    def truncate(self, root_id=None, levels: int = DEFAULT_LEVELS) -> TreeDocument:
+        """
+        截取前levels层
+
+        从root_id（默认为全部根）开始；第levels层仍有子节点的节点下挂一个 CollapsedNode 占位节点
+        """
+        levels = max(int(levels), 1)
+        index = self.index
+        roots = [self.resolve(root_id)] if root_id is not None else list(index.roots)
+        nodes = []
+        edges = []
+        stack = [(r, 0) for r in reversed(roots)]
+        while stack:
+            node_id, d = stack.pop()
+            nodes.append(index.nodes[node_id])
+            children = self.children[node_id]
+            if not children:
+                continue
+            if d + 1 < levels:
+                for child_id in children:
+                    edges.append(Edge(node_id, child_id))
+                for child_id in reversed(children):
+                    stack.append((child_id, d + 1))
+                continue
+            placeholder_id = f'{PLACEHOLDER_PREFIX}{node_id}'
+            hidden = self.size[node_id] - 1
+            nodes.append(CollapsedNode(
+                id=placeholder_id,
+                type='collapsed',
+                label=f'+{hidden}',
+                collapsed_of=node_id,
+                hidden_count=hidden,
+                hidden_depth=self.height[node_id]
+            ))
+            edges.append(Edge(node_id, placeholder_id))
+        return TreeDocument(nodes=nodes, edges=edges)
+
+
+def changed_ancestors(index: TreeIndex, node_ids: Iterable) -> Set:
+    """给定节点的全部祖先（用于标出折叠子树中含有变化的占位节点），每个祖先只访问一次"""
+    marked = set()
+    for node_id in node_ids:
+        parent_id = index.parent.get(node_id)
+        while parent_id is not None and parent_id not in marked:
+            marked.add(parent_id)
+            parent_id = index.parent.get(parent_id)
+    return marked
+
+
+_tree_cache = OrderedDict()
+_tree_cache_lock = threading.Lock()
+
+
+def get_indexed_tree(data_file: str) -> IndexedTree:
+    """
+    取得数据文件的树索引
+
+    按文件指纹（stat）缓存，文件未变化时不读取文件；变化后经 tree_diff.load_tree_index 重新加载，
+    内容相同的快照（如轮换后的previous）共享同一个 TreeIndex
+    """
+    fingerprint = file_fingerprint(data_file)
+    with _tree_cache_lock:
+        entry = _tree_cache.get(data_file)
+        hit = entry is not None and entry[0] == fingerprint
+        if hit:
+            _tree_cache.move_to_end(data_file)
+    cache_lookup('indexed_tree', hit)
+    if hit:
+        return entry[1]
+
+    index = load_tree_index(data_file)
+    with phase_timer('tree_lod', 'index'):
+        tree = IndexedTree(index)
+    with _tree_cache_lock:
+        _tree_cache[data_file] = (fingerprint, tree)
+        _tree_cache.move_to_end(data_file)
+        while len(_tree_cache) > TREE_CACHE_SIZE:
+            _tree_cache.popitem(last=False)
+    return tree
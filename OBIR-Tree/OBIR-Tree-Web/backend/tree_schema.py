@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据文件的类型化模式
+按 README_INTERFACE_INFORMATION.md 约定的格式，把C++生成的树结构、映射、标注和逻辑路径文件
+直接解码为定长记录（msgspec.Struct，基于__slots__，节点和边不受GC跟踪），
+不经过中间的dict；字段类型在解码时一并校验，出错时报告具体位置（如 `$.nodes[12].id`）。
+约定之外的字段在解码时忽略
+"""
+
+from typing import Any, Dict, List, Optional, Union
+import msgspec
+
+# 节点id：字符串或整数
+NodeId = Union[str, int]
+# 用于显示的文本字段，C++端可能直接写入数字
+Text = Union[str, int, float]
+
+
+class SchemaError(ValueError):
+    """数据文件不是合法JSON，或字段缺失、类型不符"""
+
+
+class Node(msgspec.Struct, gc=False, omit_defaults=True):
+    """树节点；前两个字段 id、level 属于结构信息，其余字段为节点内容"""
+    id: NodeId
+    level: Optional[int] = None
+    label: Optional[Text] = None
+    value: Optional[Text] = None
+    name: Optional[Text] = None
+    type: Optional[str] = None
+    status: Optional[str] = None
+
+
+class Edge(msgspec.Struct, gc=False, rename={'source': 'from', 'target': 'to'}):
+    """父节点 -> 子节点的边，文件中为 {"from", "to"}"""
+    source: NodeId
+    target: NodeId
+
+
+class TreeDocument(msgspec.Struct, omit_defaults=True):
+    """IR-Tree结构、逻辑路径和OBIR-Tree快照文件共用的格式"""
+    nodes: List[Node] = []
+    edges: List[Edge] = []
+    metadata: Dict[str, Any] = {}
+    # 仅逻辑路径文件
+    logic_path: List[NodeId] = []
+    query_info: Dict[str, Any] = {}
+
+
+class Mapping(msgspec.Struct, gc=False, omit_defaults=True):
+    """IR节点到OBIR节点的映射"""
+    ir_id: NodeId
+    obir_id: NodeId
+    label: Optional[Text] = None
+
+
+class MappingDocument(msgspec.Struct):
+    """IR-OBIR映射文件"""
+    ir_nodes: List[Node] = []
+    obir_nodes: List[Node] = []
+    mappings: List[Mapping] = []
+
+
+class Annotation(msgspec.Struct, omit_defaults=True):
+    """节点或映射的标注"""
+    id: NodeId
+    type: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    details: Dict[str, Any] = {}
+
+
+class AnnotationDocument(msgspec.Struct):
+    """IR-OBIR标注文件"""
+    annotations: List[Annotation] = []
+
+
+_tree_decoder = msgspec.json.Decoder(TreeDocument)
+_mapping_decoder = msgspec.json.Decoder(MappingDocument)
+_annotation_decoder = msgspec.json.Decoder(AnnotationDocument)
+
+
+def _decode(decoder: msgspec.json.Decoder, raw: bytes, source: str):
+    try:
+        return decoder.decode(raw)
+    except msgspec.ValidationError as e:
+        raise SchemaError(f"数据文件 {source} 字段校验失败: {e}") from None
+    except msgspec.DecodeError as e:
+        raise SchemaError(f"数据文件 {source} 格式错误: {e}") from None
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def decode_tree(raw: bytes, source: str = '<bytes>') -> TreeDocument:
+    """解码树结构数据（source 仅用于错误信息）"""
+    return _decode(_tree_decoder, raw, source)
+
+
+def load_tree(path: str) -> TreeDocument:
+    """读取IR-Tree结构、逻辑路径或OBIR-Tree快照文件"""
+    return decode_tree(_read(path), path)
+
+
+def load_mapping(path: str) -> MappingDocument:
+    """读取IR-OBIR映射文件"""
+    return _decode(_mapping_decoder, _read(path), path)
+
+
+def load_annotations(path: str) -> AnnotationDocument:
+    """读取IR-OBIR标注文件"""
+    return _decode(_annotation_decoder, _read(path), path)
+
+
+def to_builtins(obj: Any) -> Any:
+    """把记录转换回dict/list（用于JSON响应），未出现的可选字段不输出"""
+    return msgspec.to_builtins(obj)
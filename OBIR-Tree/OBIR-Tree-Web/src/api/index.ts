@@ -1,6 +1,10 @@
 // API 统一导出文件
 export { 
   twoRoundSearch, 
+  batchSearch,
+  analyzePaths,
+  similarKeywords,
+  lookupRecords,
   getInitInfo,
   getOramInfo,
   type SearchParams,
@@ -9,7 +13,12 @@ export {
   type TwoRoundSearchResult,
   type PathComparison,
   type InitInfo,
-  type OramInfo
+  type OramInfo,
+  type BatchQuery,
+  type PathAnalytics,
+  type LevelDistribution,
+  type SimilarTerm,
+  type RecordDetail
 } from './search';
 
 // 为了兼容现有代码，保留searchAPI对象
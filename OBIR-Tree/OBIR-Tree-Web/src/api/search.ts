@@ -124,7 +124,7 @@ export async function twoRoundSearch(params: SearchParams): Promise<TwoRoundSear
     // 第二轮查询：批量处理，减少请求次数
     console.log('开始执行第二轮查询...');
     const secondRoundResults: NearestResult[] = [];
-    const pathComparisons: PathComparison[] = [];
+    const pairedFirstResults: NearestResult[] = [];
 
     // 优化：并行执行第二轮查询，而不是串行
     const secondRoundPromises = firstRoundResults.map(async (firstResult, index) => {
@@ -143,44 +143,16 @@ export async function twoRoundSearch(params: SearchParams): Promise<TwoRoundSear
 
         const backendSecondResult = secondRoundResponse.data.results?.[0];
         if (backendSecondResult) {
-          const secondResult = transformResult(backendSecondResult);
-
-          // 路径对比
-          const firstPath = firstResult.orampath || [];
-          const secondPath = secondResult.orampath || [];
-          
-          const differences: number[] = [];
-          const maxLength = Math.max(firstPath.length, secondPath.length);
-          
-          for (let j = 0; j < maxLength; j++) {
-            if (firstPath[j] !== secondPath[j]) {
-              differences.push(j);
-            }
-          }
-
-          return {
-            secondResult,
-            pathComparison: {
-              firstRoundPath: firstPath,
-              secondRoundPath: secondPath,
-              differences,
-              isIdentical: differences.length === 0 && firstPath.length === secondPath.length
-            }
-          };
+          return { firstResult, secondResult: transformResult(backendSecondResult) };
         }
       } catch (error) {
         console.error(`第二轮查询第${index + 1}个结果时出错:`, error);
         // 即使单个查询失败，也继续处理其他结果
         return {
+          firstResult,
           secondResult: {
             ...firstResult,
             orampath: [] // 失败时使用空路径
-          },
-          pathComparison: {
-            firstRoundPath: firstResult.orampath || [],
-            secondRoundPath: [],
-            differences: [],
-            isIdentical: false
           }
         };
       }
@@ -192,18 +164,28 @@ export async function twoRoundSearch(params: SearchParams): Promise<TwoRoundSear
     // 整理结果
     secondRoundResultsData.forEach(data => {
       if (data) {
+        pairedFirstResults.push(data.firstResult);
         secondRoundResults.push(data.secondResult);
-        pathComparisons.push(data.pathComparison);
       }
     });
 
     const endTime = Date.now();
     console.log(`第二轮查询耗时: ${endTime - firstRoundTime}ms`);
-    console.log(`总查询耗时: ${endTime - startTime}ms`);
+
+    // 路径对比由后端批量计算
+    const firstPaths = pairedFirstResults.map(r => r.orampath || []);
+    const secondPaths = secondRoundResults.map(r => r.orampath || []);
+    const analytics = await analyzePaths(firstPaths, secondPaths);
+    const pathComparisons: PathComparison[] = firstPaths.map((firstPath, index) => ({
+      firstRoundPath: firstPath,
+      secondRoundPath: secondPaths[index],
+      differences: analytics.comparisons?.differences[index] ?? [],
+      isIdentical: analytics.comparisons?.identical[index] ?? false
+    }));
+    console.log(`总查询耗时: ${Date.now() - startTime}ms`);
 
     // 统计信息
-    const identicalPaths = pathComparisons.filter(comp => comp.isIdentical).length;
-    const differentPaths = pathComparisons.length - identicalPaths;
+    const { identicalPaths, differentPaths } = analytics.summary;
 
     const result = {
       firstRoundResults,
@@ -225,6 +207,155 @@ export async function twoRoundSearch(params: SearchParams): Promise<TwoRoundSear
   }
 }
 
+// 批量查询接口（Flask后端 /api/query-results/batch）
+export interface BatchQuery {
+  keyword: string;
+  x: number;
+  y: number;
+  k: number;
+}
+
+export interface BatchSearchResponse {
+  success: boolean;
+  results: NearestResult[][];
+  total: number;
+  error?: string;
+}
+
+/**
+ * 一次请求执行多条Top-K查询，结果与输入顺序一一对应
+ * @param queries 查询列表
+ * @param fuzzy 近似匹配的最大编辑距离，0为精确匹配
+ * @returns 每条查询的结果列表
+ */
+export async function batchSearch(queries: BatchQuery[], fuzzy = 0): Promise<NearestResult[][]> {
+  const response = await fetch('/api/query-results/batch', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ queries, fuzzy })
+  });
+  const data: BatchSearchResponse = await response.json();
+  if (!data.success) {
+    throw new Error(data.error || '批量查询失败');
+  }
+  return data.results.map(results => results.map(transformResult));
+}
+
+// 按id读取记录接口（Flask后端 /api/records/lookup）
+export interface RecordDetail {
+  rect_id: number;
+  keyword: string;
+  center_x: number;
+  center_y: number;
+}
+
+/**
+ * 按rect_id批量读取完整记录，如Top-K结果的详情
+ * @param ids 记录id列表
+ * @returns 与输入顺序对应的记录，不存在的id为null
+ */
+export async function lookupRecords(ids: number[]): Promise<(RecordDetail | null)[]> {
+  const response = await fetch('/api/records/lookup', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ ids })
+  });
+  const data = await response.json();
+  if (!data.success) {
+    throw new Error(data.error || '读取记录失败');
+  }
+  return data.records;
+}
+
+// 关键词近似匹配接口（Flask后端 /api/keywords/similar）
+export interface SimilarTerm {
+  term: string;
+  distance: number;
+}
+
+/**
+ * 查找词表中与给定关键词编辑距离不超过distance的关键词
+ * @param term 关键词
+ * @param distance 最大编辑距离（1-3）
+ * @param limit 最多返回的个数
+ * @returns 按距离升序的关键词列表
+ */
+export async function similarKeywords(term: string, distance = 1, limit = 100): Promise<SimilarTerm[]> {
+  const params = new URLSearchParams({ term, distance: String(distance), limit: String(limit) });
+  const response = await fetch(`/api/keywords/similar?${params}`);
+  const data = await response.json();
+  if (!data.success) {
+    throw new Error(data.error || '关键词近似匹配失败');
+  }
+  return data.terms;
+}
+
+// 路径对比统计接口（Flask后端 /api/path-analytics）
+export interface LevelDistribution {
+  level: number;
+  accesses: number;
+  distinct: number;
+  maxCount: number;
+  minCount: number;
+  entropy: number;
+  normalizedEntropy: number;
+  buckets?: number[];
+  counts?: number[];
+}
+
+export interface PathLengthSummary {
+  min: number;
+  max: number;
+  mean: number;
+}
+
+export interface PathAnalytics {
+  success: boolean;
+  summary: {
+    totalQueries: number;
+    identicalPaths: number;
+    differentPaths: number;
+  };
+  pathLengths: { firstRound: PathLengthSummary; secondRound?: PathLengthSummary };
+  levels: { firstRound: LevelDistribution[]; secondRound?: LevelDistribution[] };
+  positionDifferences?: number[];
+  differenceHistogram?: number[];
+  comparisons?: {
+    identical: boolean[];
+    differences: number[][];
+  };
+  error?: string;
+}
+
+export interface PathAnalyticsOptions {
+  includeComparisons?: boolean;
+  histograms?: boolean;
+}
+
+/**
+ * 批量对比两轮查询的ORAM路径，并统计各层的访问分布
+ * @param firstRound 第一轮的路径列表
+ * @param secondRound 第二轮的路径列表，与第一轮按下标对应；为空时只统计第一轮
+ * @param options includeComparisons 是否返回每条查询的差异位置，histograms 是否返回每层的桶访问次数
+ * @returns 对比结果和统计
+ */
+export async function analyzePaths(
+  firstRound: number[][],
+  secondRound: number[][] = [],
+  options: PathAnalyticsOptions = {}
+): Promise<PathAnalytics> {
+  const response = await fetch('/api/path-analytics', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ firstRound, secondRound, ...options })
+  });
+  const data: PathAnalytics = await response.json();
+  if (!data.success) {
+    throw new Error(data.error || '路径对比失败');
+  }
+  return data;
+}
+
 /**
  * 获取初始化信息
  * @returns 初始化信息
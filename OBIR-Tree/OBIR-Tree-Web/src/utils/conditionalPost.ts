@@ -0,0 +1,53 @@
+// SVG接口的条件请求：记住每个请求最近一次成功的结果及其ETag，
+// 再次请求时带上 If-None-Match，数据未变化时后端返回空的304，直接复用上次的结果。
+// 每个接口只保留最近使用的 MAX_ENTRIES_PER_URL 个请求体的结果（LRU），
+// 展开子树、切换快照等参数不断变化时缓存不会无限增长
+
+interface CachedResult {
+  etag: string;
+  result: any;
+}
+
+const MAX_ENTRIES_PER_URL = 4;
+
+// url -> (请求体 -> 结果)，Map 按插入顺序迭代，最久未使用的在最前
+const cache = new Map<string, Map<string, CachedResult>>();
+
+const remember = (url: string, payload: string, entry: CachedResult) => {
+  let entries = cache.get(url);
+  if (!entries) {
+    entries = new Map();
+    cache.set(url, entries);
+  }
+  entries.delete(payload);
+  entries.set(payload, entry);
+  while (entries.size > MAX_ENTRIES_PER_URL) {
+    entries.delete(entries.keys().next().value as string);
+  }
+};
+
+export const postWithETag = async (url: string, body: unknown): Promise<any> => {
+  const payload = JSON.stringify(body);
+  const cached = cache.get(url)?.get(payload);
+
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+  if (cached) {
+    headers['If-None-Match'] = cached.etag;
+  }
+  const response = await fetch(url, { method: 'POST', headers, body: payload });
+
+  if (response.status === 304 && cached) {
+    remember(url, payload, cached);
+    return cached.result;
+  }
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const result = await response.json();
+  const etag = response.headers.get('ETag');
+  if (etag && result.success) {
+    remember(url, payload, { etag, result });
+  }
+  return result;
+};